@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'transactions.audit.AuditLogMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -204,6 +205,10 @@ EMAIL_TEMPLATES = {
         'subject': 'ERP System - Inventory Alert',
         'template': 'emails/inventory_alert.html',
     },
+    'INVENTORY_DIGEST': {
+        'subject': 'ERP System - Low Stock Digest',
+        'template': 'emails/inventory_digest.html',
+    },
 }
 
 # Notification Settings
@@ -214,3 +219,9 @@ NOTIFICATION_SETTINGS = {
     'EMAIL_RETRY_ATTEMPTS': 3,
     'EMAIL_RETRY_DELAY': 60,  # seconds
 }
+
+# Inventory costing method used for cost layers: 'fifo' or 'weighted_average'
+INVENTORY_COSTING_METHOD = os.environ.get('INVENTORY_COSTING_METHOD', 'fifo')
+
+# Published PowerBI report shown on the BI dashboard; its data comes from /api/reporting/bi/export/
+POWERBI_EMBED_URL = os.environ.get('POWERBI_EMBED_URL', '')
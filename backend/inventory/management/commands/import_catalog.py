@@ -0,0 +1,48 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from inventory.services import CatalogImportService
+
+class Command(BaseCommand):
+    help = 'Bulk import/upsert products, categories and prices from a CSV, JSON Lines or JSON file (keyed by SKU).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the catalog file')
+        parser.add_argument(
+            '--format',
+            choices=CatalogImportService.FORMATS,
+            help='File format (default: detected from the file extension)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows written per bulk transaction')
+        parser.add_argument(
+            '--skip-invalid',
+            action='store_true',
+            help='Import valid rows even if some rows fail validation',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Validate only, do not write anything')
+
+    def handle(self, *args, **options):
+        service = CatalogImportService(chunk_size=options['chunk_size'], skip_invalid=options['skip_invalid'])
+        fmt = options['format'] or service.detect_format(options['path'])
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                report = service.import_file(stream, fmt=fmt, dry_run=options['dry_run'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"Row {error['row']} ({error['sku'] or 'no SKU'}): {'; '.join(error['errors'])}"
+            ))
+        if report['error_count'] > len(report['errors']):
+            self.stdout.write(self.style.WARNING(
+                f"... {report['error_count'] - len(report['errors'])} more invalid rows not shown"
+            ))
+
+        summary = {key: value for key, value in report.items() if key != 'errors'}
+        if report['imported']:
+            self.stdout.write(self.style.SUCCESS(json.dumps(summary)))
+        elif options['dry_run']:
+            self.stdout.write(json.dumps(summary))
+        else:
+            raise CommandError(f"Validation failed for {report['error_count']} row(s); nothing was imported")
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    # Trigram indexes only exist on PostgreSQL; other backends use the
+    # in-process index in ProductSearchService
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Django's icontains/istartswith compare UPPER(column::text), so index that exact expression
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS inventory_product_name_trgm '
+        'ON inventory_product USING gin (UPPER(name::text) gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS inventory_product_sku_trgm '
+        'ON inventory_product USING gin (UPPER(sku::text) gin_trgm_ops)'
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS inventory_product_name_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS inventory_product_sku_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_add_product_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:19
+
+from django.db import migrations, models
+
+
+def create_product_search_version(apps, schema_editor):
+    SearchIndexVersion = apps.get_model('inventory', 'SearchIndexVersion')
+    SearchIndexVersion.objects.get_or_create(name='product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_product_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_product_search_version, migrations.RunPython.noop),
+    ]
@@ -17,6 +17,18 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Keyset order of the incremental BI export
+        indexes = [models.Index(fields=['updated_at', 'id'])]
+
+class SearchIndexVersion(models.Model):
+    """Version of an in-process search index; bumping it makes every process rebuild its copy"""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
 class ProductPrice(models.Model):
     CURRENCY_CHOICES = [
         ('SLL', 'Sierra Leonean Leone'),
@@ -0,0 +1,536 @@
+import csv
+import heapq
+import io
+import json
+import logging
+import threading
+from bisect import bisect_left
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from reporting.services import dashboard_service
+from .models import Category, Product, ProductPrice, SearchIndexVersion
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogImportService:
+    """
+    Streaming upsert of Product, Category and ProductPrice rows keyed by SKU.
+
+    Input is CSV (one row per product, prices in ``price_<CURRENCY>`` columns),
+    JSON Lines (one object per line, prices under ``prices``) or a JSON array
+    (decoded one element at a time, never loaded whole).
+    The file is read twice: a validation pass that never writes, then an
+    import pass that processes ``chunk_size`` rows at a time with bulk
+    queries so memory stays bounded regardless of catalog size.
+    """
+
+    FORMATS = ['csv', 'jsonl', 'json']
+    CURRENCIES = {code for code, _ in ProductPrice.CURRENCY_CHOICES}
+    MAX_REPORTED_ERRORS = 1000
+
+    def __init__(self, chunk_size=2000, skip_invalid=False):
+        self.chunk_size = chunk_size
+        self.skip_invalid = skip_invalid
+        self._categories = None
+
+    @staticmethod
+    def detect_format(filename):
+        name = (filename or '').lower()
+        if name.endswith('.jsonl') or name.endswith('.ndjson'):
+            return 'jsonl'
+        if name.endswith('.json'):
+            return 'json'
+        return 'csv'
+
+    def import_file(self, stream, fmt='csv', dry_run=False):
+        """
+        Validate and import a text stream. The stream must be seekable.
+
+        Returns a report dict with created/updated counts and per-row errors.
+        Nothing is written when validation fails (unless ``skip_invalid``) or
+        when ``dry_run`` is set.
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(self.FORMATS)}")
+
+        report = {
+            'rows': 0,
+            'valid_rows': 0,
+            'created': 0,
+            'updated': 0,
+            'prices_written': 0,
+            'categories_created': 0,
+            'error_count': 0,
+            'errors': [],
+            'imported': False,
+        }
+
+        invalid_rows = self.validate(stream, fmt, report)
+        if dry_run or (report['error_count'] and not self.skip_invalid):
+            return report
+
+        stream.seek(0)
+        chunk = []
+        for row_number, raw in self._iter_rows(stream, fmt):
+            if row_number in invalid_rows:
+                continue
+            chunk.append(self._parse_row(raw)[0])
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk, report)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk, report)
+
+        report['imported'] = True
+        return report
+
+    def validate(self, stream, fmt, report):
+        """First pass: parse every row, record errors, return invalid row numbers"""
+        invalid_rows = set()
+        seen_skus = set()
+        missing_required = []
+
+        for row_number, raw in self._iter_rows(stream, fmt):
+            report['rows'] += 1
+            parsed, errors = self._parse_row(raw)
+            sku = parsed.get('sku')
+            if sku:
+                if sku in seen_skus:
+                    errors.append(f"Duplicate SKU '{sku}' in file")
+                seen_skus.add(sku)
+            if errors:
+                self._add_error(report, invalid_rows, row_number, sku, errors)
+            elif not parsed['values'].get('name') or not parsed['category']:
+                missing_required.append((row_number, sku, bool(parsed['values'].get('name')), bool(parsed['category'])))
+            else:
+                report['valid_rows'] += 1
+
+        # Name and category may only be omitted when updating an existing SKU
+        for start in range(0, len(missing_required), self.chunk_size):
+            batch = missing_required[start:start + self.chunk_size]
+            existing = set(
+                Product.objects.filter(sku__in=[row[1] for row in batch]).values_list('sku', flat=True)
+            )
+            for row_number, sku, has_name, has_category in batch:
+                if sku in existing:
+                    report['valid_rows'] += 1
+                    continue
+                errors = []
+                if not has_name:
+                    errors.append('name is required for new products')
+                if not has_category:
+                    errors.append('category is required for new products')
+                self._add_error(report, invalid_rows, row_number, sku, errors)
+
+        return invalid_rows
+
+    def _add_error(self, report, invalid_rows, row_number, sku, errors):
+        invalid_rows.add(row_number)
+        report['error_count'] += 1
+        if len(report['errors']) < self.MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': row_number, 'sku': sku, 'errors': errors})
+
+    def _iter_rows(self, stream, fmt):
+        """Yield (row_number, dict) pairs; row numbers match the source file"""
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            for row_number, row in enumerate(reader, start=2):
+                yield row_number, row
+        elif fmt == 'jsonl':
+            for row_number, line in enumerate(stream, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield row_number, json.loads(line)
+                except ValueError as e:
+                    yield row_number, {'__error__': f'Invalid JSON: {e}'}
+        else:
+            yield from self._iter_json_array(stream)
+
+    def _iter_json_array(self, stream, read_size=65536):
+        """Decode a top-level JSON array one element at a time, holding one element in memory"""
+        decoder = json.JSONDecoder()
+        buffer, position, eof = '', 0, False
+        row_number = 0
+        # What the grammar allows next: 'open' ([), 'first' (value or ]),
+        # 'value' (after a comma), 'separator' (, or ]) and 'end' (nothing)
+        state = 'open'
+        while True:
+            # Skip whitespace, reading more input as needed
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n':
+                    position += 1
+                if position < len(buffer) or eof:
+                    break
+                buffer, position = stream.read(read_size), 0
+                eof = not buffer
+            char = buffer[position:position + 1]
+
+            if state == 'open':
+                if char != '[':
+                    yield 1, {'__error__': 'Invalid JSON: expected an array of objects'}
+                    return
+                state = 'first'
+                position += 1
+                continue
+            if state == 'end':
+                if char:
+                    yield row_number + 1, {'__error__': 'Invalid JSON: unexpected data after the array'}
+                return
+            if not char:
+                yield row_number + 1, {'__error__': 'Invalid JSON: unterminated array'}
+                return
+            if char == ']' and state != 'value':
+                state = 'end'
+                position += 1
+                continue
+            if state == 'separator':
+                if char != ',':
+                    yield row_number + 1, {'__error__': f"Invalid JSON: expected ',' or ']' after element {row_number}"}
+                    return
+                state = 'value'
+                position += 1
+                continue
+            if char in ',]':
+                yield row_number + 1, {'__error__': f"Invalid JSON: unexpected '{char}' where an element was expected"}
+                return
+
+            row_number += 1
+            while True:
+                try:
+                    row, end = decoder.raw_decode(buffer, position)
+                except ValueError as e:
+                    if eof:
+                        yield row_number, {'__error__': f'Invalid JSON: {e}'}
+                        return
+                    row, end = None, None
+                # A value ending at the buffer edge may be cut short (e.g. a number); read on to be sure
+                if end is not None and (end < len(buffer) or eof):
+                    break
+                chunk = stream.read(read_size)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+            yield row_number, row
+            buffer, position = buffer[end:], 0
+            state = 'separator'
+
+    def _parse_row(self, raw):
+        """Normalize one raw row into {'sku', 'category', 'values', 'prices'} plus errors"""
+        errors = []
+        parsed = {'sku': None, 'category': None, 'values': {}, 'prices': {}}
+
+        if not isinstance(raw, dict):
+            return parsed, ['Row must be an object']
+        if '__error__' in raw:
+            return parsed, [raw['__error__']]
+
+        def text(key):
+            value = raw.get(key)
+            return value.strip() if isinstance(value, str) else value
+
+        sku = text('sku')
+        if not sku:
+            errors.append('sku is required')
+        elif len(str(sku)) > 50:
+            errors.append('sku must be at most 50 characters')
+        parsed['sku'] = str(sku) if sku else None
+
+        category = text('category')
+        if category:
+            parsed['category'] = str(category)[:100]
+
+        values = parsed['values']
+        for key in ('name', 'description', 'unit'):
+            value = text(key)
+            if value not in (None, ''):
+                values[key] = str(value)
+        if len(values.get('name', '')) > 100:
+            errors.append('name must be at most 100 characters')
+        if len(values.get('unit', '')) > 50:
+            errors.append('unit must be at most 50 characters')
+
+        cost = text('cost')
+        if cost not in (None, ''):
+            amount = self._to_decimal(cost)
+            if amount is None or amount < 0:
+                errors.append(f"cost '{cost}' is not a valid amount")
+            else:
+                values['cost'] = amount
+
+        for key in ('quantity', 'min_stock', 'max_stock'):
+            value = text(key)
+            if value in (None, ''):
+                continue
+            try:
+                values[key] = int(value)
+            except (TypeError, ValueError):
+                errors.append(f"{key} '{value}' is not a whole number")
+
+        prices = raw.get('prices') if isinstance(raw.get('prices'), dict) else {
+            key[len('price_'):]: value for key, value in raw.items()
+            if isinstance(key, str) and key.startswith('price_')
+        }
+        for currency, value in prices.items():
+            if value in (None, ''):
+                continue
+            currency = str(currency).upper()
+            amount = self._to_decimal(value)
+            if currency not in self.CURRENCIES:
+                errors.append(f"Unknown currency '{currency}'")
+            elif amount is None or amount < 0:
+                errors.append(f"price for {currency} '{value}' is not a valid amount")
+            else:
+                parsed['prices'][currency] = amount
+
+        return parsed, errors
+
+    @staticmethod
+    def _to_decimal(value):
+        try:
+            amount = Decimal(str(value)).quantize(Decimal('0.01'))
+        except (InvalidOperation, ValueError):
+            return None
+        if not amount.is_finite():
+            return None
+        # DecimalField(max_digits=10, decimal_places=2)
+        return amount if amount.adjusted() < 8 else None
+
+    def _category_ids(self, names):
+        """Resolve category names to ids, creating missing ones in bulk"""
+        if self._categories is None:
+            self._categories = {}
+            for category_id, name in Category.objects.order_by('-id').values_list('id', 'name'):
+                self._categories[name] = category_id
+        missing = [name for name in names if name not in self._categories]
+        if missing:
+            created = Category.objects.bulk_create([Category(name=name) for name in missing])
+            for category in created:
+                self._categories[category.name] = category.id
+        return len(missing)
+
+    def _import_chunk(self, chunk, report):
+        with transaction.atomic():
+            category_names = {row['category'] for row in chunk if row['category']}
+            report['categories_created'] += self._category_ids(sorted(category_names))
+
+            skus = [row['sku'] for row in chunk]
+            existing = Product.objects.in_bulk(skus, field_name='sku')
+            products, update_fields = [], {'updated_at'}
+
+            for row in chunk:
+                product = existing.get(row['sku'])
+                if product is None:
+                    product = Product(sku=row['sku'])
+                else:
+                    # Re-inserted through the upsert below: drop the pk but keep
+                    # current values for columns this row does not provide
+                    product.pk = None
+                    update_fields.update(row['values'])
+                    if row['category']:
+                        update_fields.add('category')
+                for field, value in row['values'].items():
+                    setattr(product, field, value)
+                if row['category']:
+                    product.category_id = self._categories[row['category']]
+                products.append(product)
+
+            # One INSERT ... ON CONFLICT (sku) DO UPDATE per batch instead of
+            # per-row UPDATEs (bulk_update's CASE WHEN grows with the batch)
+            Product.objects.bulk_create(
+                products,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=sorted(update_fields),
+            )
+            product_ids = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'id'))
+
+            prices = [
+                ProductPrice(product_id=product_ids[row['sku']], currency=currency, price=price)
+                for row in chunk
+                for currency, price in row['prices'].items()
+            ]
+            if prices:
+                ProductPrice.objects.bulk_create(
+                    prices,
+                    batch_size=1000,
+                    update_conflicts=True,
+                    unique_fields=['product', 'currency'],
+                    update_fields=['price'],
+                )
+
+        # bulk_create skips the post_save handler that keeps the dashboard's product count
+        dashboard_service.adjust(product_count=len(chunk) - len(existing))
+        report['created'] += len(chunk) - len(existing)
+        report['updated'] += len(existing)
+        report['prices_written'] += len(prices)
+        # bulk_create skips post_save, so tell the search index directly
+        ProductSearchService.invalidate()
+
+    def import_upload(self, uploaded_file, fmt=None, dry_run=False):
+        """Import a Django UploadedFile (multipart upload)"""
+        fmt = fmt or self.detect_format(uploaded_file.name)
+        stream = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig')
+        try:
+            return self.import_file(stream, fmt=fmt, dry_run=dry_run)
+        finally:
+            stream.detach()
+
+
+class ProductSearchService:
+    """
+    Ranked name/SKU lookup for POS, order entry and transfer forms.
+
+    Ranking: exact SKU, SKU prefix, name prefix, name substring, SKU
+    substring; ties are broken by name. On PostgreSQL the query runs against
+    the pg_trgm GIN indexes created in inventory migration 0003. Other
+    backends (SQLite in development) have no index that can serve a
+    substring LIKE, so an in-process index is built instead: sorted key
+    lists answer prefix queries by bisection and a single joined string
+    answers substring queries with str.find. The index is rebuilt lazily
+    when the SearchIndexVersion row bumped by invalidate() changes; the row
+    is in the database so every process (workers, import_catalog) sees the
+    bump, and it is only bumped when a name, SKU or category changes.
+    """
+
+    MAX_LIMIT = 50
+    INDEX_NAME = 'product_search'
+    RESULT_FIELDS = ['id', 'sku', 'name', 'unit', 'cost', 'quantity', 'category_id', 'category__name']
+
+    _lock = threading.Lock()
+    _index = None
+
+    @classmethod
+    def invalidate(cls):
+        versions = SearchIndexVersion.objects.filter(name=cls.INDEX_NAME)
+        if not versions.update(version=F('version') + 1):
+            # The row is created by inventory migration 0005; recreate it if it was removed
+            SearchIndexVersion.objects.get_or_create(name=cls.INDEX_NAME)
+            versions.update(version=F('version') + 1)
+
+    def search(self, query, limit=20, sku_only=False):
+        """Return up to ``limit`` product dicts ranked best-first"""
+        query = (query or '').strip()
+        if not query:
+            return []
+        limit = max(1, min(int(limit), self.MAX_LIMIT))
+
+        if connection.vendor == 'postgresql':
+            return self._search_database(query, limit, sku_only)
+
+        ids = self._get_index().search(query.upper(), limit, sku_only)
+        rows = {
+            row['id']: row
+            for row in Product.objects.filter(id__in=ids).values(*self.RESULT_FIELDS)
+        }
+        return [rows[product_id] for product_id in ids if product_id in rows]
+
+    def _search_database(self, query, limit, sku_only):
+        match = Q(sku__icontains=query)
+        if not sku_only:
+            match |= Q(name__icontains=query)
+        rank = Case(
+            When(sku__iexact=query, then=Value(0)),
+            When(sku__istartswith=query, then=Value(1)),
+            When(name__istartswith=query, then=Value(2)),
+            When(name__icontains=query, then=Value(3)),
+            default=Value(4),
+            output_field=IntegerField(),
+        )
+        return list(
+            Product.objects.filter(match)
+            .annotate(rank=rank)
+            .order_by('rank', 'name', 'id')
+            .values(*self.RESULT_FIELDS)[:limit]
+        )
+
+    def _get_index(self):
+        version = SearchIndexVersion.objects.filter(name=self.INDEX_NAME).values_list('version', flat=True).first() or 0
+        index = ProductSearchService._index
+        if index is not None and index.version == version:
+            return index
+        with self._lock:
+            index = ProductSearchService._index
+            if index is None or index.version != version:
+                index = _InMemoryProductIndex(version)
+                ProductSearchService._index = index
+        return index
+
+
+class _InMemoryProductIndex:
+    """Read-only snapshot of (id, name, sku) used by ProductSearchService off PostgreSQL"""
+
+    SEPARATOR = '\x00'
+
+    def __init__(self, version):
+        self.version = version
+        rows = sorted(
+            (name.upper(), product_id, sku.upper())
+            for product_id, name, sku in Product.objects.values_list('id', 'name', 'sku')
+        )
+        # Positions follow name order, so scanning in position order is already ranked
+        self.names = [row[0] for row in rows]
+        self.ids = [row[1] for row in rows]
+        skus = [row[2] for row in rows]
+        self.sku_lookup = {sku: position for position, sku in enumerate(skus)}
+        sorted_skus = sorted((sku, position) for position, sku in enumerate(skus))
+        self.sku_keys = [row[0] for row in sorted_skus]
+        self.sku_positions = [row[1] for row in sorted_skus]
+        self.name_blob, self.name_offsets = self._join(self.names)
+        self.sku_blob, self.sku_offsets = self._join(skus)
+
+    def _join(self, keys):
+        offsets, position = [], 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + 1
+        return self.SEPARATOR.join(keys), offsets
+
+    def _sku_prefix(self, query, limit):
+        start = bisect_left(self.sku_keys, query)
+        end = bisect_left(self.sku_keys, query + '\uffff', start)
+        # The matching SKUs are contiguous; only the first ``limit`` by name are needed
+        return heapq.nsmallest(limit, self.sku_positions[start:end])
+
+    def _name_prefix(self, query):
+        position = bisect_left(self.names, query)
+        while position < len(self.names) and self.names[position].startswith(query):
+            yield position
+            position += 1
+
+    @staticmethod
+    def _substring(blob, offsets, query):
+        start = blob.find(query)
+        while start != -1:
+            position = bisect_left(offsets, start + 1) - 1
+            yield position
+            # Skip to the next key so each product is reported once
+            next_key = offsets[position + 1] if position + 1 < len(offsets) else len(blob)
+            start = blob.find(query, next_key)
+
+    def search(self, query, limit, sku_only=False):
+        if self.SEPARATOR in query:
+            return []
+        tiers = [
+            [self.sku_lookup[query]] if query in self.sku_lookup else [],
+            self._sku_prefix(query, limit + 1),
+        ]
+        if not sku_only:
+            tiers += [self._name_prefix(query), self._substring(self.name_blob, self.name_offsets, query)]
+        tiers.append(self._substring(self.sku_blob, self.sku_offsets, query))
+
+        seen, results = set(), []
+        for tier in tiers:
+            for position in tier:
+                if position in seen:
+                    continue
+                seen.add(position)
+                results.append(self.ids[position])
+                if len(results) >= limit:
+                    return results
+        return results
@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import Product
+from .services import ProductSearchService
+
+# Fields the search index is built from; stock and price updates leave it alone
+SEARCH_FIELDS = ['name', 'sku', 'category_id']
+
+def _touches_search(update_fields):
+    return update_fields is None or bool({'name', 'sku', 'category', 'category_id'} & set(update_fields))
+
+@receiver(pre_save, sender=Product)
+def remember_search_fields(sender, instance, update_fields=None, **kwargs):
+    """Keep the stored name/SKU/category so post_save can tell whether the index is affected"""
+    instance._search_fields = None
+    if instance.pk and _touches_search(update_fields):
+        instance._search_fields = Product.objects.filter(pk=instance.pk).values_list(*SEARCH_FIELDS).first()
+
+@receiver(post_save, sender=Product)
+def invalidate_product_search(sender, instance, created=False, update_fields=None, **kwargs):
+    """Rebuild the search index once a new, renamed or recategorised product is committed"""
+    if not _touches_search(update_fields):
+        return
+    current = tuple(getattr(instance, field) for field in SEARCH_FIELDS)
+    if created or getattr(instance, '_search_fields', None) != current:
+        transaction.on_commit(ProductSearchService.invalidate)
+
+@receiver(post_delete, sender=Product)
+def invalidate_product_search_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(ProductSearchService.invalidate)
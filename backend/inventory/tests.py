@@ -0,0 +1,205 @@
+import io
+import json
+
+from django.test import TestCase
+
+from .models import Category, Product, ProductPrice, SearchIndexVersion
+from .services import CatalogImportService, ProductSearchService
+
+
+class ProductSearchServiceTest(TestCase):
+    def setUp(self):
+        ProductSearchService._index = None
+        self.category = Category.objects.create(name='Condoms')
+        self.other_category = Category.objects.create(name='Lubricants')
+        self.service = ProductSearchService()
+
+    def create(self, name, sku, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(name=name, sku=sku, category=self.category, **kwargs)
+
+    def version(self):
+        return SearchIndexVersion.objects.get(name=ProductSearchService.INDEX_NAME).version
+
+    def skus(self, query, **kwargs):
+        return [row['sku'] for row in self.service.search(query, **kwargs)]
+
+    def test_ranking(self):
+        self.create('Zeta gel', 'GEL')                 # exact SKU
+        self.create('Yellow pack', 'GEL-200')          # SKU prefix
+        self.create('Gel sachet', 'SCH-1')             # name prefix
+        self.create('Aloe gel tube', 'TUB-1')          # name substring
+        self.create('Condom box', 'BX-GEL')            # SKU substring
+        self.create('Unrelated', 'UNR-1')
+        self.assertEqual(self.skus('gel'), ['GEL', 'GEL-200', 'SCH-1', 'TUB-1', 'BX-GEL'])
+        self.assertEqual(self.skus('gel', limit=2), ['GEL', 'GEL-200'])
+        self.assertEqual(self.skus('gel', sku_only=True), ['GEL', 'GEL-200', 'BX-GEL'])
+        self.assertEqual(self.skus(''), [])
+
+    def test_stock_updates_do_not_invalidate(self):
+        product = self.create('Fiesta', 'FCS-001')
+        self.assertEqual(self.skus('fies'), ['FCS-001'])
+        index, version = ProductSearchService._index, self.version()
+
+        # A POS sale or stock deduction saves the whole row without touching searched fields
+        with self.captureOnCommitCallbacks(execute=True):
+            product.quantity -= 3
+            product.save()
+            Product.objects.get(pk=product.pk).save(update_fields=['quantity'])
+        self.assertEqual(self.version(), version)
+        self.assertEqual(self.skus('fies'), ['FCS-001'])
+        self.assertIs(ProductSearchService._index, index)
+
+    def test_rename_and_recategorise_invalidate(self):
+        product = self.create('Fiesta', 'FCS-001')
+        self.assertEqual(self.skus('fies'), ['FCS-001'])
+        version = self.version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Kiss strawberry'
+            product.save()
+        self.assertEqual(self.version(), version + 1)
+        self.assertEqual(self.skus('fies'), [])
+        self.assertEqual(self.skus('straw'), ['FCS-001'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.category = self.other_category
+            product.save(update_fields=['category'])
+        self.assertEqual(self.version(), version + 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.skus('straw'), [])
+
+    def test_bump_from_another_process_rebuilds(self):
+        self.create('Fiesta', 'FCS-001')
+        self.assertEqual(self.skus('fies'), ['FCS-001'])
+        # bulk writers (import_catalog, possibly in another process) skip signals and bump the shared row
+        Product.objects.bulk_create([Product(name='Fiesta banana', sku='FCS-002', category=self.category)])
+        self.assertEqual(self.skus('fies'), ['FCS-001'])
+        ProductSearchService.invalidate()
+        self.assertEqual(self.skus('fies'), ['FCS-001', 'FCS-002'])
+
+
+class CatalogImportServiceTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Condoms')
+        Product.objects.create(name='Fiesta', sku='FCS-001', category=self.category, cost='1.00', quantity=7)
+        self.service = CatalogImportService(chunk_size=2)
+
+    def run_import(self, text, fmt, **kwargs):
+        return self.service.import_file(io.StringIO(text), fmt=fmt, **kwargs)
+
+    def rows(self, text, read_size=65536):
+        return list(self.service._iter_json_array(io.StringIO(text), read_size=read_size))
+
+    def assert_upserted(self, report):
+        self.assertTrue(report['imported'], report['errors'])
+        self.assertEqual(
+            {key: report[key] for key in ('rows', 'created', 'updated', 'prices_written', 'categories_created')},
+            {'rows': 3, 'created': 2, 'updated': 1, 'prices_written': 3, 'categories_created': 1},
+        )
+        fiesta = Product.objects.get(sku='FCS-001')
+        # Columns the row leaves out keep their current values
+        self.assertEqual((fiesta.name, fiesta.cost, fiesta.quantity), ('Fiesta', 2, 7))
+        self.assertEqual(Product.objects.get(sku='LUB-1').category.name, 'Lubricants')
+        self.assertEqual(
+            sorted(ProductPrice.objects.values_list('product__sku', 'currency', 'price')),
+            [('FCS-001', 'USD', 3), ('LUB-1', 'SLL', 40), ('LUB-1', 'USD', 4)],
+        )
+
+    def test_csv_upsert(self):
+        self.assert_upserted(self.run_import(
+            'sku,name,category,cost,price_USD,price_SLL\n'
+            'FCS-001,,,2.00,3.00,\n'
+            'LUB-1,Lube,Lubricants,1.50,4.00,40\n'
+            'CON-9,Box,Condoms,,,\n',
+            'csv',
+        ))
+
+    def test_jsonl_upsert(self):
+        rows = [
+            {'sku': 'FCS-001', 'cost': '2.00', 'prices': {'USD': '3.00'}},
+            {'sku': 'LUB-1', 'name': 'Lube', 'category': 'Lubricants', 'prices': {'USD': 4, 'SLL': 40}},
+            {'sku': 'CON-9', 'name': 'Box', 'category': 'Condoms'},
+        ]
+        self.assert_upserted(self.run_import('\n'.join(json.dumps(row) for row in rows) + '\n\n', 'jsonl'))
+
+    def test_json_array_upsert(self):
+        rows = [
+            {'sku': 'FCS-001', 'cost': 2, 'prices': {'USD': 3}},
+            {'sku': 'LUB-1', 'name': 'Lube', 'category': 'Lubricants', 'prices': {'USD': 4, 'SLL': 40}},
+            {'sku': 'CON-9', 'name': 'Box', 'category': 'Condoms'},
+        ]
+        self.assert_upserted(self.run_import(json.dumps(rows, indent=2), 'json'))
+
+    def test_row_errors_block_the_import_unless_skipped(self):
+        text = (
+            'sku,name,category,cost,quantity,price_XYZ\n'
+            'NEW-1,,,,,\n'
+            'OK-1,Fine,Condoms,1,2,\n'
+            ',Nameless,Condoms,,,\n'
+            'BAD-1,Bad,Condoms,-1,many,5\n'
+            'OK-1,Again,Condoms,,,\n'
+        )
+        report = self.run_import(text, 'csv')
+        self.assertFalse(report['imported'])
+        self.assertEqual((report['rows'], report['valid_rows'], report['error_count']), (5, 1, 4))
+        self.assertEqual({error['row']: error['errors'] for error in report['errors']}, {
+            2: ['name is required for new products', 'category is required for new products'],
+            4: ['sku is required'],
+            5: ["cost '-1' is not a valid amount", "quantity 'many' is not a whole number", "Unknown currency 'XYZ'"],
+            6: ["Duplicate SKU 'OK-1' in file"],
+        })
+        self.assertFalse(Product.objects.filter(sku='OK-1').exists())
+
+        self.service.skip_invalid = True
+        report = self.run_import(text, 'csv')
+        self.assertEqual((report['imported'], report['created']), (True, 1))
+        self.assertEqual(Product.objects.get(sku='OK-1').name, 'Fine')
+
+    def test_dry_run_writes_nothing(self):
+        report = self.run_import('sku,name,category\nNEW-1,New,Condoms\n', 'csv', dry_run=True)
+        self.assertEqual((report['valid_rows'], report['imported']), (1, False))
+        self.assertFalse(Product.objects.filter(sku='NEW-1').exists())
+
+    def test_json_array_elements_straddle_read_boundaries(self):
+        rows = [{'sku': f'SKU-{index}', 'name': 'x' * index, 'cost': 10 ** index} for index in range(1, 8)]
+        text = ' [ ' + ' ,\n'.join(json.dumps(row) for row in rows) + ' ] \n'
+        for read_size in (1, 3, 7, 16):
+            self.assertEqual(self.rows(text, read_size), list(enumerate(rows, start=1)), read_size)
+        self.assertEqual(self.rows('[]'), [])
+        self.assertEqual(self.rows(' [ \n ] '), [])
+        # A number cut off at the buffer edge is not taken as complete
+        self.assertEqual(self.rows('[12345]', read_size=3), [(1, 12345)])
+
+    def test_malformed_json_arrays(self):
+        def errors(text):
+            return [row for row in self.rows(text, read_size=4) if '__error__' in row[1]]
+
+        self.assertEqual(errors('{"sku": "A"}'), [(1, {'__error__': 'Invalid JSON: expected an array of objects'})])
+        self.assertEqual(errors(''), [(1, {'__error__': 'Invalid JSON: expected an array of objects'})])
+        self.assertEqual(errors('[{"sku": "A"},'), [(2, {'__error__': 'Invalid JSON: unterminated array'})])
+        self.assertEqual(errors('[{"sku": "A"}'), [(2, {'__error__': 'Invalid JSON: unterminated array'})])
+        self.assertEqual(
+            errors('[, {"sku": "A"}]'), [(1, {'__error__': "Invalid JSON: unexpected ',' where an element was expected"})],
+        )
+        self.assertEqual(
+            errors('[{"sku": "A"},, {"sku": "B"}]'),
+            [(2, {'__error__': "Invalid JSON: unexpected ',' where an element was expected"})],
+        )
+        self.assertEqual(
+            errors('[{"sku": "A"},]'), [(2, {'__error__': "Invalid JSON: unexpected ']' where an element was expected"})],
+        )
+        self.assertEqual(
+            errors('[{"sku": "A"} {"sku": "B"}]'),
+            [(2, {'__error__': "Invalid JSON: expected ',' or ']' after element 1"})],
+        )
+        self.assertEqual(
+            errors('[{"sku": "A"}] {"sku": "B"}'), [(2, {'__error__': 'Invalid JSON: unexpected data after the array'})],
+        )
+        self.assertEqual(errors('[{"sku": "A}]')[0][0], 1)
+
+        report = self.run_import('[{"sku": "NEW-1", "name": "New", "category": "Condoms"}] trailing', 'json')
+        self.assertFalse(report['imported'])
+        self.assertEqual(report['errors'], [{'row': 2, 'sku': None, 'errors': ['Invalid JSON: unexpected data after the array']}])
@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Category, Product, InventoryTransfer, ProductPrice
 from .serializers import CategorySerializer, ProductSerializer, InventoryTransferSerializer, ProductPriceSerializer
+from .services import CatalogImportService, ProductSearchService
 import io
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
@@ -19,6 +20,45 @@ class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked prefix/substring search on name and SKU for autocomplete fields.
+        Pass ``sku_only=true`` to match SKUs only.
+        """
+        query = request.query_params.get('q', '')
+        sku_only = request.query_params.get('sku_only', '').lower() in ('1', 'true', 'yes')
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = ProductSearchService().search(query, limit=limit, sku_only=sku_only)
+        return Response({'query': query, 'count': len(results), 'results': results})
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_catalog(self, request):
+        """
+        Bulk upsert products by SKU from an uploaded CSV/JSON Lines/JSON file
+        """
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        skip_invalid = str(request.data.get('skip_invalid', '')).lower() in ('1', 'true', 'yes')
+        fmt = request.data.get('format') or None
+
+        service = CatalogImportService(skip_invalid=skip_invalid)
+        try:
+            report = service.import_upload(uploaded_file, fmt=fmt, dry_run=dry_run)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if report['error_count'] and not report['imported'] and not dry_run:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
 class ProductPriceViewSet(viewsets.ModelViewSet):
     queryset = ProductPrice.objects.all()
     serializer_class = ProductPriceSerializer
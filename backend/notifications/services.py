@@ -102,6 +102,38 @@ class NotificationService:
             except Exception as e:
                 logger.error(f"Failed to send status update via {channel.name}: {str(e)}")
     
+    def send_report_finished(self, report):
+        """Tell the user who queued a report that it is ready to download, or that it failed"""
+        if not report.requested_by:
+            return
+
+        notification_type = f'report_{report.status}'
+        channels = NotificationChannel.objects.filter(is_enabled=True)
+
+        for channel in channels:
+            try:
+                notification = self._create_notification(
+                    recipient=report.requested_by,
+                    sender=None,
+                    channel=channel,
+                    notification_type=notification_type,
+                    reference_id=str(report.id),
+                    reference_type='report',
+                    context_data={
+                        'report': report,
+                        'recipient': report.requested_by,
+                        'kind': report.get_kind_display(),
+                        'rows': report.data.get('rows'),
+                        'error': report.error,
+                        'download_url': f"{getattr(settings, 'FRONTEND_URL', '')}/reports/{report.id}/download",
+                    }
+                )
+
+                self._send_notification(notification)
+
+            except Exception as e:
+                logger.error(f"Failed to send report notification via {channel.name}: {str(e)}")
+
     def _create_notification(self, recipient, channel, notification_type, reference_id, reference_type, sender=None, context_data=None):
         """Create a notification record"""
         try:
@@ -281,6 +313,47 @@ ERP System'''
                     'body': 'New customer approval required: {{ customer.name }}'
                 }
             },
+            'report_done': {
+                'email': {
+                    'subject': '{{ kind }} report ready',
+                    'body': '''Dear {{ recipient.first_name|default:recipient.username }},
+
+Your {{ kind }} report has finished ({{ rows }} rows) and is ready to download:
+{{ download_url }}
+
+Best regards,
+ERP System'''
+                },
+                'sms': {
+                    'subject': '',
+                    'body': 'Your {{ kind }} report is ready to download.'
+                },
+                'push': {
+                    'subject': 'Report ready',
+                    'body': 'Your {{ kind }} report is ready to download'
+                }
+            },
+            'report_failed': {
+                'email': {
+                    'subject': '{{ kind }} report failed',
+                    'body': '''Dear {{ recipient.first_name|default:recipient.username }},
+
+Your {{ kind }} report could not be generated: {{ error }}
+
+Please try again, or contact an administrator if it keeps failing.
+
+Best regards,
+ERP System'''
+                },
+                'sms': {
+                    'subject': '',
+                    'body': 'Your {{ kind }} report failed. Please try again.'
+                },
+                'push': {
+                    'subject': 'Report failed',
+                    'body': 'Your {{ kind }} report could not be generated'
+                }
+            },
             'customer_approved': {
                 'email': {
                     'subject': 'Customer Approved - {{ customer.name }}',
@@ -340,11 +413,12 @@ ERP System'''
             return None
             
         template, created = NotificationTemplate.objects.get_or_create(
-            notification_type=notification_type,
+            template_type=notification_type,
             channel=channel,
             defaults={
-                'subject': template_config['subject'],
-                'body': template_config['body'],
+                'name': f"{notification_type.replace('_', ' ').title()} ({channel.channel_type})",
+                'subject_template': template_config['subject'],
+                'body_template': template_config['body'],
                 'is_active': True
             }
         )
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class ReportingConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'reporting'
+
+    def ready(self):
+        # Import signal handlers
+        from . import signals  # noqa: F401
@@ -1,20 +1,22 @@
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from .services import dashboard_service
 
 class StatsView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        # Dummy stats data
-        return Response({
-            'sales_count': 0,
-            'customer_count': 0,
-            'product_count': 0,
-            'revenue': 0,
-        })
+        return Response(dashboard_service.stats())
 
 class ActivityView(APIView):
+    """Recent activity, newest first; pass ?before=<next_before> for older pages"""
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        # Dummy recent activity
-        return Response([])
+        try:
+            page = dashboard_service.activity(
+                request.user, before=request.query_params.get('before'), limit=request.query_params.get('limit'),
+            )
+        except ValueError:
+            return Response({'error': 'before and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from reporting.services import sync_service
+
+class Command(BaseCommand):
+    help = 'Delete delta-sync change records older than SYNC_CHANGE_RETENTION_DAYS (clients with older tokens resync in full).'
+
+    def handle(self, *args, **options):
+        deleted = sync_service.prune()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} sync change record(s)'))
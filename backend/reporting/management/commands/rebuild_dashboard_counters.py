@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from reporting.services import dashboard_service
+
+class Command(BaseCommand):
+    help = 'Recount the dashboard counters (sales, customers, products, revenue) from their tables.'
+
+    def handle(self, *args, **options):
+        values = dashboard_service.rebuild()
+        for name, value in values.items():
+            self.stdout.write(f'{name}: {value}')
+        self.stdout.write(self.style.SUCCESS('Dashboard counters rebuilt'))
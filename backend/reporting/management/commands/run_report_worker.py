@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from reporting.services import ReportJobService, report_job_service
+
+class Command(BaseCommand):
+    help = 'Compute queued report jobs. Runs until interrupted; start several for more throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--sleep', type=float, default=ReportJobService.POLL_SECONDS,
+                            help='Seconds to wait between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        processed = report_job_service.work(once=options['once'], sleep=options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} report job(s)'))
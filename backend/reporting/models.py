@@ -65,6 +65,110 @@ class RouteAssignment(models.Model):
     completed = models.BooleanField(default=False)
 
 class Report(models.Model):
+    """
+    A stored report. Reports requested through the job queue start out
+    ``queued`` with a ``kind`` and ``params``; the report worker computes
+    them into ``file`` and keeps a summary in ``data``.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    KIND_CHOICES = [
+        ('trial_balance', 'Trial Balance'),
+        ('customer_balances', 'Customer Balances'),
+        ('stock_valuation', 'Stock Valuation'),
+    ]
+
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
-    data = models.JSONField()
+    data = models.JSONField(default=dict, blank=True)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, blank=True)
+    params = models.JSONField(default=dict, blank=True)
+    # sha1 of requester + kind + params; identical active jobs share one row
+    fingerprint = models.CharField(max_length=40, blank=True)
+    # Reports saved directly rather than through a job are complete
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='done')
+    requested_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='reports')
+    file = models.FileField(upload_to='reports/%Y/%m/', null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fingerprint'], condition=models.Q(status__in=['queued', 'running']),
+                name='report_one_active_job_per_fingerprint',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+class SyncChange(models.Model):
+    """
+    Append-only change feed behind mobile delta sync. Ids double as the
+    sync watermark; owner_id scopes the row to the user whose device
+    receives it (null for collections everyone syncs).
+    """
+    ACTION_CHOICES = [
+        ('upsert', 'Upsert'),
+        ('delete', 'Delete'),
+    ]
+    collection = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['collection', 'owner_id', 'id'])]
+
+class SyncReceipt(models.Model):
+    """Device-generated client_id of every record created by a sync upload, so retried uploads are not applied twice"""
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='sync_receipts')
+    client_id = models.CharField(max_length=64)
+    collection = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'client_id']
+
+class DashboardCounter(models.Model):
+    """Running dashboard totals, adjusted as the underlying rows change (see DashboardService)"""
+    name = models.CharField(max_length=30, primary_key=True)
+    value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class ActivityEvent(models.Model):
+    """Append-only feed of business events shown on the dashboard"""
+    KIND_CHOICES = [
+        ('sale', 'Sale'),
+        ('payment', 'Payment'),
+        ('transfer', 'Transfer'),
+        ('approval', 'Approval'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    verb = models.CharField(max_length=30)
+    actor = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='activity_events')
+    object_type = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    summary = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [models.Index(fields=['actor', 'id'])]
+
+    def __str__(self):
+        return self.summary
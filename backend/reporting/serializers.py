@@ -46,3 +46,7 @@ class ReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Report
         fields = '__all__'
+        read_only_fields = [
+            'kind', 'params', 'fingerprint', 'status', 'requested_by', 'file', 'error', 'attempts',
+            'started_at', 'finished_at',
+        ]
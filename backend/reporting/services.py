@@ -0,0 +1,1109 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from functools import partial
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.dispatch import Signal
+from django.utils.dateparse import parse_date, parse_datetime
+
+from accounting.models import ChartOfAccounts, JournalEntry
+from inventory.models import InventoryTransfer, Product
+from procurement.models import ProcurementRequest
+from sales.geohash import encode as encode_geohash
+from sales.models import Customer, CustomerApproval, Payment, Sale, SalesOrderItem
+from sales.serializers import CustomerApprovalSerializer, CustomerSerializer
+from warehouse.models import StockMovement
+from warehouse.services import InventoryValuationService
+from .models import (
+    ActivityEvent, DashboardCounter, Report, Route, RouteAssignment, RouteStop, Survey, SurveyAnswer, SurveyQuestion, SurveyResponse, SyncChange, SyncReceipt,
+)
+
+logger = logging.getLogger(__name__)
+
+# Sent with the Report once a queued job has finished, whether done or failed
+report_finished = Signal()
+
+
+class SyncTokenExpired(Exception):
+    """The client's sync token is too old for the retained change feed; it must resync from scratch"""
+
+
+class SyncService:
+    """
+    Watermark-based delta sync for the mobile app.
+
+    Writes to synced models append a SyncChange row (see signals.py). A
+    client with no token gets a paged snapshot of every collection; the
+    token returned with the last page holds the change-feed watermark taken
+    when the snapshot started, and later syncs send only objects changed
+    since then, with tombstones for deletes. Each collection pages
+    independently and the token carries the per-collection cursors, signed
+    so it cannot be edited or replayed by another user.
+
+    Changes are recorded after commit and a pass only reads up to changes
+    at least SETTLE_SECONDS old, so a change whose id was allocated before a
+    concurrent one but committed after it is never skipped.
+    """
+
+    COLLECTIONS = {
+        # name: (model, field scoping rows to the syncing user, None = everyone)
+        'sales': (Sale, 'staff'),
+        'procurement_requests': (ProcurementRequest, 'created_by'),
+        'transfers': (InventoryTransfer, 'requested_by'),
+        'surveys': (Survey, None),
+        'survey_responses': (SurveyResponse, 'user'),
+        'routes': (Route, 'created_by'),
+        'route_assignments': (RouteAssignment, 'user'),
+    }
+    PAGE_SIZE = 500
+    MAX_PAGE_SIZE = 5000
+    SETTLE_SECONDS = 2
+    TOKEN_SALT = 'reporting.sync'
+
+    @property
+    def retention(self):
+        return timedelta(days=getattr(settings, 'SYNC_CHANGE_RETENTION_DAYS', 30))
+
+    @classmethod
+    def collection_for(cls, model):
+        return next((name for name, (candidate, _) in cls.COLLECTIONS.items() if candidate is model), None)
+
+    @classmethod
+    def record(cls, collection, changes, action):
+        """Append ``(object_id, owner_id)`` changes to the feed once the surrounding transaction commits"""
+        rows = [
+            SyncChange(collection=collection, object_id=object_id, owner_id=owner_id, action=action)
+            for object_id, owner_id in changes
+        ]
+        if rows:
+            transaction.on_commit(partial(SyncChange.objects.bulk_create, rows, batch_size=1000))
+
+    def scoped(self, collection, user):
+        model, owner_field = self.COLLECTIONS[collection]
+        queryset = model.objects.all()
+        return queryset.filter(**{owner_field: user}) if owner_field else queryset
+
+    def download(self, user, token=None, collections=None, limit=None):
+        limit = max(1, min(int(limit or self.PAGE_SIZE), self.MAX_PAGE_SIZE))
+        state = self._read_token(user, token) if token else {'m': 'snapshot', 'w': 0, 'c': None}
+
+        if state['c'] is None:
+            # Start a pass: snapshots page by primary key, deltas by change id
+            names = state.get('n') or self._collection_names(collections)
+            upper = self._settled_watermark()
+            start = 0 if state['m'] == 'snapshot' else state['w']
+            cursors = {name: start for name in names}
+        else:
+            names = state['n']
+            upper = state['w']
+            cursors = state['c']
+
+        page = {'mode': state['m'], 'deleted': {}}
+        remaining = {}
+        for name, cursor in cursors.items():
+            if state['m'] == 'snapshot':
+                rows, deleted, cursor, more = self._snapshot_page(name, user, cursor, limit)
+            else:
+                rows, deleted, cursor, more = self._delta_page(name, user, cursor, upper, limit)
+            page[name] = rows
+            if deleted:
+                page['deleted'][name] = deleted
+            if more:
+                remaining[name] = cursor
+
+        if remaining:
+            next_state = {'m': state['m'], 'w': upper, 'c': remaining, 'n': names}
+        else:
+            next_state = {'m': 'delta', 'w': upper, 'c': None, 'n': names}
+        page['has_more'] = bool(remaining)
+        page['token'] = signing.dumps({'u': user.id, **next_state}, salt=self.TOKEN_SALT, compress=True)
+        page['server_time'] = timezone.now()
+        return page
+
+    def prune(self):
+        """Drop changes older than any token still accepted"""
+        return SyncChange.objects.filter(changed_at__lt=timezone.now() - self.retention).delete()[0]
+
+    def _collection_names(self, collections):
+        if not collections:
+            return list(self.COLLECTIONS)
+        unknown = set(collections) - set(self.COLLECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown sync collections: {', '.join(sorted(unknown))}")
+        return [name for name in self.COLLECTIONS if name in collections]
+
+    def _read_token(self, user, token):
+        try:
+            state = signing.loads(token, salt=self.TOKEN_SALT, max_age=self.retention)
+        except signing.SignatureExpired:
+            raise SyncTokenExpired()
+        except signing.BadSignature:
+            raise ValueError('Invalid sync token')
+        if state.get('u') != user.id:
+            raise ValueError('Invalid sync token')
+        return state
+
+    def _settled_watermark(self):
+        settled = timezone.now() - timedelta(seconds=self.SETTLE_SECONDS)
+        return SyncChange.objects.filter(changed_at__lte=settled).aggregate(last=Max('id'))['last'] or 0
+
+    def _snapshot_page(self, name, user, cursor, limit):
+        rows = list(self.scoped(name, user).filter(pk__gt=cursor).order_by('pk').values()[:limit + 1])
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return rows, [], rows[-1]['id'] if rows else cursor, more
+
+    def _delta_page(self, name, user, cursor, upper, limit):
+        changes = SyncChange.objects.filter(collection=name, id__gt=cursor, id__lte=upper)
+        if self.COLLECTIONS[name][1]:
+            changes = changes.filter(owner_id=user.id)
+        # Latest change per object, paged by that change's id
+        latest = list(
+            changes.values('object_id').annotate(last=Max('id')).order_by('last').values_list('object_id', 'last')[:limit + 1]
+        )
+        more = len(latest) > limit
+        latest = latest[:limit]
+        if not latest:
+            return [], [], cursor, False
+
+        actions = dict(SyncChange.objects.filter(id__in=[last for _, last in latest]).values_list('object_id', 'action'))
+        upserts = [object_id for object_id, action in actions.items() if action == 'upsert']
+        rows = list(self.scoped(name, user).filter(pk__in=upserts).order_by('pk').values())
+        present = {row['id'] for row in rows}
+        # Objects gone (or moved out of scope) since their last upsert are sent as deletes too
+        deleted = sorted(object_id for object_id in actions if object_id not in present)
+        return rows, deleted, latest[-1][1], more
+
+
+class SyncUploadService:
+    """
+    Applies a device's offline batch of customers, sales, survey responses
+    and route updates.
+
+    Records are validated up front against references fetched in bulk,
+    then written CHUNK_SIZE at a time, each chunk in its own transaction
+    with bulk inserts/updates, so a bad record or a failed chunk never
+    loses the rest of the upload. Creates are idempotent on the device's
+    client_id (SyncReceipt), so a retried upload reports duplicates instead
+    of double-booking. Updates are resolved against the server's copy: the
+    newer ``updated_at`` (``location_timestamp`` for customer positions)
+    wins, and losing records come back as conflicts with the server values.
+    Every record gets a result in input order.
+    """
+
+    TYPES = ['customers', 'sales', 'survey_responses', 'route_updates']
+    CHUNK_SIZE = 500
+    MAX_RECORDS = 20000
+    CUSTOMER_LOCATION_FIELDS = ['latitude', 'longitude', 'location_accuracy', 'location_timestamp']
+    CUSTOMER_DETAIL_FIELDS = ['phone', 'address']
+    CUSTOMER_UPDATE_FIELDS = CUSTOMER_LOCATION_FIELDS + CUSTOMER_DETAIL_FIELDS
+
+    def upload(self, user, payload):
+        if not isinstance(payload, dict):
+            raise ValueError('Upload must be an object keyed by record type')
+        for record_type in self.TYPES:
+            if not isinstance(payload.get(record_type) or [], list):
+                raise ValueError(f'{record_type} must be a list')
+        if sum(len(payload.get(record_type) or []) for record_type in self.TYPES) > self.MAX_RECORDS:
+            raise ValueError(f'At most {self.MAX_RECORDS} records per upload')
+
+        # Customers first so sales can reference customers created in the same upload
+        results = {
+            record_type: getattr(self, f'_upload_{record_type}')(user, payload.get(record_type) or [])
+            for record_type in self.TYPES
+        }
+        return {
+            'results': results,
+            'summary': dict(Counter(result['status'] for rows in results.values() for result in rows)),
+            'synced_at': timezone.now(),
+        }
+
+    # Creates
+
+    def _upload_sales(self, user, records):
+        results = [None] * len(records)
+        pending = self._unclaimed(user, records, results)
+
+        customer_ids = {record['customer'] for _, record in pending if isinstance(record.get('customer'), int)}
+        known_customers = set(Customer.objects.filter(id__in=customer_ids).values_list('id', flat=True))
+        created_customers = self._receipts(user, 'customers', [record.get('customer_client_id') for _, record in pending])
+        pending_customers = self._receipts(user, 'customer_approvals', [record.get('customer_client_id') for _, record in pending])
+        currencies = {choice for choice, _ in Sale.CURRENCY_CHOICES}
+        payment_methods = {choice for choice, _ in Sale.PAYMENT_METHOD_CHOICES}
+
+        valid = []
+        for index, record in pending:
+            errors = {}
+            customer_id = record.get('customer')
+            if record.get('customer_client_id'):
+                customer_id = created_customers.get(record['customer_client_id'])
+                if customer_id is None:
+                    errors['customer_client_id'] = (
+                        'Customer is awaiting approval' if record['customer_client_id'] in pending_customers
+                        else 'Unknown customer_client_id'
+                    )
+            elif customer_id is not None and customer_id not in known_customers:
+                errors['customer'] = 'Unknown customer'
+            total = self._decimal(record.get('total'))
+            if total is None or total < 0 or total.as_tuple().exponent < -2 or abs(total) >= 10 ** 8:
+                errors['total'] = 'A non-negative amount with at most 2 decimals is required'
+            if record.get('currency', 'SLL') not in currencies:
+                errors['currency'] = 'Invalid currency'
+            if record.get('payment_method', 'cash') not in payment_methods:
+                errors['payment_method'] = 'Invalid payment method'
+            sold_at = self._datetime(record.get('sold_at'), errors, 'sold_at')
+            if errors:
+                results[index] = self._error(record, errors)
+                continue
+            valid.append((index, record['client_id'], Sale(
+                customer_id=customer_id,
+                staff=user,
+                total=total,
+                status=str(record.get('status') or 'pending')[:50],
+                currency=record.get('currency', 'SLL'),
+                payment_method=record.get('payment_method', 'cash'),
+            ), sold_at))
+
+        def create(items):
+            sales = Sale.objects.bulk_create([sale for sale, _ in items])
+            # date is auto_now_add; keep the time the device recorded the sale
+            backdated = []
+            for sale, sold_at in items:
+                if sold_at:
+                    sale.date = sold_at
+                    backdated.append(sale)
+            Sale.objects.bulk_update(backdated, ['date'])
+            SyncService.record('sales', [(sale.pk, user.id) for sale in sales], 'upsert')
+            DashboardService.adjust(
+                sales_count=len(sales), revenue=sum(sale.total for sale in sales if sale.status == 'completed'),
+            )
+            DashboardService.record([
+                ActivityEvent(
+                    kind='sale', verb='created', actor_id=user.id, object_type='sales.sale', object_id=sale.pk,
+                    summary=f'Sale #{sale.pk}: {sale.total} {sale.currency}', amount=sale.total,
+                )
+                for sale in sales
+            ])
+            return sales
+
+        self._write(user, 'sales', [(index, client_id, (sale, sold_at)) for index, client_id, sale, sold_at in valid], results, create)
+        return results
+
+    def _upload_survey_responses(self, user, records):
+        results = [None] * len(records)
+        pending = self._unclaimed(user, records, results)
+
+        survey_ids = {record.get('survey') for _, record in pending}
+        known_surveys = set(Survey.objects.filter(id__in=[pk for pk in survey_ids if isinstance(pk, int)]).values_list('id', flat=True))
+        question_surveys = dict(SurveyQuestion.objects.filter(survey_id__in=known_surveys).values_list('id', 'survey_id'))
+
+        valid = []
+        for index, record in pending:
+            errors = {}
+            survey_id = record.get('survey')
+            if survey_id not in known_surveys:
+                errors['survey'] = 'Unknown survey'
+            answers = record.get('answers') or []
+            if not isinstance(answers, list) or any(
+                not isinstance(answer, dict) or question_surveys.get(answer.get('question')) != survey_id
+                for answer in answers
+            ):
+                errors['answers'] = 'Every answer needs a question from this survey'
+            submitted_at = self._datetime(record.get('submitted_at'), errors, 'submitted_at')
+            if not errors:
+                try:
+                    number_answers = [
+                        float(answer['answer_number']) if answer.get('answer_number') not in (None, '') else None
+                        for answer in answers
+                    ]
+                except (TypeError, ValueError):
+                    errors['answers'] = 'answer_number must be numeric'
+            if errors:
+                results[index] = self._error(record, errors)
+                continue
+            answer_objects = [
+                SurveyAnswer(
+                    question_id=answer['question'],
+                    answer_text=str(answer.get('answer_text') or ''),
+                    answer_number=number,
+                    answer_gps=str(answer.get('answer_gps') or '')[:100],
+                )
+                for answer, number in zip(answers, number_answers)
+            ]
+            valid.append((index, record['client_id'], (SurveyResponse(survey_id=survey_id, user=user), submitted_at, answer_objects)))
+
+        def create(items):
+            responses = SurveyResponse.objects.bulk_create([response for response, _, _ in items])
+            answers = []
+            for response, submitted_at, response_answers in items:
+                if submitted_at:
+                    response.submitted_at = submitted_at
+                for answer in response_answers:
+                    answer.response = response
+                    answers.append(answer)
+            SurveyResponse.objects.bulk_update([r for r, submitted_at, _ in items if submitted_at], ['submitted_at'])
+            SurveyAnswer.objects.bulk_create(answers, batch_size=1000)
+            SyncService.record('survey_responses', [(response.pk, user.id) for response in responses], 'upsert')
+            return responses
+
+        self._write(user, 'survey_responses', valid, results, create)
+        return results
+
+    def _upload_customers(self, user, records):
+        results = [None] * len(records)
+        updates = [(index, record) for index, record in enumerate(records) if isinstance(record, dict) and record.get('id')]
+        self._update_customers(updates, results)
+
+        creates = [
+            (index, record) for index, record in enumerate(records)
+            if not (isinstance(record, dict) and record.get('id'))
+        ]
+        direct = user.is_superuser or getattr(user, 'role', None) in ['sales_manager', 'admin']
+        serializer_class = CustomerSerializer if direct else CustomerApprovalSerializer
+        model = Customer if direct else CustomerApproval
+        collection = 'customers' if direct else 'customer_approvals'
+
+        valid = []
+        for index, record in self._unclaimed(user, [record for _, record in creates], results, [index for index, _ in creates]):
+            serializer = serializer_class(data={key: value for key, value in record.items() if key != 'client_id'})
+            if not serializer.is_valid():
+                results[index] = self._error(record, serializer.errors)
+                continue
+            instance = model(**serializer.validated_data)
+            if direct:
+                instance.geohash = (
+                    encode_geohash(instance.latitude, instance.longitude)
+                    if instance.latitude is not None and instance.longitude is not None else ''
+                )
+            else:
+                instance.requested_by = user
+            valid.append((index, record['client_id'], instance))
+
+        def create(items):
+            created = model.objects.bulk_create(items)
+            if direct:
+                DashboardService.adjust(customer_count=len(created))
+            else:
+                DashboardService.record([
+                    ActivityEvent(
+                        kind='approval', verb='requested', actor_id=user.id, object_type='sales.customerapproval',
+                        object_id=approval.pk, summary=f'New customer {approval.name}',
+                    )
+                    for approval in created
+                ])
+                transaction.on_commit(partial(self._notify_approvals, [approval.pk for approval in created]))
+            return created
+
+        self._write(user, collection, valid, results, create)
+        for index in [index for index, _ in creates]:
+            if results[index] and results[index]['status'] == 'created' and not direct:
+                results[index]['status'] = 'pending_approval'
+        return results
+
+    # Updates
+
+    def _update_customers(self, updates, results):
+        customers = Customer.objects.in_bulk([record['id'] for _, record in updates if isinstance(record['id'], int)])
+        changed = []
+        for index, record in updates:
+            customer = customers.get(record['id'])
+            if customer is None:
+                results[index] = self._error(record, {'id': 'Unknown customer'})
+                continue
+            errors = {}
+            captured = self._datetime(record.get('location_timestamp'), errors, 'location_timestamp')
+            edited = self._datetime(record.get('updated_at'), errors, 'updated_at') or timezone.now()
+            # Field validation (types, max_length) per record, so one bad value cannot fail a whole chunk
+            serializer = CustomerSerializer(
+                customer, data={field: record[field] for field in self.CUSTOMER_UPDATE_FIELDS if field in record}, partial=True,
+            )
+            if not serializer.is_valid():
+                errors = {**serializer.errors, **errors}
+            if errors:
+                results[index] = self._error(record, errors)
+                continue
+            values = dict(serializer.validated_data)
+            moved = any(field in values for field in ('latitude', 'longitude'))
+            stale_position = moved and customer.location_timestamp and (
+                captured is None or captured <= customer.location_timestamp
+            )
+            stale_details = any(field in values for field in self.CUSTOMER_DETAIL_FIELDS) and customer.updated_at > edited
+            if stale_position or stale_details:
+                results[index] = {
+                    'id': customer.id,
+                    'status': 'conflict',
+                    'server': {field: getattr(customer, field) for field in self.CUSTOMER_UPDATE_FIELDS + ['updated_at']},
+                }
+                continue
+            if moved:
+                values['location_timestamp'] = captured or timezone.now()
+            for field, value in values.items():
+                setattr(customer, field, value)
+            has_position = customer.latitude is not None and customer.longitude is not None
+            customer.geohash = encode_geohash(customer.latitude, customer.longitude) if has_position else ''
+            customer.updated_at = timezone.now()  # bulk_update skips auto_now
+            changed.append((index, customer))
+
+        for chunk in self._chunks(changed):
+            try:
+                with transaction.atomic():
+                    Customer.objects.bulk_update(
+                        [customer for _, customer in chunk], self.CUSTOMER_UPDATE_FIELDS + ['geohash', 'updated_at'],
+                    )
+            except DatabaseError:
+                logger.exception('Sync upload: customer update chunk failed')
+                for index, customer in chunk:
+                    results[index] = {'id': customer.id, 'status': 'error', 'errors': ['Could not be saved, retry the upload']}
+                continue
+            for index, customer in chunk:
+                results[index] = {'id': customer.id, 'status': 'updated'}
+
+    def _upload_route_updates(self, user, records):
+        results = [None] * len(records)
+        assignment_ids = [record.get('assignment') for record in records if isinstance(record, dict)]
+        assignments = RouteAssignment.objects.filter(user=user).in_bulk([pk for pk in assignment_ids if isinstance(pk, int)])
+        last_changed = dict(
+            SyncChange.objects.filter(collection='route_assignments', object_id__in=assignments)
+            .values('object_id').annotate(last=Max('changed_at')).values_list('object_id', 'last')
+        )
+        stops = {
+            stop.id: stop
+            for stop in RouteStop.objects.filter(route_id__in={a.route_id for a in assignments.values()})
+        }
+
+        changed = []
+        for index, record in enumerate(records):
+            if not isinstance(record, dict) or not isinstance(record.get('assignment'), int) \
+                    or record['assignment'] not in assignments:
+                results[index] = self._error(record, {'assignment': 'Unknown route assignment'})
+                continue
+            assignment = assignments[record['assignment']]
+            errors = {}
+            updated_at = self._datetime(record.get('updated_at'), errors, 'updated_at') or timezone.now()
+            stop_updates = []
+            for stop in record.get('stops') or []:
+                target = stops.get(stop.get('id')) if isinstance(stop, dict) else None
+                if target is None or target.route_id != assignment.route_id:
+                    errors['stops'] = 'Every stop must belong to the assignment route'
+                    break
+                stop_updates.append((target, self._datetime(stop.get('arrival_time'), errors, 'stops')))
+            if errors:
+                results[index] = self._error(record, errors)
+                continue
+            if assignment.id in last_changed and last_changed[assignment.id] > updated_at:
+                results[index] = {
+                    'assignment': assignment.id,
+                    'status': 'conflict',
+                    'server': {'completed': assignment.completed, 'changed_at': last_changed[assignment.id]},
+                }
+                continue
+            if 'completed' in record:
+                assignment.completed = bool(record['completed'])
+            for stop, arrival_time in stop_updates:
+                stop.arrival_time = arrival_time
+            changed.append((index, assignment, [stop for stop, _ in stop_updates]))
+
+        for chunk in self._chunks(changed):
+            try:
+                with transaction.atomic():
+                    RouteAssignment.objects.bulk_update([assignment for _, assignment, _ in chunk], ['completed'])
+                    RouteStop.objects.bulk_update([stop for _, _, chunk_stops in chunk for stop in chunk_stops], ['arrival_time'])
+                    SyncService.record('route_assignments', [(assignment.pk, user.id) for _, assignment, _ in chunk], 'upsert')
+            except DatabaseError:
+                logger.exception('Sync upload: route update chunk failed')
+                for index, assignment, _ in chunk:
+                    results[index] = {'assignment': assignment.id, 'status': 'error', 'errors': ['Could not be saved, retry the upload']}
+                continue
+            for index, assignment, _ in chunk:
+                results[index] = {'assignment': assignment.id, 'status': 'updated'}
+        return results
+
+    # Helpers
+
+    def _unclaimed(self, user, records, results, positions=None):
+        """
+        ``(result index, record)`` pairs still to apply; malformed records,
+        repeats within the upload and client_ids already applied by an
+        earlier upload get their result here.
+        """
+        positions = positions if positions is not None else range(len(records))
+        seen, candidates = set(), []
+        for index, record in zip(positions, records):
+            if not isinstance(record, dict) or not record.get('client_id'):
+                results[index] = self._error(record, {'client_id': 'client_id is required'})
+                continue
+            record['client_id'] = str(record['client_id'])[:64]
+            if record['client_id'] in seen:
+                results[index] = {'client_id': record['client_id'], 'status': 'duplicate'}
+                continue
+            seen.add(record['client_id'])
+            candidates.append((index, record))
+
+        applied = dict(
+            SyncReceipt.objects.filter(user=user, client_id__in=seen).values_list('client_id', 'object_id')
+        )
+        pending = []
+        for index, record in candidates:
+            if record['client_id'] in applied:
+                results[index] = {'client_id': record['client_id'], 'status': 'duplicate', 'id': applied[record['client_id']]}
+            else:
+                pending.append((index, record))
+        return pending
+
+    def _write(self, user, collection, valid, results, create):
+        """Create ``valid`` ``(index, client_id, item)`` triples chunk by chunk, with receipts"""
+        for chunk in self._chunks(valid):
+            try:
+                with transaction.atomic():
+                    created = create([item for _, _, item in chunk])
+                    SyncReceipt.objects.bulk_create([
+                        SyncReceipt(user=user, client_id=client_id, collection=collection, object_id=obj.pk)
+                        for (_, client_id, _), obj in zip(chunk, created)
+                    ])
+            except DatabaseError:
+                # Most likely the same upload running concurrently; a retry reports duplicates
+                logger.exception('Sync upload: %s chunk failed', collection)
+                for index, client_id, _ in chunk:
+                    results[index] = {'client_id': client_id, 'status': 'error', 'errors': ['Could not be saved, retry the upload']}
+                continue
+            for (index, client_id, _), obj in zip(chunk, created):
+                results[index] = {'client_id': client_id, 'status': 'created', 'id': obj.pk}
+
+    def _receipts(self, user, collection, client_ids):
+        client_ids = [str(client_id) for client_id in client_ids if client_id]
+        if not client_ids:
+            return {}
+        return dict(
+            SyncReceipt.objects.filter(user=user, collection=collection, client_id__in=client_ids)
+            .values_list('client_id', 'object_id')
+        )
+
+    def _chunks(self, items):
+        for start in range(0, len(items), self.CHUNK_SIZE):
+            yield items[start:start + self.CHUNK_SIZE]
+
+    @staticmethod
+    def _notify_approvals(approval_ids):
+        try:
+            from notifications.services import NotificationService
+        except ImportError:
+            return  # Notification system not available
+        for approval in CustomerApproval.objects.filter(id__in=approval_ids):
+            try:
+                NotificationService.send_customer_approval_request(approval)
+            except Exception:
+                # The approval is saved; a failed notification must not fail the sync
+                logger.exception('Sync upload: approval notification failed for %s', approval.pk)
+
+    @staticmethod
+    def _error(record, errors):
+        result = {'status': 'error', 'errors': errors}
+        if isinstance(record, dict):
+            for key in ('client_id', 'id', 'assignment'):
+                if record.get(key) is not None:
+                    result[key] = record[key]
+        return result
+
+    @staticmethod
+    def _decimal(value):
+        try:
+            return Decimal(str(value)) if value not in (None, '') else None
+        except InvalidOperation:
+            return None
+
+    @staticmethod
+    def _datetime(value, errors, field):
+        if not value:
+            return None
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None:
+            errors[field] = 'Invalid datetime'
+            return None
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class CustomerBalanceService:
+    """
+    Completed-sales balance per customer as one grouped query, so listing,
+    sorting and filtering on the balance all happen in the database.
+    """
+
+    SORT_FIELDS = {'balance': 'balance', 'name': 'customer_name', 'id': 'customer_id', 'customer_type': 'customer_type'}
+    CSV_HEADER = ['customer_id', 'customer_name', 'customer_type', 'is_blacklisted', 'balance']
+
+    def balances(self, customer_type=None, blacklisted=None, min_balance=None, sort='-balance'):
+        queryset = Customer.objects.all()
+        if customer_type:
+            queryset = queryset.filter(customer_type=customer_type)
+        if blacklisted is not None:
+            queryset = queryset.filter(is_blacklisted=blacklisted)
+        # values() before annotate(): the Sum is grouped per customer row
+        queryset = queryset.values(
+            'customer_type', 'is_blacklisted', customer_id=F('id'), customer_name=F('name'),
+        ).annotate(
+            balance=Coalesce(
+                Sum('sale__total', filter=Q(sale__status='completed')),
+                Value(0), output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+        if min_balance is not None:
+            queryset = queryset.filter(balance__gte=min_balance)
+        return queryset.order_by(*self._ordering(sort))
+
+    def csv_lines(self, queryset):
+        """CSV text of ``queryset`` a line at a time, for StreamingHttpResponse"""
+        writer = csv.writer(_LineBuffer())
+        yield writer.writerow(self.CSV_HEADER)
+        for row in queryset.iterator(chunk_size=2000):
+            yield writer.writerow([row[column] for column in self.CSV_HEADER])
+
+    def _ordering(self, sort):
+        field = (sort or '-balance').lstrip('-')
+        if field not in self.SORT_FIELDS:
+            raise ValueError(f"sort must be one of: {', '.join(self.SORT_FIELDS)} (prefix - for descending)")
+        prefix = '-' if sort.startswith('-') else ''
+        return [prefix + self.SORT_FIELDS[field], 'customer_id']
+
+
+class ReportJobService:
+    """
+    Database-backed queue for heavy reports.
+
+    submit() stores a queued Report; identical requests (same user, kind
+    and params) made while one is queued or running get that same Report
+    back, enforced by a partial unique constraint so concurrent submits
+    cannot both enqueue. Requests from different users never share a report,
+    which is only visible to and announced to the user who requested it.
+    Workers (``manage.py run_report_worker``) claim jobs with SELECT ... FOR
+    UPDATE SKIP LOCKED, write the rows to a CSV file on the report and keep
+    a small summary in Report.data; clients poll the report until it is done
+    and then download the file. Jobs left running by a worker that died are
+    requeued after JOB_TIMEOUT, up to MAX_ATTEMPTS.
+    """
+
+    ACTIVE_STATUSES = ['queued', 'running']
+    JOB_TIMEOUT = timedelta(minutes=30)
+    MAX_ATTEMPTS = 3
+    POLL_SECONDS = 2
+    PARAMS = {
+        'trial_balance': {'date_from': 'date', 'date_to': 'date'},
+        'customer_balances': {'customer_type': 'str', 'blacklisted': 'bool', 'min_balance': 'decimal', 'sort': 'str'},
+        'stock_valuation': {'group_by': 'str', 'warehouse_id': 'int', 'category_id': 'int'},
+    }
+
+    def submit(self, user, kind, params=None):
+        """The (report, created) for the request; created is False when it joined an active job"""
+        params = self._clean_params(kind, params or {})
+        fingerprint = hashlib.sha1(json.dumps([user.pk, kind, params], sort_keys=True).encode()).hexdigest()
+        while True:
+            active = Report.objects.filter(fingerprint=fingerprint, status__in=self.ACTIVE_STATUSES).first()
+            if active:
+                return active, False
+            try:
+                with transaction.atomic():
+                    report = Report.objects.create(
+                        name=dict(Report.KIND_CHOICES)[kind], kind=kind, params=params,
+                        fingerprint=fingerprint, status='queued', requested_by=user,
+                    )
+                return report, True
+            except IntegrityError:
+                continue  # an identical job was enqueued concurrently; join it
+
+    def work(self, once=False, sleep=POLL_SECONDS):
+        """Process jobs until interrupted, or until the queue is empty when ``once``"""
+        processed = 0
+        while True:
+            self.requeue_stale()
+            report = self.claim()
+            if report is None:
+                if once:
+                    return processed
+                time.sleep(sleep)
+                continue
+            self.process(report)
+            processed += 1
+
+    def claim(self):
+        with transaction.atomic():
+            report = (
+                Report.objects.select_for_update(skip_locked=True)
+                .filter(status='queued').order_by('id').first()
+            )
+            if report is None:
+                return None
+            report.status = 'running'
+            report.started_at = timezone.now()
+            report.attempts += 1
+            report.save(update_fields=['status', 'started_at', 'attempts'])
+        return report
+
+    def process(self, report):
+        try:
+            summary = {}
+            with tempfile.TemporaryFile() as handle:
+                text = io.TextIOWrapper(handle, encoding='utf-8', newline='')
+                writer = csv.writer(text)
+                rows = 0
+                for row in getattr(self, f'_{report.kind}')(summary, **report.params):
+                    writer.writerow(row)
+                    rows += 1
+                text.flush()
+                text.detach()
+                handle.seek(0)
+                report.file.save(f'{report.kind}-{report.id}.csv', File(handle), save=False)
+            report.data = {'rows': max(rows - 1, 0), **summary}
+            report.status = 'done'
+            report.error = ''
+        except Exception as exc:
+            logger.exception('Report job %s (%s) failed', report.id, report.kind)
+            report.status = 'failed'
+            report.error = str(exc)
+        report.finished_at = timezone.now()
+        report.save(update_fields=['file', 'data', 'status', 'error', 'finished_at'])
+        report_finished.send(sender=Report, report=report)
+        return report
+
+    def requeue_stale(self):
+        stale = Report.objects.filter(status='running', started_at__lt=timezone.now() - self.JOB_TIMEOUT)
+        stale.filter(attempts__gte=self.MAX_ATTEMPTS).update(
+            status='failed', error='Timed out', finished_at=timezone.now(),
+        )
+        return stale.update(status='queued')
+
+    def _clean_params(self, kind, params):
+        if kind not in self.PARAMS:
+            raise ValueError(f"kind must be one of: {', '.join(self.PARAMS)}")
+        if not isinstance(params, dict):
+            raise ValueError('params must be an object')
+        unknown = set(params) - set(self.PARAMS[kind])
+        if unknown:
+            raise ValueError(f"Unknown {kind} params: {', '.join(sorted(unknown))}")
+
+        cleaned = {}
+        for name, value in params.items():
+            if value in (None, ''):
+                continue
+            expected = self.PARAMS[kind][name]
+            try:
+                if expected == 'date':
+                    cleaned[name] = parse_date(str(value)).isoformat()
+                elif expected == 'int':
+                    cleaned[name] = int(value)
+                elif expected == 'decimal':
+                    cleaned[name] = str(Decimal(str(value)))
+                elif expected == 'bool':
+                    if str(value).lower() not in ('true', 'false'):
+                        raise ValueError
+                    cleaned[name] = str(value).lower() == 'true'
+                else:
+                    cleaned[name] = str(value)
+            except (AttributeError, InvalidOperation, ValueError):
+                raise ValueError(f'Invalid {name}')
+        # Validate choices now rather than failing in the worker
+        if kind == 'customer_balances':
+            customer_balance_service.balances(sort=cleaned.get('sort', '-balance'))
+        if kind == 'stock_valuation' and cleaned.get('group_by', 'warehouse') not in InventoryValuationService.GROUPINGS:
+            raise ValueError(f"group_by must be one of: {', '.join(InventoryValuationService.GROUPINGS)}")
+        return cleaned
+
+    # Generators yield the CSV header, then rows, and fill in ``summary``
+
+    def _trial_balance(self, summary, date_from=None, date_to=None):
+        period = Q()
+        if date_from:
+            period &= Q(journal_entries__transaction_date__gte=date_from)
+        if date_to:
+            period &= Q(journal_entries__transaction_date__lte=date_to)
+        amount = DecimalField(max_digits=17, decimal_places=2)
+        accounts = ChartOfAccounts.objects.filter(is_active=True).annotate(
+            debits=Coalesce(Sum('journal_entries__amount', filter=period & Q(journal_entries__entry_type='DEBIT')), Value(0), output_field=amount),
+            credits=Coalesce(Sum('journal_entries__amount', filter=period & Q(journal_entries__entry_type='CREDIT')), Value(0), output_field=amount),
+        ).values_list('account_code', 'account_name', 'account_type', 'debits', 'credits').order_by('account_code')
+
+        yield ['account_code', 'account_name', 'account_type', 'debit_balance', 'credit_balance']
+        total_debits = total_credits = Decimal('0.00')
+        for code, name, account_type, debits, credits in accounts:
+            # Same sign rules as ChartOfAccounts.current_balance and the trial-balance endpoint
+            net = debits - credits
+            if account_type not in ['ASSET', 'EXPENSE', 'COST_OF_GOODS_SOLD']:
+                net = -net
+            if not net:
+                continue
+            debit_normal = account_type in ['ASSET', 'EXPENSE', 'COST_OF_GOODS_SOLD']
+            debit = abs(net) if (net > 0) == debit_normal else Decimal('0.00')
+            credit = abs(net) if not debit else Decimal('0.00')
+            total_debits += debit
+            total_credits += credit
+            yield [code, name, account_type, debit, credit]
+        summary.update(
+            total_debits=str(total_debits), total_credits=str(total_credits),
+            is_balanced=abs(total_debits - total_credits) < Decimal('0.01'),
+        )
+
+    def _customer_balances(self, summary, customer_type=None, blacklisted=None, min_balance=None, sort='-balance'):
+        balances = customer_balance_service.balances(
+            customer_type=customer_type, blacklisted=blacklisted,
+            min_balance=Decimal(min_balance) if min_balance is not None else None, sort=sort,
+        )
+        yield CustomerBalanceService.CSV_HEADER
+        total = Decimal('0.00')
+        for row in balances.iterator(chunk_size=2000):
+            total += row['balance']
+            yield [row[column] for column in CustomerBalanceService.CSV_HEADER]
+        summary['total_balance'] = str(total)
+
+    def _stock_valuation(self, summary, group_by='warehouse', warehouse_id=None, category_id=None):
+        service = InventoryValuationService()
+        rows = service.valuation(group_by=group_by, warehouse_id=warehouse_id, category_id=category_id)
+        columns = InventoryValuationService.GROUPINGS[group_by] + ['quantity', 'value']
+        yield columns
+        for row in rows:
+            yield [row[column] for column in columns]
+        summary.update(
+            costing_method=service.method,
+            total_quantity=str(sum(row['quantity'] for row in rows)),
+            total_value=str(sum(row['value'] for row in rows)),
+        )
+
+
+class DashboardService:
+    """
+    Dashboard counters and the activity feed.
+
+    Counters live in DashboardCounter and are adjusted with F() updates
+    after each commit (signals.py for single saves, bulk writers call
+    adjust() themselves), so /api/dashboard/stats/ reads four rows instead
+    of counting tables. Missing counters are rebuilt from the tables on the
+    next read; ``manage.py rebuild_dashboard_counters`` reconciles them.
+
+    The activity feed pages by id (``before`` = the last id seen) so every
+    page is an index range scan. Each user's first page is cached; any new
+    event bumps a version number that is part of the cache key.
+    """
+
+    COUNTERS = ['sales_count', 'customer_count', 'product_count', 'revenue']
+    ACTIVITY_CACHE_KEY = 'reporting:activity:{version}:{user_id}:{limit}'
+    ACTIVITY_VERSION_KEY = 'reporting:activity:version'
+    ACTIVITY_CACHE_TIMEOUT = 60
+    ACTIVITY_PAGE_SIZE = 20
+    MAX_ACTIVITY_PAGE_SIZE = 100
+    MANAGER_ROLES = ['superadmin', 'admin', 'manager']
+
+    @classmethod
+    def adjust(cls, **deltas):
+        """Add ``deltas`` (counter name -> amount) to the counters once the transaction commits"""
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if deltas:
+            transaction.on_commit(partial(cls._apply, deltas))
+
+    @staticmethod
+    def _apply(deltas):
+        for name, delta in deltas.items():
+            DashboardCounter.objects.filter(name=name).update(value=F('value') + delta, updated_at=timezone.now())
+
+    def stats(self):
+        values = dict(DashboardCounter.objects.values_list('name', 'value'))
+        if len(values) < len(self.COUNTERS):
+            values = self.rebuild()
+        return {
+            'sales_count': int(values['sales_count']),
+            'customer_count': int(values['customer_count']),
+            'product_count': int(values['product_count']),
+            'revenue': values['revenue'],
+        }
+
+    def rebuild(self):
+        values = {
+            'sales_count': Sale.objects.count(),
+            'customer_count': Customer.objects.count(),
+            'product_count': Product.objects.count(),
+            'revenue': Sale.objects.filter(status='completed').aggregate(total=Sum('total'))['total'] or 0,
+        }
+        for name, value in values.items():
+            DashboardCounter.objects.update_or_create(name=name, defaults={'value': value})
+        return values
+
+    @classmethod
+    def record(cls, events):
+        """Append unsaved ActivityEvents to the feed once the transaction commits"""
+        if events:
+            transaction.on_commit(partial(cls._append, events))
+
+    @classmethod
+    def _append(cls, events):
+        ActivityEvent.objects.bulk_create(events, batch_size=1000)
+        try:
+            cache.incr(cls.ACTIVITY_VERSION_KEY)
+        except ValueError:
+            cache.set(cls.ACTIVITY_VERSION_KEY, 1, None)
+
+    def activity(self, user, before=None, limit=None):
+        """A page of events visible to ``user``, newest first, and the ``before`` cursor of the next page"""
+        limit = max(1, min(int(limit or self.ACTIVITY_PAGE_SIZE), self.MAX_ACTIVITY_PAGE_SIZE))
+        if before is not None:
+            return self._activity_page(user, int(before), limit)
+
+        key = self.ACTIVITY_CACHE_KEY.format(
+            version=cache.get(self.ACTIVITY_VERSION_KEY, 0), user_id=user.id, limit=limit,
+        )
+        page = cache.get(key)
+        if page is None:
+            page = self._activity_page(user, None, limit)
+            cache.set(key, page, self.ACTIVITY_CACHE_TIMEOUT)
+        return page
+
+    def _activity_page(self, user, before, limit):
+        events = ActivityEvent.objects.order_by('-id')
+        if not (user.is_superuser or getattr(user, 'role', None) in self.MANAGER_ROLES):
+            events = events.filter(actor=user)
+        if before is not None:
+            events = events.filter(id__lt=before)
+        rows = list(events.values(
+            'id', 'kind', 'verb', 'actor_id', 'actor__username', 'object_type', 'object_id', 'summary', 'amount', 'created_at',
+        )[:limit + 1])
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {'results': rows, 'next_before': rows[-1]['id'] if more else None}
+
+
+class BIExportService:
+    """
+    Incremental extracts of fact and dimension tables for BI refreshes.
+
+    Each table pages in keyset order on its change watermark: (updated_at,
+    id) for tables whose rows change, id for append-only ledgers. Every
+    page carries the watermark of its last row; passing it back as
+    ``since`` returns only rows added (or changed) after it, so a refresh
+    pulls new data instead of re-reading the table. Rows younger than
+    SETTLE_SECONDS are held back until the next pull, so a transaction that
+    commits late cannot land behind a watermark already handed out.
+    """
+
+    PAGE_SIZE = 10000
+    MAX_PAGE_SIZE = 50000
+    SETTLE_SECONDS = 5
+    FORMATS = {'csv.gz': 'application/gzip', 'ndjson': 'application/x-ndjson'}
+    EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    TABLES = {
+        # name: (model, watermark field (None = id only), field holding back unsettled rows, columns)
+        'sales': (Sale, 'updated_at', 'updated_at', [
+            'id', 'date', 'updated_at', 'customer_id', 'staff_id', 'total', 'status', 'currency', 'payment_method',
+        ]),
+        'order_lines': (SalesOrderItem, 'updated_at', 'updated_at', [
+            'id', 'sales_order_id', 'product_id', 'quantity', 'unit_price', 'line_total', 'updated_at',
+        ]),
+        'payments': (Payment, 'updated_at', 'updated_at', [
+            'id', 'payment_number', 'sales_order_id', 'amount', 'payment_method', 'payment_date', 'status',
+            'created_by_id', 'approved_by_id', 'approved_at', 'created_at', 'updated_at',
+        ]),
+        'journal_entries': (JournalEntry, None, 'created_at', [
+            'id', 'transaction_date', 'account_id', 'entry_type', 'amount', 'currency_id', 'exchange_rate',
+            'base_amount', 'reference_number', 'source_type', 'source_id', 'journal_batch_id', 'created_at',
+        ]),
+        'stock_movements': (StockMovement, None, 'created_at', [
+            'id', 'created_at', 'warehouse_id', 'location_id', 'product_id', 'transfer_id', 'movement_type',
+            'quantity', 'unit_cost', 'reference',
+        ]),
+        'customers': (Customer, 'updated_at', 'updated_at', [
+            'id', 'name', 'email', 'phone', 'customer_type', 'payment_terms', 'is_blacklisted', 'latitude',
+            'longitude', 'updated_at',
+        ]),
+        'products': (Product, 'updated_at', 'updated_at', [
+            'id', 'sku', 'name', 'category_id', 'unit', 'cost', 'quantity', 'min_stock', 'max_stock',
+            'created_at', 'updated_at',
+        ]),
+    }
+
+    def manifest(self):
+        return [
+            {'table': name, 'watermark': [field, 'id'] if field else ['id'], 'columns': columns, 'formats': list(self.FORMATS)}
+            for name, (_, field, _, columns) in self.TABLES.items()
+        ]
+
+    def extract(self, table, since=None, limit=None):
+        if table not in self.TABLES:
+            raise ValueError(f"table must be one of: {', '.join(self.TABLES)}")
+        model, field, settle_field, columns = self.TABLES[table]
+        limit = max(1, min(int(limit or self.PAGE_SIZE), self.MAX_PAGE_SIZE))
+
+        rows = model.objects.all()
+        if settle_field:
+            rows = rows.filter(**{f'{settle_field}__lte': timezone.now() - timedelta(seconds=self.SETTLE_SECONDS)})
+        if since:
+            changed_at, last_id = self._read_watermark(since, field)
+            if field:
+                rows = rows.filter(Q(**{f'{field}__gt': changed_at}) | Q(**{field: changed_at, 'id__gt': last_id}))
+            else:
+                rows = rows.filter(id__gt=last_id)
+        rows = list(rows.order_by(*([field, 'id'] if field else ['id'])).values_list(*columns)[:limit + 1])
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        watermark = since or ''
+        if rows:
+            last = rows[-1]
+            last_id = last[columns.index('id')]
+            watermark = self._watermark(last[columns.index(field)], last_id) if field else str(last_id)
+        return {'columns': columns, 'rows': rows, 'watermark': watermark, 'has_more': more}
+
+    def csv_gz(self, columns, rows):
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb') as compressed:
+            text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            writer.writerows(rows)
+            text.flush()
+            text.detach()
+        return buffer.getvalue()
+
+    def ndjson(self, columns, rows):
+        return ''.join(
+            json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+            for row in rows
+        ).encode('utf-8')
+
+    def _watermark(self, changed_at, last_id):
+        # Integer microseconds keep the token exact and URL-safe
+        return f'{(changed_at - self.EPOCH) // timedelta(microseconds=1)}-{last_id}'
+
+    def _read_watermark(self, since, field):
+        try:
+            if field:
+                micros, last_id = since.split('-')
+                return self.EPOCH + timedelta(microseconds=int(micros)), int(last_id)
+            return None, int(since)
+        except ValueError:
+            raise ValueError('Invalid watermark for this table')
+
+
+class _LineBuffer:
+    """File-like object handing back what csv.writer writes instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+sync_service = SyncService()
+sync_upload_service = SyncUploadService()
+customer_balance_service = CustomerBalanceService()
+report_job_service = ReportJobService()
+dashboard_service = DashboardService()
+bi_export_service = BIExportService()
@@ -0,0 +1,134 @@
+import logging
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from inventory.models import InventoryTransfer, Product
+from notifications.models import TransferApproval
+from notifications.services import NotificationService
+from procurement.models import ProcurementApproval
+from sales.models import Customer, CustomerApproval, Payment, Sale
+from warehouse.models import WarehouseTransfer
+from workflows.models import WorkflowApproval
+from .models import ActivityEvent, Report
+from .services import DashboardService, SyncService, report_finished
+
+logger = logging.getLogger(__name__)
+
+def _owner_id(instance, collection):
+    owner_field = SyncService.COLLECTIONS[collection][1]
+    return getattr(instance, f'{owner_field}_id') if owner_field else None
+
+def remember_sync_owner(sender, instance, update_fields=None, **kwargs):
+    """Keep the stored owner so post_save can send the previous owner a delete"""
+    instance._sync_owner_id = None
+    owner_field = SyncService.COLLECTIONS[SyncService.collection_for(sender)][1]
+    if owner_field and instance.pk and (update_fields is None or owner_field in update_fields):
+        instance._sync_owner_id = sender.objects.filter(pk=instance.pk).values_list(f'{owner_field}_id', flat=True).first()
+
+def record_sync_upsert(sender, instance, **kwargs):
+    collection = SyncService.collection_for(sender)
+    owner_id = _owner_id(instance, collection)
+    previous_owner_id = getattr(instance, '_sync_owner_id', None)
+    if previous_owner_id is not None and previous_owner_id != owner_id:
+        # Out of the previous owner's scope, so their next delta drops it
+        SyncService.record(collection, [(instance.pk, previous_owner_id)], 'delete')
+    SyncService.record(collection, [(instance.pk, owner_id)], 'upsert')
+
+def record_sync_delete(sender, instance, **kwargs):
+    collection = SyncService.collection_for(sender)
+    SyncService.record(collection, [(instance.pk, _owner_id(instance, collection))], 'delete')
+
+# Feed every synced model's writes into the delta-sync change log. Bulk
+# writers bypass these and call SyncService.record themselves.
+for _model, _ in SyncService.COLLECTIONS.values():
+    pre_save.connect(remember_sync_owner, sender=_model, dispatch_uid=f'sync_owner_{_model._meta.label}')
+    post_save.connect(record_sync_upsert, sender=_model, dispatch_uid=f'sync_upsert_{_model._meta.label}')
+    post_delete.connect(record_sync_delete, sender=_model, dispatch_uid=f'sync_delete_{_model._meta.label}')
+
+# Dashboard activity feed. model: (kind, status field, verb when created
+# (None = the status itself), actor id, summary, amount field). Status
+# changes are recorded with the new status as the verb; 'pending' is not news.
+ACTIVITY_SOURCES = {
+    Sale: ('sale', 'status', 'created', lambda sale: sale.staff_id,
+           lambda sale: f'Sale #{sale.pk}: {sale.total} {sale.currency}', 'total'),
+    Payment: ('payment', 'status', 'created', lambda payment: payment.approved_by_id or payment.created_by_id,
+              lambda payment: f'Payment {payment.payment_number}: {payment.amount}', 'amount'),
+    InventoryTransfer: ('transfer', 'status', 'requested', lambda transfer: transfer.requested_by_id,
+                        lambda transfer: f'Transfer #{transfer.pk}: {transfer.quantity} units, {transfer.from_location} to {transfer.to_location}', None),
+    WarehouseTransfer: ('transfer', 'status', 'requested', lambda transfer: transfer.requested_by_id,
+                        lambda transfer: f'Warehouse transfer {transfer.transfer_number}', None),
+    CustomerApproval: ('approval', 'status', 'requested', lambda approval: approval.approved_by_id or approval.requested_by_id,
+                       lambda approval: f'New customer {approval.name}', None),
+    TransferApproval: ('approval', 'status', None, lambda approval: approval.approver_id,
+                       lambda approval: f'Transfer #{approval.transfer_id} approval', None),
+    WorkflowApproval: ('approval', 'action', None, lambda approval: approval.approver_id,
+                       lambda approval: f'Workflow #{approval.workflow_instance_id} approval', None),
+    ProcurementApproval: ('approval', 'action', None, lambda approval: approval.approver_id,
+                          lambda approval: f'Procurement request #{approval.procurement_request_id} ({approval.stage})', None),
+}
+
+def remember_previous(sender, instance, **kwargs):
+    """Keep the stored status (and Sale.total) so post_save can tell what changed"""
+    instance._previous = None
+    if instance.pk:
+        fields = [ACTIVITY_SOURCES[sender][1]] + (['total'] if sender is Sale else [])
+        instance._previous = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+def record_activity(sender, instance, created, **kwargs):
+    kind, field, created_verb, actor, summary, amount_field = ACTIVITY_SOURCES[sender]
+    previous = getattr(instance, '_previous', None)
+    value = getattr(instance, field)
+    if previous is None:
+        verb = created_verb or value
+    elif previous[field] != value:
+        verb = value
+    else:
+        return
+    if verb == 'pending':
+        return
+    DashboardService.record([ActivityEvent(
+        kind=kind, verb=verb, actor_id=actor(instance), object_type=sender._meta.label_lower,
+        object_id=instance.pk, summary=summary(instance)[:255],
+        amount=getattr(instance, amount_field) if amount_field else None,
+    )])
+
+def _revenue(status, total):
+    return Decimal(str(total)) if status == 'completed' else Decimal('0')
+
+def count_sale(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    old_revenue = _revenue(previous['status'], previous['total']) if previous else Decimal('0')
+    DashboardService.adjust(
+        sales_count=1 if previous is None else 0,
+        revenue=_revenue(instance.status, instance.total) - old_revenue,
+    )
+
+def uncount_sale(sender, instance, **kwargs):
+    DashboardService.adjust(sales_count=-1, revenue=-_revenue(instance.status, instance.total))
+
+COUNTED_MODELS = {Customer: 'customer_count', Product: 'product_count'}
+
+def count_row(sender, instance, created, **kwargs):
+    if created:
+        DashboardService.adjust(**{COUNTED_MODELS[sender]: 1})
+
+def uncount_row(sender, instance, **kwargs):
+    DashboardService.adjust(**{COUNTED_MODELS[sender]: -1})
+
+for _model in ACTIVITY_SOURCES:
+    pre_save.connect(remember_previous, sender=_model, dispatch_uid=f'activity_previous_{_model._meta.label}')
+    post_save.connect(record_activity, sender=_model, dispatch_uid=f'activity_{_model._meta.label}')
+post_save.connect(count_sale, sender=Sale, dispatch_uid='dashboard_count_sale')
+post_delete.connect(uncount_sale, sender=Sale, dispatch_uid='dashboard_uncount_sale')
+for _model in COUNTED_MODELS:
+    post_save.connect(count_row, sender=_model, dispatch_uid=f'dashboard_count_{_model._meta.label}')
+    post_delete.connect(uncount_row, sender=_model, dispatch_uid=f'dashboard_uncount_{_model._meta.label}')
+
+def notify_report_finished(sender, report, **kwargs):
+    try:
+        NotificationService().send_report_finished(report)
+    except Exception as e:
+        logger.error(f"Failed to notify about report {report.id}: {str(e)}")
+
+report_finished.connect(notify_report_finished, sender=Report, dispatch_uid='reporting_notify_report_finished')
@@ -1,39 +1,45 @@
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.utils import timezone
-from sales.models import Sale
-from procurement.models import ProcurementRequest
-from inventory.models import InventoryTransfer
-from reporting.models import Survey, SurveyResponse, Route, RouteAssignment
-from users.models import User
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from reporting.services import SyncTokenExpired, sync_service, sync_upload_service
 
+@method_decorator(gzip_page, name='dispatch')
 class SyncDownloadAPIView(APIView):
+    """
+    Delta sync: call without a token for a full snapshot, then keep calling
+    with the returned token while has_more is true. Later syncs with the
+    last token return only records changed since, plus deleted ids.
+    Query params: token, collections (comma separated, first sync only), limit.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Download all relevant records for offline use
-        data = {
-            'sales': list(Sale.objects.filter(staff=request.user).values()),
-            'procurement_requests': list(ProcurementRequest.objects.filter(created_by=request.user).values()),
-            'transfers': list(InventoryTransfer.objects.filter(requested_by=request.user).values()),
-            'surveys': list(Survey.objects.all().values()),
-            'survey_responses': list(SurveyResponse.objects.filter(user=request.user).values()),
-            'routes': list(Route.objects.filter(created_by=request.user).values()),
-            'route_assignments': list(RouteAssignment.objects.filter(user=request.user).values()),
-        }
+        collections = request.query_params.get('collections')
+        try:
+            data = sync_service.download(
+                request.user,
+                token=request.query_params.get('token'),
+                collections=collections.split(',') if collections else None,
+                limit=request.query_params.get('limit'),
+            )
+        except SyncTokenExpired:
+            return Response(
+                {'error': 'Sync token expired, resync without a token', 'resync': True},
+                status=status.HTTP_410_GONE,
+            )
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(data)
 
 class SyncUploadAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        # Accept uploaded records, save or update as needed, and log sync event
-        # This is a stub; implement validation and conflict resolution as needed
-        uploaded = request.data
-        # TODO: process uploaded records
-        # Log sync event
-        user = request.user
-        user.profile.last_sync = timezone.now()
-        user.profile.save()
-        return Response({'status': 'success', 'synced_at': user.profile.last_sync})
+        try:
+            result = sync_upload_service.upload(request.user, request.data)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
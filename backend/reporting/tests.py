@@ -0,0 +1,412 @@
+import csv
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from reporting.models import ActivityEvent, DashboardCounter, Route, RouteAssignment, Survey, SyncReceipt
+from notifications.models import Notification, NotificationChannel
+from reporting.services import BIExportService, CustomerBalanceService, DashboardService, SyncService, SyncTokenExpired, SyncUploadService, report_job_service
+from inventory.models import Category, Product
+from sales.models import Customer, CustomerApproval, Sale, SalesOrder, SalesOrderItem
+
+User = get_user_model()
+
+class SyncServiceTest(TestCase):
+    def setUp(self):
+        self.rep = User.objects.create_user(username='rep', password='rep')
+        self.other = User.objects.create_user(username='other', password='other')
+        self.service = SyncService()
+        self.service.SETTLE_SECONDS = 0
+
+    def download_all(self, user, token=None, collections=None, limit=None):
+        """Follow has_more to the end of a pass; returns the pages"""
+        pages = [self.service.download(user, token=token, collections=collections, limit=limit)]
+        while pages[-1]['has_more']:
+            pages.append(self.service.download(user, token=pages[-1]['token'], limit=limit))
+        return pages
+
+    def test_snapshot_pages_each_collection_independently(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            routes = [Route.objects.create(name=f'R{index}', created_by=self.rep) for index in range(5)]
+            Route.objects.create(name='Theirs', created_by=self.other)
+            Survey.objects.create(name='Everyone')
+
+        pages = self.download_all(self.rep, collections=['routes', 'surveys'], limit=2)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual([page['mode'] for page in pages], ['snapshot'] * 3)
+        self.assertEqual([row['id'] for page in pages for row in page['routes']], [route.id for route in routes])
+        # A finished collection drops out of the remaining pages
+        self.assertEqual(len(pages[0]['surveys']), 1)
+        self.assertNotIn('surveys', pages[1])
+
+        # Nothing changed since the snapshot started
+        delta = self.service.download(self.rep, token=pages[-1]['token'])
+        self.assertEqual((delta['mode'], delta['routes'], delta['deleted']), ('delta', [], {}))
+
+    def test_delta_after_upsert_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kept, removed = (Route.objects.create(name=name, created_by=self.rep) for name in ('Kept', 'Removed'))
+        token = self.download_all(self.rep, collections=['routes'])[-1]['token']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.name = 'Renamed'
+            kept.save()
+            removed_id = removed.id
+            removed.delete()
+            Route.objects.create(name='Theirs', created_by=self.other)
+
+        delta = self.service.download(self.rep, token=token)
+        self.assertEqual([row['name'] for row in delta['routes']], ['Renamed'])
+        self.assertEqual(delta['deleted'], {'routes': [removed_id]})
+
+    def test_owner_change_deletes_for_previous_owner(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            route = Route.objects.create(name='Handover', created_by=self.rep)
+        rep_token = self.download_all(self.rep, collections=['routes'])[-1]['token']
+        other_token = self.download_all(self.other, collections=['routes'])[-1]['token']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            route.created_by = self.other
+            route.save()
+
+        rep_delta = self.service.download(self.rep, token=rep_token)
+        self.assertEqual((rep_delta['routes'], rep_delta['deleted']), ([], {'routes': [route.id]}))
+        other_delta = self.service.download(self.other, token=other_token)
+        self.assertEqual([row['id'] for row in other_delta['routes']], [route.id])
+
+    def test_token_is_bound_to_user_and_expires(self):
+        token = self.service.download(self.rep, collections=['surveys'])['token']
+        with self.assertRaises(ValueError):
+            self.service.download(self.other, token=token)
+
+        client = APIClient()
+        client.force_authenticate(self.other)
+        self.assertEqual(client.get('/api/reporting/sync/download/', {'token': token}).status_code, 400)
+        client.force_authenticate(self.rep)
+        self.assertEqual(client.get('/api/reporting/sync/download/', {'token': token}).status_code, 200)
+        with override_settings(SYNC_CHANGE_RETENTION_DAYS=-1):
+            with self.assertRaises(SyncTokenExpired):
+                self.service.download(self.rep, token=token)
+            response = client.get('/api/reporting/sync/download/', {'token': token})
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['resync'])
+
+
+class SyncUploadServiceTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='mgr', password='mgr', role='admin')
+        self.rep = User.objects.create_user(username='rep', password='rep', role='sales')
+        self.service = SyncUploadService()
+
+    def test_creates_are_idempotent_and_sales_reference_new_customers(self):
+        payload = {
+            'customers': [
+                {'client_id': 'c1', 'name': 'New', 'email': 'new@example.com', 'latitude': 8.5, 'longitude': -13.1},
+                {'client_id': 'c2'},
+            ],
+            'sales': [
+                {'client_id': 's1', 'customer_client_id': 'c1', 'total': '10.50', 'sold_at': '2026-01-02T10:00:00Z'},
+                {'client_id': 's1', 'total': '1'},
+                {'client_id': 's2', 'total': '-1'},
+            ],
+        }
+        result = self.service.upload(self.manager, payload)
+        self.assertEqual([row['status'] for row in result['results']['customers']], ['created', 'error'])
+        self.assertEqual([row['status'] for row in result['results']['sales']], ['created', 'duplicate', 'error'])
+        customer = Customer.objects.get(name='New')
+        self.assertTrue(customer.geohash)
+        self.assertEqual(Sale.objects.get().customer, customer)
+
+        retried = self.service.upload(self.manager, payload)
+        self.assertEqual(retried['summary'], {'duplicate': 3, 'error': 2})
+        self.assertEqual((Customer.objects.count(), Sale.objects.count()), (1, 1))
+
+    def test_customers_from_reps_await_approval(self):
+        result = self.service.upload(self.rep, {
+            'customers': [{'client_id': 'c1', 'name': 'Pending', 'email': 'p@example.com', 'phone': '1'}],
+            'sales': [{'client_id': 's1', 'customer_client_id': 'c1', 'total': '5'}],
+        })
+        self.assertEqual(result['results']['customers'][0]['status'], 'pending_approval')
+        self.assertEqual(result['results']['sales'][0]['errors'], {'customer_client_id': 'Customer is awaiting approval'})
+        self.assertEqual((CustomerApproval.objects.count(), Customer.objects.count()), (1, 0))
+        self.assertTrue(SyncReceipt.objects.filter(user=self.rep, client_id='c1').exists())
+
+    def test_customer_updates_lose_to_newer_server_copies(self):
+        customer = Customer.objects.create(
+            name='Shop', email='shop@example.com', phone='111', latitude=8.4, longitude=-13.2,
+            location_timestamp=timezone.now(),
+        )
+        later = (timezone.now() + timedelta(minutes=5)).isoformat()
+        result = self.service.upload(self.manager, {'customers': [
+            {'id': customer.id, 'phone': '222', 'updated_at': '2020-01-01T00:00:00Z'},
+            {'id': customer.id, 'latitude': 9.0, 'longitude': -13.0, 'location_timestamp': '2020-01-01T00:00:00Z'},
+            {'id': customer.id, 'address': 'Main Street', 'updated_at': later},
+            {'id': 99999, 'phone': '333'},
+        ]})['results']['customers']
+
+        self.assertEqual([row['status'] for row in result], ['conflict', 'conflict', 'updated', 'error'])
+        self.assertEqual(result[0]['server']['phone'], '111')
+        customer.refresh_from_db()
+        self.assertEqual((customer.phone, customer.address, customer.latitude), ('111', 'Main Street', 8.4))
+
+        # The address edit moved the server copy past an edit made before it
+        stale = self.service.upload(self.manager, {'customers': [
+            {'id': customer.id, 'phone': '444', 'updated_at': (customer.updated_at - timedelta(seconds=1)).isoformat()},
+        ]})
+        self.assertEqual(stale['results']['customers'][0]['status'], 'conflict')
+
+    def test_invalid_customer_updates_fail_alone(self):
+        first, second = (
+            Customer.objects.create(name=name, email=f'{name}@example.com', phone='111') for name in ('first', 'second')
+        )
+        result = self.service.upload(self.manager, {'customers': [
+            {'id': first.id, 'phone': '9' * 21},
+            {'id': first.id, 'latitude': 'north', 'longitude': -13.0},
+            {'id': second.id, 'phone': '222', 'latitude': '8.5', 'longitude': -13.1},
+        ]})['results']['customers']
+
+        self.assertEqual([row['status'] for row in result], ['error', 'error', 'updated'])
+        self.assertIn('phone', result[0]['errors'])
+        self.assertIn('latitude', result[1]['errors'])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.phone, '111')
+        self.assertEqual((second.phone, second.latitude), ('222', 8.5))
+
+    def test_route_updates_are_scoped_to_the_user_and_resolved_by_updated_at(self):
+        route = Route.objects.create(name='Coast', created_by=self.manager)
+        assignment = RouteAssignment.objects.create(route=route, user=self.rep)
+        theirs = RouteAssignment.objects.create(route=route, user=self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.service.upload(self.rep, {'route_updates': [
+                {'assignment': assignment.id, 'completed': True, 'updated_at': (timezone.now() + timedelta(minutes=5)).isoformat()},
+                {'assignment': theirs.id, 'completed': True},
+            ]})
+        self.assertEqual([row['status'] for row in result['results']['route_updates']], ['updated', 'error'])
+
+        stale = self.service.upload(self.rep, {'route_updates': [
+            {'assignment': assignment.id, 'completed': False, 'updated_at': '2020-01-01T00:00:00Z'},
+        ]})
+        self.assertEqual(stale['results']['route_updates'][0]['status'], 'conflict')
+        assignment.refresh_from_db()
+        self.assertTrue(assignment.completed)
+
+    def test_view_rejects_malformed_uploads(self):
+        client = APIClient()
+        client.force_authenticate(self.rep)
+        self.assertEqual(client.post('/api/reporting/sync/upload/', {'sales': 'x'}, format='json').status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportJobTest(TestCase):
+    def setUp(self):
+        self.rep = User.objects.create_user(username='rep', password='rep', role='sales')
+        self.other = User.objects.create_user(username='other', password='other', role='sales')
+        self.manager = User.objects.create_user(username='mgr', password='mgr', role='manager')
+        NotificationChannel.objects.create(name='Push', channel_type='push')
+
+    def test_requester_is_notified_when_the_report_finishes(self):
+        report, _ = report_job_service.submit(self.rep, 'stock_valuation', {})
+        report_job_service.work(once=True)
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.recipient, notification.notification_type), (self.rep, 'report_done'))
+        self.assertEqual((notification.reference_type, notification.reference_id), ('report', str(report.id)))
+        self.assertEqual(notification.status, 'sent')
+
+    def test_reports_are_scoped_to_the_requester_unless_manager(self):
+        mine, _ = report_job_service.submit(self.rep, 'stock_valuation', {})
+        theirs, _ = report_job_service.submit(self.other, 'customer_balances', {})
+        client = APIClient()
+
+        client.force_authenticate(self.rep)
+        self.assertEqual([row['id'] for row in client.get('/api/reporting/reports/').json()], [mine.id])
+        self.assertEqual(client.get(f'/api/reporting/reports/{theirs.id}/').status_code, 404)
+        self.assertEqual(client.get(f'/api/reporting/reports/{theirs.id}/download/').status_code, 404)
+
+        client.force_authenticate(self.manager)
+        self.assertEqual(
+            sorted(row['id'] for row in client.get('/api/reporting/reports/').json()), [mine.id, theirs.id],
+        )
+
+    def test_identical_requests_from_different_users_are_not_merged(self):
+        client = APIClient()
+        request = {'kind': 'stock_valuation', 'params': {'group_by': 'warehouse'}}
+        client.force_authenticate(self.rep)
+        mine = client.post('/api/reporting/reports/generate/', request, format='json').json()
+        again = client.post('/api/reporting/reports/generate/', request, format='json').json()
+        self.assertEqual((again['id'], again['coalesced']), (mine['id'], True))
+
+        client.force_authenticate(self.other)
+        theirs = client.post('/api/reporting/reports/generate/', request, format='json').json()
+        self.assertNotEqual(theirs['id'], mine['id'])
+        self.assertFalse(theirs['coalesced'])
+        self.assertEqual(client.get(f"/api/reporting/reports/{theirs['id']}/").status_code, 200)
+
+        report_job_service.work(once=True)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('recipient__username', 'reference_id')),
+            sorted([('rep', str(mine['id'])), ('other', str(theirs['id']))]),
+        )
+
+
+class BIExportServiceTest(TestCase):
+    def setUp(self):
+        self.service = BIExportService()
+        self.service.SETTLE_SECONDS = 0
+        customer = Customer.objects.create(name='Shop', email='shop@example.com')
+        self.order = SalesOrder.objects.create(customer=customer)
+        self.product = Product.objects.create(name='Fiesta', sku='FCS-001', category=Category.objects.create(name='Condoms'))
+
+    def line(self, quantity):
+        return SalesOrderItem.objects.create(sales_order=self.order, product=self.product, quantity=quantity, unit_price=2)
+
+    def exported(self, page):
+        return [(row[0], row[page['columns'].index('quantity')]) for row in page['rows']]
+
+    def test_order_lines_follow_edits(self):
+        first, second = self.line(1), self.line(2)
+        page = self.service.extract('order_lines', limit=1)
+        self.assertEqual((self.exported(page), page['has_more']), ([(first.id, 1)], True))
+        page = self.service.extract('order_lines', since=page['watermark'])
+        self.assertEqual(self.exported(page), [(second.id, 2)])
+
+        first.quantity = 5
+        first.save()
+        page = self.service.extract('order_lines', since=page['watermark'])
+        self.assertEqual(self.exported(page), [(first.id, 5)])
+        self.assertEqual(self.service.extract('order_lines', since=page['watermark'])['rows'], [])
+
+    def test_unsettled_order_lines_are_held_back(self):
+        self.service.SETTLE_SECONDS = 60
+        self.line(1)
+        self.assertEqual(self.service.extract('order_lines')['rows'], [])
+
+
+class CustomerBalanceServiceTest(TestCase):
+    def setUp(self):
+        self.service = CustomerBalanceService()
+        self.customers = {}
+        for name, customer_type, blacklisted, totals in [
+            ('Ama', 'retailer', False, [('completed', 40), ('completed', 20), ('pending', 500)]),
+            ('Kofi', 'wholesaler', False, [('completed', 100)]),
+            ('Esi', 'retailer', True, [('cancelled', 70)]),
+            ('Yaw', 'distributor', False, [('completed', 60)]),
+        ]:
+            customer = Customer.objects.create(
+                name=name, email=f'{name.lower()}@example.com', customer_type=customer_type, is_blacklisted=blacklisted,
+            )
+            for sale_status, total in totals:
+                Sale.objects.create(customer=customer, total=total, status=sale_status)
+            self.customers[name] = customer
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='finance', password='finance'))
+
+    def names(self, **filters):
+        return [row['customer_name'] for row in self.service.balances(**filters)]
+
+    def test_balances_count_completed_sales_only(self):
+        rows = list(self.service.balances())
+        self.assertEqual([(row['customer_name'], row['balance']) for row in rows], [
+            ('Kofi', 100), ('Ama', 60), ('Yaw', 60), ('Esi', 0),
+        ])
+        self.assertEqual(rows[0], {
+            'customer_id': self.customers['Kofi'].id, 'customer_name': 'Kofi', 'customer_type': 'wholesaler',
+            'is_blacklisted': False, 'balance': 100,
+        })
+
+    def test_filters_and_sorting(self):
+        self.assertEqual(self.names(customer_type='retailer'), ['Ama', 'Esi'])
+        self.assertEqual(self.names(blacklisted=True), ['Esi'])
+        self.assertEqual(self.names(blacklisted=False, min_balance=60), ['Kofi', 'Ama', 'Yaw'])
+        self.assertEqual(self.names(sort='name'), ['Ama', 'Esi', 'Kofi', 'Yaw'])
+        self.assertEqual(self.names(sort='-customer_type'), ['Kofi', 'Ama', 'Esi', 'Yaw'])
+        self.assertEqual(self.names(sort='balance'), ['Esi', 'Ama', 'Yaw', 'Kofi'])
+        with self.assertRaises(ValueError):
+            self.service.balances(sort='email')
+
+    def test_view_pages_and_validates(self):
+        response = self.client.get('/api/reporting/dashboard/customer-balances/', {'page': 2, 'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['count'], body['page'], body['page_size']), (4, 2, 3))
+        self.assertEqual([row['customer_name'] for row in body['customer_balances']], ['Esi'])
+
+        for params in ({'sort': 'email'}, {'blacklisted': 'maybe'}, {'min_balance': 'lots'}, {'page': 'two'}):
+            response = self.client.get('/api/reporting/dashboard/customer-balances/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_csv_export_streams_the_filtered_list(self):
+        response = self.client.get(
+            '/api/reporting/dashboard/customer-balances/', {'export': 'csv', 'customer_type': 'retailer', 'page_size': 1},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        header, *rows = csv.reader(b''.join(response.streaming_content).decode().splitlines())
+        self.assertEqual(header, CustomerBalanceService.CSV_HEADER)
+        self.assertEqual([row[:4] + [Decimal(row[4])] for row in rows], [
+            [str(self.customers['Ama'].id), 'Ama', 'retailer', 'False', 60],
+            [str(self.customers['Esi'].id), 'Esi', 'retailer', 'True', 0],
+        ])
+
+
+class DashboardServiceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = DashboardService()
+        self.rep = User.objects.create_user(username='rep', password='rep')
+        self.manager = User.objects.create_user(username='boss', password='boss', role='manager')
+
+    def sell(self, total, staff=None, status='completed'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Sale.objects.create(total=total, status=status, staff=staff or self.rep)
+
+    def test_counters_follow_committed_writes(self):
+        Customer.objects.create(name='Shop', email='shop@example.com')
+        Sale.objects.create(total=10, status='completed')
+        self.assertFalse(DashboardCounter.objects.exists())
+        self.assertEqual(self.service.stats(), {'sales_count': 1, 'customer_count': 1, 'product_count': 0, 'revenue': 10})
+
+        pending = self.sell(25, status='pending')
+        self.assertEqual((self.service.stats()['sales_count'], self.service.stats()['revenue']), (2, 10))
+        pending.status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.save()
+        self.assertEqual(self.service.stats()['revenue'], 35)
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.service.stats(), {'sales_count': 1, 'customer_count': 1, 'product_count': 0, 'revenue': 10})
+
+    def test_activity_pages_by_id_and_is_scoped_to_the_actor(self):
+        sales = [self.sell(total) for total in (1, 2, 3)]
+        self.sell(4, staff=self.manager)
+
+        first = self.service.activity(self.rep, limit=2)
+        self.assertEqual([row['object_id'] for row in first['results']], [sales[2].id, sales[1].id])
+        second = self.service.activity(self.rep, before=first['next_before'], limit=2)
+        self.assertEqual([row['object_id'] for row in second['results']], [sales[0].id])
+        self.assertIsNone(second['next_before'])
+
+        self.assertEqual(len(self.service.activity(self.manager)['results']), 4)
+
+    def test_first_page_is_cached_per_user_until_new_events(self):
+        self.sell(1)
+        self.assertEqual(len(self.service.activity(self.rep)['results']), 1)
+        with self.assertNumQueries(0):
+            self.service.activity(self.rep)
+        self.assertEqual(len(self.service.activity(self.manager)['results']), 1)
+
+        self.sell(2)
+        self.assertEqual(len(self.service.activity(self.rep)['results']), 2)
+        self.assertEqual(ActivityEvent.objects.count(), 2)
+
+    def test_activity_view_rejects_bad_cursors(self):
+        client = APIClient()
+        client.force_authenticate(self.rep)
+        self.assertEqual(client.get('/api/dashboard/activity/', {'before': 'x'}).status_code, 400)
+        self.assertEqual(client.get('/api/dashboard/activity/', {'limit': 5}).json(), {'results': [], 'next_before': None})
@@ -25,5 +25,7 @@ urlpatterns = [
     path('dashboard/transactions-per-staff/', TransactionsPerStaffView.as_view(), name='dashboard-transactions-per-staff'),
     path('dashboard/customer-balances/', CustomerBalancesView.as_view(), name='dashboard-customer-balances'),
     path('powerbi/embed/', views.PowerBIEmbedAPIView.as_view(), name='powerbi-embed'),
+    path('bi/export/', views.BIExportView.as_view(), name='bi-export'),
+    path('bi/export/<slug:table>.<str:fmt>', views.BIExportView.as_view(), name='bi-export-table'),
 ]
 urlpatterns += router.urls
@@ -1,8 +1,15 @@
-from rest_framework import viewsets, permissions
+import gzip
+from decimal import Decimal, InvalidOperation
+
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.db import models
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from sales.models import Sale, Customer
 from accounting.models import LegacyTransaction
 from users.models import User
@@ -10,21 +17,58 @@ from .models import (
     Report, Survey, SurveyQuestion, SurveyResponse, SurveyAnswer,
     Route, RouteStop, RouteAssignment
 )
+from .services import bi_export_service, customer_balance_service, report_job_service
 from .serializers import (
     ReportSerializer, SurveySerializer, SurveyQuestionSerializer, SurveyResponseSerializer, SurveyAnswerSerializer,
     RouteSerializer, RouteStopSerializer, RouteAssignmentSerializer
 )
 
 class PowerBIEmbedAPIView(APIView):
+    """Embed URL of the published PowerBI report (POWERBI_EMBED_URL), and where its data feed lives"""
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        # Placeholder: In production, use PowerBI REST API to get embed token and URL
-        # Example: return Response({'embed_url': ..., 'token': ...})
         return Response({
-            'embed_url': 'https://app.powerbi.com/reportEmbed?reportId=YOUR_REPORT_ID&groupId=YOUR_GROUP_ID',
-            'token': 'DUMMY_TOKEN_FOR_DEMO'
+            'embed_url': getattr(settings, 'POWERBI_EMBED_URL', ''),
+            'export_feed': request.build_absolute_uri(reverse('bi-export')),
         })
 
+class BIExportView(APIView):
+    """
+    Incremental BI extracts. GET bi/export/ lists the tables; GET
+    bi/export/<table>.csv.gz or .ndjson returns up to ?limit= rows changed
+    after ?since=. The X-Watermark header is the next ``since``; keep
+    pulling while X-Has-More is true, and store the last watermark for the
+    next refresh.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, table=None, fmt=None):
+        if not request.user.has_module_access('powerbi'):
+            return Response({'error': 'No access to the BI export'}, status=status.HTTP_403_FORBIDDEN)
+        if table is None:
+            return Response({'tables': bi_export_service.manifest()})
+        if fmt not in bi_export_service.FORMATS:
+            return Response({'error': f"format must be one of: {', '.join(bi_export_service.FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = bi_export_service.extract(table, request.query_params.get('since'), request.query_params.get('limit'))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if fmt == 'csv.gz':
+            response = HttpResponse(bi_export_service.csv_gz(page['columns'], page['rows']), content_type=bi_export_service.FORMATS[fmt])
+        else:
+            body = bi_export_service.ndjson(page['columns'], page['rows'])
+            response = HttpResponse(content_type=bi_export_service.FORMATS[fmt])
+            if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+                body = gzip.compress(body)
+                response['Content-Encoding'] = 'gzip'
+            response.content = body
+        response['Content-Disposition'] = f'attachment; filename="{table}.{fmt}"'
+        response['X-Watermark'] = page['watermark']
+        response['X-Has-More'] = 'true' if page['has_more'] else 'false'
+        response['X-Row-Count'] = str(len(page['rows']))
+        return response
+
 class RevenueView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
@@ -54,30 +98,91 @@ class TransactionsPerStaffView(APIView):
             return Response({'transactions_per_staff': [], 'error': str(e)}, status=200)
 
 class CustomerBalancesView(APIView):
+    """
+    Completed-sales balance per customer, paged: ?page=&page_size=,
+    sort=balance|name|id|customer_type (prefix - for descending, default
+    -balance), filters customer_type=, blacklisted=true|false and
+    min_balance=. export=csv streams the full filtered list instead.
+    """
     permission_classes = [IsAuthenticated]
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+
     def get(self, request):
+        params = request.query_params
+        try:
+            blacklisted = params.get('blacklisted')
+            if blacklisted not in (None, '', 'true', 'false'):
+                raise ValueError('blacklisted must be true or false')
+            balances = customer_balance_service.balances(
+                customer_type=params.get('customer_type'),
+                blacklisted=None if not blacklisted else blacklisted == 'true',
+                min_balance=Decimal(params['min_balance']) if params.get('min_balance') else None,
+                sort=params.get('sort', '-balance'),
+            )
+            page = max(1, int(params.get('page', 1)))
+            page_size = max(1, min(int(params.get('page_size', self.PAGE_SIZE)), self.MAX_PAGE_SIZE))
+        except InvalidOperation:
+            return Response({'error': 'min_balance must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if params.get('export') == 'csv':
+            response = StreamingHttpResponse(customer_balance_service.csv_lines(balances), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="customer_balances.csv"'
+            return response
+
         try:
-            customers = Customer.objects.all()
-            result = []
-            for customer in customers:
-                sales_total = Sale.objects.filter(customer=customer, status='completed').aggregate(total=models.Sum('total'))['total']
-                if sales_total is None:
-                    sales_total = 0
-                result.append({
-                    'customer_id': customer.id,
-                    'customer_name': customer.name,
-                    'balance': sales_total
-                })
-            return Response({'customer_balances': result})
+            offset = (page - 1) * page_size
+            return Response({
+                'count': balances.count(),
+                'page': page,
+                'page_size': page_size,
+                'customer_balances': list(balances[offset:offset + page_size]),
+            })
         except Exception as e:
             import logging
             logging.exception("CustomerBalancesView error")
             return Response({'customer_balances': [], 'error': str(e)}, status=200)
 
 class ReportViewSet(viewsets.ModelViewSet):
+    """Reports requested by the current user; managers see everyone's"""
     queryset = Report.objects.all()
     serializer_class = ReportSerializer
     permission_classes = [permissions.IsAuthenticated]
+    MANAGER_ROLES = ['superadmin', 'admin', 'manager']
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_superuser or getattr(user, 'role', None) in self.MANAGER_ROLES:
+            return self.queryset
+        return self.queryset.filter(requested_by=user)
+
+    def perform_create(self, serializer):
+        serializer.save(requested_by=self.request.user)
+
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        """
+        Queue a report: {"kind": ..., "params": {...}}. Poll the returned
+        report until status is done, then fetch download/. An identical
+        request already queued or running is returned instead of a new one.
+        """
+        try:
+            report, created = report_job_service.submit(request.user, request.data.get('kind'), request.data.get('params'))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {**self.get_serializer(report).data, 'coalesced': not created},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        report = self.get_object()
+        if report.status != 'done' or not report.file:
+            return Response({'error': f'Report is {report.status}', 'status': report.status}, status=status.HTTP_409_CONFLICT)
+        return FileResponse(report.file.open('rb'), as_attachment=True, filename=report.file.name.rsplit('/', 1)[-1])
 
 class SurveyViewSet(viewsets.ModelViewSet):
     queryset = Survey.objects.all()
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planning', '0002_route_optimization_fields'),
+        ('sales', '0020_customer_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='sales_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='sales.salesorder'),
+        ),
+    ]
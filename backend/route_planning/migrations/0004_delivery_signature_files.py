@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:27
+
+import base64
+import binascii
+import gzip
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations, models, transaction
+from django.utils import timezone
+
+# Frozen copy of route_planning.signatures as of this migration
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'svg': 'image/svg+xml',
+    'txt': 'text/plain',
+}
+MEDIA_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/svg+xml': 'svg', 'text/plain': 'txt'}
+
+
+def decode_signature(payload):
+    payload = payload.strip()
+    if payload.startswith('data:'):
+        header, _, body = payload.partition(',')
+        media_type = header[5:].split(';')[0]
+        extension = MEDIA_EXTENSIONS.get(media_type)
+        if extension is None:
+            raise ValueError(f'Unsupported signature type: {media_type}')
+        if ';base64' in header:
+            try:
+                return base64.b64decode(body, validate=True), extension
+            except binascii.Error:
+                raise ValueError('Signature is not valid base64')
+        return body.encode('utf-8'), extension
+    return payload.encode('utf-8'), 'svg' if payload.startswith('<svg') else 'txt'
+
+
+def save_signature(tracking_number, payload):
+    content, extension = decode_signature(payload)
+    name = f'delivery_signatures/{timezone.now():%Y/%m}/{tracking_number}.{extension}.gz'
+    return default_storage.save(name, ContentFile(gzip.compress(content)))
+
+
+def read_signature(name):
+    with default_storage.open(name, 'rb') as handle:
+        content = gzip.decompress(handle.read())
+    extension = name.rsplit('.', 2)[-2]
+    return content, CONTENT_TYPES.get(extension, 'application/octet-stream')
+
+
+def move_inline_signatures(apps, schema_editor):
+    Delivery = apps.get_model('route_planning', 'Delivery')
+    batch = []
+    for delivery in Delivery.objects.exclude(signature='').only('id', 'tracking_number', 'signature').iterator(chunk_size=500):
+        try:
+            delivery.signature_file = save_signature(delivery.tracking_number, delivery.signature)
+        except ValueError:
+            continue  # unreadable payloads stay inline
+        delivery.signature = ''
+        batch.append(delivery)
+        if len(batch) == 500:
+            Delivery.objects.bulk_update(batch, ['signature', 'signature_file'])
+            batch = []
+    Delivery.objects.bulk_update(batch, ['signature', 'signature_file'])
+
+
+def restore_inline_signatures(apps, schema_editor):
+    """Read signature files back into the text column as base64 data URLs, which decode to the same bytes"""
+    Delivery = apps.get_model('route_planning', 'Delivery')
+    batch, names = [], []
+    deliveries = Delivery.objects.exclude(signature_file__isnull=True).exclude(signature_file='')
+    for delivery in deliveries.only('id', 'signature', 'signature_file').iterator(chunk_size=500):
+        name = delivery.signature_file.name
+        try:
+            content, content_type = read_signature(name)
+        except (OSError, EOFError, gzip.BadGzipFile):
+            continue  # a missing or damaged file has nothing to restore
+        delivery.signature = f'data:{content_type};base64,{base64.b64encode(content).decode()}'
+        delivery.signature_file = None
+        batch.append(delivery)
+        names.append(name)
+        if len(batch) == 500:
+            Delivery.objects.bulk_update(batch, ['signature', 'signature_file'])
+            batch = []
+    Delivery.objects.bulk_update(batch, ['signature', 'signature_file'])
+    # Only drop the files once the rows no longer point at them
+    transaction.on_commit(
+        lambda: [default_storage.delete(name) for name in names], using=schema_editor.connection.alias,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_planning', '0003_delivery_sales_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='signature_file',
+            field=models.FileField(blank=True, null=True, upload_to='delivery_signatures/'),
+        ),
+        migrations.RunPython(move_inline_signatures, restore_inline_signatures),
+    ]
@@ -18,6 +18,11 @@ class Route(models.Model):
     vehicle = models.CharField(max_length=100, blank=True)
     start_location = models.CharField(max_length=200)
     end_location = models.CharField(max_length=200)
+    # Depot coordinates used as fixed route ends by the optimizer
+    start_latitude = models.FloatField(null=True, blank=True)
+    start_longitude = models.FloatField(null=True, blank=True)
+    end_latitude = models.FloatField(null=True, blank=True)
+    end_longitude = models.FloatField(null=True, blank=True)
     estimated_distance = models.FloatField(default=0)  # in km
     estimated_duration = models.IntegerField(default=0)  # in minutes
     actual_distance = models.FloatField(null=True, blank=True)
@@ -38,6 +43,7 @@ class Waypoint(models.Model):
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     order = models.PositiveIntegerField(default=0)
+    distance_from_previous = models.FloatField(null=True, blank=True)  # in km
     estimated_arrival = models.DateTimeField(null=True, blank=True)
     actual_arrival = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
@@ -61,13 +67,17 @@ class Delivery(models.Model):
     
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='deliveries')
     waypoint = models.ForeignKey(Waypoint, on_delete=models.CASCADE, related_name='deliveries')
+    sales_order = models.ForeignKey(
+        'sales.SalesOrder', on_delete=models.SET_NULL, null=True, blank=True, related_name='deliveries'
+    )
     tracking_number = models.CharField(max_length=100, unique=True)
     recipient_name = models.CharField(max_length=200)
     recipient_phone = models.CharField(max_length=20, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     delivery_notes = models.TextField(blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
-    signature = models.TextField(blank=True)  # Could store signature data
+    signature = models.TextField(blank=True)  # Legacy inline signatures; new ones go to signature_file
+    signature_file = models.FileField(upload_to='delivery_signatures/', null=True, blank=True)  # gzip-compressed
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -4,12 +4,14 @@ from .models import Route, Waypoint, Delivery
 class WaypointSerializer(serializers.ModelSerializer):
     class Meta:
         model = Waypoint
-        fields = ['id', 'name', 'address', 'latitude', 'longitude', 'order', 'estimated_arrival', 'actual_arrival', 'notes', 'is_completed', 'created_at']
+        fields = ['id', 'name', 'address', 'latitude', 'longitude', 'order', 'distance_from_previous', 'estimated_arrival', 'actual_arrival', 'notes', 'is_completed', 'created_at']
 
 class DeliverySerializer(serializers.ModelSerializer):
+    signature_file = serializers.FileField(read_only=True)
+
     class Meta:
         model = Delivery
-        fields = ['id', 'tracking_number', 'recipient_name', 'recipient_phone', 'status', 'delivery_notes', 'delivered_at', 'signature', 'created_at']
+        fields = ['id', 'tracking_number', 'sales_order', 'recipient_name', 'recipient_phone', 'status', 'delivery_notes', 'delivered_at', 'signature', 'signature_file', 'created_at']
 
 class RouteSerializer(serializers.ModelSerializer):
     driver_name = serializers.CharField(source='driver.username', read_only=True)
@@ -22,6 +24,7 @@ class RouteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Route
         fields = ['id', 'name', 'description', 'status', 'driver', 'driver_name', 'vehicle', 'start_location', 'end_location',
+                 'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude',
                  'estimated_distance', 'estimated_duration', 'actual_distance', 'actual_duration', 'start_time', 'end_time',
                  'created_by', 'created_by_name', 'waypoint_count', 'delivery_count', 'waypoints', 'deliveries', 'created_at', 'updated_at']
         read_only_fields = ['created_by']
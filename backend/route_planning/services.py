@@ -0,0 +1,688 @@
+import hashlib
+import logging
+import math
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from functools import partial
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from utils.geo import haversine_matrix
+from utils.stats import CachedUserStatsService
+from . import signatures
+from .models import Route, Waypoint, Delivery
+
+logger = logging.getLogger(__name__)
+
+
+class DistanceMatrixService:
+    """
+    Pairwise haversine distances between customers, waypoints, warehouses
+    and raw coordinates.
+
+    Matrices are computed in row blocks of at most ``BLOCK_CELLS`` cells so
+    large requests never materialise oversized temporaries, and kept in a
+    process-wide LRU keyed by a hash of the origin and destination
+    coordinates. A moved point changes the key, so entries never go stale
+    and need no invalidation. Cached matrices are read-only.
+    """
+
+    BLOCK_CELLS = 250_000
+    MAX_CELLS = 5_000_000
+    CACHE_SIZE = 64
+
+    SOURCES = {
+        'customers': ('sales', 'Customer'),
+        'waypoints': ('route_planning', 'Waypoint'),
+        'warehouses': ('warehouse', 'Warehouse'),
+    }
+
+    _lock = threading.Lock()
+    _cache = OrderedDict()
+
+    def matrix(self, origins, destinations):
+        """(n, m) array of km between (lat, lng) ``origins`` and ``destinations``"""
+        origins = np.round(np.asarray(origins, dtype=float).reshape(-1, 2), 6)
+        destinations = np.round(np.asarray(destinations, dtype=float).reshape(-1, 2), 6)
+        if len(origins) * len(destinations) > self.MAX_CELLS:
+            raise ValueError(f'Distance matrix is limited to {self.MAX_CELLS} cells')
+
+        digest = hashlib.sha1()
+        digest.update(np.array(origins.shape, dtype=np.int64).tobytes())
+        digest.update(origins.tobytes())
+        digest.update(destinations.tobytes())
+        key = digest.hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = np.empty((len(origins), len(destinations)))
+        step = max(1, self.BLOCK_CELLS // max(1, len(destinations)))
+        for start in range(0, len(origins), step):
+            result[start:start + step] = haversine_matrix(origins[start:start + step], destinations)
+        result.flags.writeable = False
+
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._lock:
+            cls._cache.clear()
+
+    def resolve(self, spec):
+        """
+        Turn a point spec into (labels, coordinates).
+
+        ``spec`` is either a list of ``[lat, lng]`` pairs or a dict mapping
+        ``customers``/``waypoints``/``warehouses`` to id lists; points are
+        returned in that order, ids in the order given.
+        """
+        if isinstance(spec, (list, tuple)):
+            try:
+                coordinates = [(float(lat), float(lng)) for lat, lng in spec]
+            except (TypeError, ValueError):
+                raise ValueError('Coordinates must be [latitude, longitude] pairs')
+            return [{'type': 'point', 'index': i} for i in range(len(coordinates))], coordinates
+        if not isinstance(spec, dict) or not spec:
+            raise ValueError('Points must be a list of [latitude, longitude] pairs or a dict of id lists')
+
+        labels, coordinates = [], []
+        for source, ids in spec.items():
+            if source not in self.SOURCES:
+                raise ValueError(f'Unknown point source: {source}')
+            ids = [int(pk) for pk in ids]
+            rows = {
+                pk: (name, lat, lng)
+                for pk, name, lat, lng in apps.get_model(*self.SOURCES[source]).objects.filter(
+                    id__in=ids
+                ).values_list('id', 'name', 'latitude', 'longitude')
+            }
+            missing = [pk for pk in ids if pk not in rows or rows[pk][1] is None or rows[pk][2] is None]
+            if missing:
+                raise ValueError(f'{source} without coordinates: {missing[:20]}')
+            for pk in ids:
+                name, lat, lng = rows[pk]
+                labels.append({'type': source[:-1], 'id': pk, 'name': name})
+                coordinates.append((lat, lng))
+        return labels, coordinates
+
+    def query(self, origins, destinations, speed_kmh=None):
+        """N×M distances between two point specs plus each origin's nearest destination"""
+        origin_labels, origin_points = self.resolve(origins)
+        destination_labels, destination_points = self.resolve(destinations)
+        if not origin_points or not destination_points:
+            raise ValueError('Origins and destinations are required')
+
+        distances = self.matrix(origin_points, destination_points)
+        nearest = distances.argmin(axis=1)
+        result = {
+            'origins': origin_labels,
+            'destinations': destination_labels,
+            'distances': np.round(distances, 3).tolist(),
+            'nearest': [
+                {'destination': int(column), 'distance': round(float(distances[row, column]), 3)}
+                for row, column in enumerate(nearest)
+            ],
+        }
+        if speed_kmh:
+            result['durations'] = np.round(distances / float(speed_kmh) * 60, 1).tolist()
+        return result
+
+
+class RouteOptimizer:
+    """
+    Orders a route's waypoints to shorten the drive.
+
+    A nearest-neighbour tour is improved with 2-opt until no reversal helps.
+    The tour runs between two fixed end nodes: the route's depot
+    coordinates, a pinned start/end waypoint, the start again for round
+    trips, or a free end (a dummy node zero km from everything). Waypoints
+    without coordinates keep their relative order after the optimized
+    stops. Per-stop distance and ETA use ``speed_kmh`` plus
+    ``service_minutes`` at every stop.
+    """
+
+    def __init__(self, speed_kmh=None, service_minutes=None):
+        self.speed_kmh = speed_kmh or getattr(settings, 'ROUTE_AVERAGE_SPEED_KMH', 40)
+        self.service_minutes = service_minutes if service_minutes is not None else getattr(
+            settings, 'ROUTE_SERVICE_MINUTES', 10
+        )
+
+    @staticmethod
+    def solve(distances, start=None, end=None):
+        """
+        Visiting order over the nodes of a square distance matrix.
+
+        ``start``/``end`` are node indices pinned to the ends of the tour
+        (``end`` may equal ``start`` for a round trip); ``None`` leaves that
+        end free. Returns the ordered node indices, the round trip's return
+        to ``start`` excluded.
+        """
+        n = len(distances)
+        if n == 0:
+            return []
+        round_trip = start is not None and end == start
+
+        # Free ends become a dummy node at zero distance from everything
+        matrix = np.zeros((n + 2, n + 2))
+        matrix[:n, :n] = distances
+        first = start if start is not None else n
+        last = n + 1 if end is None or round_trip else end
+        if round_trip:
+            matrix[n + 1, :n] = matrix[:n, n + 1] = distances[start]
+        inner = [node for node in range(n) if node not in (first, last)]
+
+        # Nearest neighbour from the start
+        path = [first]
+        remaining = np.zeros(n + 2, dtype=bool)
+        remaining[inner] = True
+        for _ in range(len(inner)):
+            row = np.where(remaining, matrix[path[-1]], np.inf)
+            node = int(np.argmin(row))
+            path.append(node)
+            remaining[node] = False
+        path.append(last)
+        path = np.array(path)
+
+        # 2-opt: reverse path[i:j+1] when d(a,c) + d(b,d) < d(a,b) + d(c,d)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, len(path) - 2):
+                a, b = path[i - 1], path[i]
+                c, d = path[i + 1:-1], path[i + 2:]
+                delta = matrix[a, c] + matrix[b, d] - matrix[a, b] - matrix[c, d]
+                j = int(np.argmin(delta))
+                if delta[j] < -1e-9:
+                    path[i:i + j + 2] = path[i:i + j + 2][::-1].copy()
+                    improved = True
+
+        return [int(node) for node in path if node < n]
+
+    def optimize(self, route, start_waypoint_id=None, end_waypoint_id=None, return_to_start=False,
+                 departure=None, save=True):
+        waypoints = list(route.waypoints.order_by('order', 'id'))
+        located, unlocated = [], []
+        for waypoint in waypoints:
+            has_position = waypoint.latitude is not None and waypoint.longitude is not None
+            (located if has_position else unlocated).append(waypoint)
+
+        nodes = [(wp.latitude, wp.longitude) for wp in located]
+        start = end = None
+        depot_start = route.start_latitude is not None and route.start_longitude is not None
+        depot_end = route.end_latitude is not None and route.end_longitude is not None
+        if start_waypoint_id:
+            start = next((i for i, wp in enumerate(located) if wp.id == int(start_waypoint_id)), None)
+            if start is None:
+                raise ValueError(f'Start waypoint {start_waypoint_id} is not a located stop on this route')
+        elif depot_start:
+            nodes.append((route.start_latitude, route.start_longitude))
+            start = len(nodes) - 1
+        if return_to_start:
+            end = start
+        elif end_waypoint_id:
+            end = next((i for i, wp in enumerate(located) if wp.id == int(end_waypoint_id)), None)
+            if end is None:
+                raise ValueError(f'End waypoint {end_waypoint_id} is not a located stop on this route')
+        elif depot_end:
+            nodes.append((route.end_latitude, route.end_longitude))
+            end = len(nodes) - 1
+
+        distances = distance_matrix_service.matrix(nodes, nodes) if nodes else np.zeros((0, 0))
+        before = self._path_length(distances, list(range(len(located))), start, end, len(located))
+        order = self.solve(distances, start, end)
+
+        schedule, total, elapsed = self.schedule(
+            distances, order, start, end, len(located), departure or route.start_time or timezone.now()
+        )
+        stops = []
+        for node, leg, arrival in schedule:
+            waypoint = located[node]
+            waypoint.distance_from_previous = round(leg, 3)
+            waypoint.estimated_arrival = arrival
+            stops.append(waypoint)
+
+        for waypoint in unlocated:
+            waypoint.distance_from_previous = None
+            waypoint.estimated_arrival = None
+        ordered = stops + unlocated
+
+        route.estimated_distance = round(total, 3)
+        route.estimated_duration = int(round(elapsed))
+        if save:
+            self._save(route, ordered)
+
+        return {
+            'route': route.id,
+            'stops': [
+                {
+                    'waypoint': waypoint.id,
+                    'name': waypoint.name,
+                    'order': index,
+                    'distance_from_previous': waypoint.distance_from_previous,
+                    'estimated_arrival': waypoint.estimated_arrival,
+                }
+                for index, waypoint in enumerate(ordered, start=1)
+            ],
+            'estimated_distance': route.estimated_distance,
+            'estimated_duration': route.estimated_duration,
+            'original_distance': round(before, 3),
+            'unlocated_stops': len(unlocated),
+        }
+
+    def schedule(self, distances, order, start, end, stop_count, departure):
+        """
+        Drive ``order`` (as returned by solve) from ``departure``.
+
+        Nodes below ``stop_count`` are stops; higher ones are depots. Returns
+        ``[(stop, leg_km, arrival)]`` in visiting order plus the total km and
+        minutes, including the drive back for round trips.
+        """
+        if end is not None and end == start and order:
+            order = order + [end]
+        # elapsed is minutes since departure on leaving the previous node
+        elapsed, total, previous = 0.0, 0.0, None
+        schedule = []
+        for node in order:
+            leg = float(distances[previous, node]) if previous is not None else 0.0
+            previous = node
+            total += leg
+            elapsed += leg / self.speed_kmh * 60
+            if node >= stop_count or (schedule and node == start):
+                continue
+            schedule.append((node, leg, departure + timedelta(minutes=elapsed)))
+            elapsed += self.service_minutes
+        return schedule, total, elapsed
+
+    @staticmethod
+    def _path_length(distances, order, start, end, located_count):
+        """Length of visiting ``order`` between the fixed ends, for comparison"""
+        path = [node for node in order if node not in (start, end)]
+        if start is not None:
+            path.insert(0, start)
+        if end is not None and (end != start or located_count):
+            path.append(end)
+        return float(sum(distances[a, b] for a, b in zip(path, path[1:])))
+
+    @staticmethod
+    @transaction.atomic
+    def _save(route, ordered):
+        # (route, order) is unique: park the rows past the current maximum first
+        offset = max([waypoint.order for waypoint in ordered] + [len(ordered)]) + 1
+        for index, waypoint in enumerate(ordered, start=1):
+            waypoint.order = offset + index
+        Waypoint.objects.bulk_update(ordered, ['order'])
+        for index, waypoint in enumerate(ordered, start=1):
+            waypoint.order = index
+        Waypoint.objects.bulk_update(ordered, ['order', 'distance_from_previous', 'estimated_arrival'])
+        Route.objects.filter(id=route.id).update(
+            estimated_distance=route.estimated_distance,
+            estimated_duration=route.estimated_duration,
+            updated_at=timezone.now(),
+        )
+
+
+class DispatchPlanner:
+    """
+    Builds a day's delivery routes for a fleet from confirmed sales orders.
+
+    Orders are grouped into one stop per customer and stops are split
+    between vehicles with the sweep method: sorted by bearing from the
+    depot (starting at the widest empty wedge) and cut into contiguous
+    sectors sized to each vehicle's capacity, so every van gets a compact
+    slice of the map. Each sector is then sequenced by RouteOptimizer and
+    written as one Route with its Waypoints and Deliveries bulk-created.
+    """
+
+    ACTIVE_DELIVERY_STATUSES = ['pending', 'in_transit', 'delivered']
+
+    def __init__(self, optimizer=None):
+        self.optimizer = optimizer or RouteOptimizer()
+
+    def pending_orders(self, day, order_ids=None):
+        """Confirmed orders up to ``day`` that are not already on a live delivery"""
+        orders = apps.get_model('sales', 'SalesOrder').objects.select_related('customer')
+        if order_ids:
+            orders = orders.filter(id__in=order_ids)
+        else:
+            day_end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+            orders = orders.filter(status='confirmed').filter(
+                Q(confirmed_at__isnull=True) | Q(confirmed_at__lt=day_end)
+            )
+        return orders.exclude(deliveries__status__in=self.ACTIVE_DELIVERY_STATUSES).order_by('id')
+
+    def plan(self, vehicles, depot, day=None, order_ids=None, departure_time=None,
+             return_to_depot=True, user=None, dry_run=False):
+        """
+        ``vehicles`` is a list of ``{'vehicle', 'driver', 'capacity'}`` dicts
+        (capacity = max stops, optional); ``depot`` a ``(lat, lng)`` pair.
+        """
+        if not vehicles:
+            raise ValueError('At least one vehicle is required')
+        if user is None and not dry_run:
+            # Routes record their creator, whose cached stats _write drops
+            raise ValueError('A user is required to create routes')
+        day = day or timezone.localdate()
+        departure = timezone.make_aware(datetime.combine(day, departure_time or time(8, 0)))
+
+        stops, unplanned = {}, []
+        for order in self.pending_orders(day, order_ids):
+            customer = order.customer
+            if customer.latitude is None or customer.longitude is None:
+                unplanned.append({'order': order.id, 'reason': 'customer has no coordinates'})
+                continue
+            stops.setdefault(customer.id, {'customer': customer, 'orders': []})['orders'].append(order)
+        stops = list(stops.values())
+
+        sectors = self._sweep(
+            np.array([(stop['customer'].latitude, stop['customer'].longitude) for stop in stops]).reshape(-1, 2),
+            depot,
+            [vehicle.get('capacity') for vehicle in vehicles],
+        )
+        assigned = set()
+        routes = []
+        for vehicle, sector in zip(vehicles, sectors):
+            if not len(sector):
+                continue
+            assigned.update(int(index) for index in sector)
+            points = [(stops[i]['customer'].latitude, stops[i]['customer'].longitude) for i in sector] + [depot]
+            distances = distance_matrix_service.matrix(points, points)
+            depot_node = len(sector)
+            end = depot_node if return_to_depot else None
+            order = self.optimizer.solve(distances, depot_node, end)
+            schedule, total, elapsed = self.optimizer.schedule(
+                distances, order, depot_node, end, len(sector), departure
+            )
+            routes.append({
+                'vehicle': vehicle,
+                'stops': [(stops[sector[node]], leg, arrival) for node, leg, arrival in schedule],
+                'distance': round(total, 3),
+                'duration': int(round(elapsed)),
+            })
+        for index, stop in enumerate(stops):
+            if index not in assigned:
+                unplanned.extend({'order': order.id, 'reason': 'no vehicle capacity left'} for order in stop['orders'])
+
+        if not dry_run:
+            self._write(routes, depot, day, departure, return_to_depot, user)
+
+        return {
+            'date': day,
+            'routes': [
+                {
+                    'route': route.get('id'),
+                    'vehicle': route['vehicle'].get('vehicle', ''),
+                    'driver': route['vehicle'].get('driver'),
+                    'stops': len(route['stops']),
+                    'orders': sum(len(stop['orders']) for stop, _, _ in route['stops']),
+                    'estimated_distance': route['distance'],
+                    'estimated_duration': route['duration'],
+                }
+                for route in routes
+            ],
+            'planned_orders': sum(
+                len(stop['orders']) for route in routes for stop, _, _ in route['stops']
+            ),
+            'unplanned': unplanned,
+        }
+
+    @staticmethod
+    def _sweep(points, depot, capacities):
+        """Split stop indices into one sector per vehicle by bearing from the depot"""
+        if not len(points):
+            return [[] for _ in capacities]
+        bearings = np.arctan2(
+            points[:, 0] - depot[0], (points[:, 1] - depot[1]) * math.cos(math.radians(depot[0]))
+        )
+        ordered = np.argsort(bearings, kind='stable')
+        gaps = np.diff(np.append(bearings[ordered], bearings[ordered[0]] + 2 * math.pi))
+        ordered = np.roll(ordered, -(int(np.argmax(gaps)) + 1))
+
+        # Water-fill: share stops evenly, smallest vehicles first, never over capacity
+        counts = [0] * len(capacities)
+        remaining = len(points)
+        by_capacity = sorted(range(len(capacities)), key=lambda i: capacities[i] or math.inf)
+        for position, vehicle in enumerate(by_capacity):
+            share = math.ceil(remaining / (len(capacities) - position))
+            counts[vehicle] = min(share, capacities[vehicle] or share)
+            remaining -= counts[vehicle]
+
+        sectors, cursor = [], 0
+        for count in counts:
+            sectors.append([int(index) for index in ordered[cursor:cursor + count]])
+            cursor += count
+        return sectors
+
+    @transaction.atomic
+    def _write(self, routes, depot, day, departure, return_to_depot, user):
+        route_objects = Route.objects.bulk_create([
+            Route(
+                name=f"{day:%Y-%m-%d} {route['vehicle'].get('vehicle') or f'Route {index}'}",
+                status='planned',
+                driver_id=route['vehicle'].get('driver'),
+                vehicle=route['vehicle'].get('vehicle', ''),
+                start_location='Depot',
+                end_location='Depot' if return_to_depot else '',
+                start_latitude=depot[0],
+                start_longitude=depot[1],
+                end_latitude=depot[0] if return_to_depot else None,
+                end_longitude=depot[1] if return_to_depot else None,
+                estimated_distance=route['distance'],
+                estimated_duration=route['duration'],
+                start_time=departure,
+                created_by=user,
+            )
+            for index, route in enumerate(routes, start=1)
+        ])
+
+        waypoints, deliveries = [], []
+        for route, route_object in zip(routes, route_objects):
+            route['id'] = route_object.id
+            for position, (stop, leg, arrival) in enumerate(route['stops'], start=1):
+                customer = stop['customer']
+                waypoint = Waypoint(
+                    route=route_object,
+                    name=customer.name,
+                    address=customer.address[:300],
+                    latitude=customer.latitude,
+                    longitude=customer.longitude,
+                    order=position,
+                    distance_from_previous=round(leg, 3),
+                    estimated_arrival=arrival,
+                )
+                waypoints.append(waypoint)
+                deliveries.extend(
+                    Delivery(
+                        route=route_object,
+                        waypoint=waypoint,
+                        sales_order=order,
+                        tracking_number=f'DLV-{day:%y%m%d}-{uuid.uuid4().hex[:10].upper()}',
+                        recipient_name=customer.name,
+                        recipient_phone=customer.phone,
+                    )
+                    for order in stop['orders']
+                )
+        Waypoint.objects.bulk_create(waypoints, batch_size=1000)
+        Delivery.objects.bulk_create(deliveries, batch_size=1000)
+        # bulk_create skips post_save, so drop the dispatcher's cached stats directly
+        transaction.on_commit(partial(RouteStatsService.invalidate, user.id))
+
+
+class DeliveryUpdateService:
+    """
+    Applies a driver's batch of stop and delivery updates to one route.
+
+    Waypoints and deliveries are written with one bulk_update each and new
+    signatures go to gzip-compressed files instead of the inline text
+    column. Route actuals are advanced incrementally: each newly completed
+    stop adds the leg from the previous completed stop (or the depot), or
+    the driver-reported ``distance_km`` when given, and actual_duration
+    tracks the latest arrival since the route started.
+    """
+
+    DELIVERY_STATUSES = {choice for choice, _ in Delivery.STATUS_CHOICES}
+
+    @transaction.atomic
+    def apply(self, route_id, waypoint_updates=(), delivery_updates=()):
+        route = Route.objects.select_for_update().get(id=route_id)
+        now = timezone.now()
+
+        waypoints = route.waypoints.in_bulk([int(update['id']) for update in waypoint_updates])
+        newly_completed = []
+        for update in waypoint_updates:
+            waypoint = waypoints.get(int(update['id']))
+            if waypoint is None:
+                raise ValueError(f"Waypoint {update['id']} is not on route {route.id}")
+            reported = update.get('distance_km')
+            reported = float(reported) if reported not in (None, '') else None
+            arrived_at = self._parse_time(update.get('arrived_at')) or waypoint.actual_arrival or now
+            if update.get('notes') is not None:
+                waypoint.notes = update['notes']
+            if update.get('completed', True) and not waypoint.is_completed:
+                waypoint.is_completed = True
+                waypoint.actual_arrival = arrived_at
+                newly_completed.append((waypoint, reported))
+            elif 'arrived_at' in update:
+                waypoint.actual_arrival = arrived_at
+        Waypoint.objects.bulk_update(waypoints.values(), ['is_completed', 'actual_arrival', 'notes'])
+
+        deliveries = self._apply_deliveries(route, delivery_updates, now)
+        self._advance_actuals(route, newly_completed, now)
+
+        return {
+            'route': route.id,
+            'status': route.status,
+            'waypoints_completed': len(newly_completed),
+            'deliveries_updated': deliveries,
+            'actual_distance': route.actual_distance,
+            'actual_duration': route.actual_duration,
+        }
+
+    def _apply_deliveries(self, route, updates, now):
+        by_id = {int(update['id']): update for update in updates if update.get('id')}
+        by_tracking = {update['tracking_number']: update for update in updates if not update.get('id')}
+        deliveries = list(route.deliveries.filter(Q(id__in=by_id) | Q(tracking_number__in=by_tracking)))
+        if len(deliveries) != len(by_id) + len(by_tracking):
+            raise ValueError(f'Some deliveries are not on route {route.id}')
+
+        files = []
+        for delivery in deliveries:
+            update = by_id.get(delivery.id) or by_tracking[delivery.tracking_number]
+            if update.get('status'):
+                if update['status'] not in self.DELIVERY_STATUSES:
+                    raise ValueError(f"Invalid delivery status: {update['status']}")
+                delivery.status = update['status']
+            if delivery.status == 'delivered':
+                delivery.delivered_at = self._parse_time(update.get('delivered_at')) or delivery.delivered_at or now
+            if update.get('notes') is not None:
+                delivery.delivery_notes = update['notes']
+            if update.get('signature'):
+                name, data = signatures.prepare(delivery.tracking_number, update['signature'])
+                files.append((name, data))
+                delivery.signature_file.name = name
+                delivery.signature = ''
+
+        Delivery.objects.bulk_update(
+            deliveries, ['status', 'delivered_at', 'delivery_notes', 'signature', 'signature_file']
+        )
+        # Files are stored only once the rows pointing at them commit, so a
+        # rollback here or in any enclosing transaction leaves none behind
+        for name, data in files:
+            transaction.on_commit(partial(signatures.write, name, data))
+        return len(deliveries)
+
+    def _advance_actuals(self, route, newly_completed, now):
+        fields = {}
+        if newly_completed:
+            previous = (
+                route.waypoints.filter(is_completed=True, actual_arrival__isnull=False)
+                .exclude(id__in=[waypoint.id for waypoint, _ in newly_completed])
+                .order_by('-actual_arrival')
+                .values_list('latitude', 'longitude')
+                .first()
+            )
+            if previous is None:
+                previous = (route.start_latitude, route.start_longitude)
+
+            distance = route.actual_distance or 0.0
+            for waypoint, reported in sorted(newly_completed, key=lambda item: item[0].actual_arrival):
+                position = (waypoint.latitude, waypoint.longitude)
+                if reported is not None:
+                    distance += reported
+                elif None not in previous and None not in position:
+                    distance += float(haversine_matrix([previous], [position])[0, 0])
+                if None not in position:
+                    previous = position
+            fields['actual_distance'] = route.actual_distance = round(distance, 3)
+
+            started = route.start_time or min(waypoint.actual_arrival for waypoint, _ in newly_completed)
+            latest = max(waypoint.actual_arrival for waypoint, _ in newly_completed)
+            minutes = max(0, int((latest - started).total_seconds() // 60))
+            fields['actual_duration'] = route.actual_duration = max(route.actual_duration or 0, minutes)
+
+        if route.status == 'planned':
+            fields['status'] = route.status = 'active'
+        if route.status == 'active' and not route.waypoints.filter(is_completed=False).exists():
+            fields['status'] = route.status = 'completed'
+            fields['end_time'] = route.end_time = now
+        if fields:
+            Route.objects.filter(id=route.id).update(updated_at=now, **fields)
+        if 'status' in fields:
+            transaction.on_commit(partial(RouteStatsService.invalidate, route.created_by_id))
+
+    @staticmethod
+    def _parse_time(value):
+        if not value:
+            return None
+        parsed = parse_datetime(value) if isinstance(value, str) else value
+        if parsed is None:
+            raise ValueError(f'Invalid datetime: {value}')
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class RouteStatsService(CachedUserStatsService):
+    """
+    Per-user payload for route_stats: route counts per status and the
+    user's delivery total from one query, and recent routes from a second,
+    LIMIT 5 query. Dropped early when the user's routes or deliveries
+    change (see signals.py).
+    """
+
+    CACHE_KEY = 'route_planning:stats:{user_id}'
+
+    def build(self, user):
+        routes = Route.objects.filter(created_by=user)
+        counts, distribution = self.status_counts(
+            routes, Delivery.objects.all(), 'route', [choice for choice, _ in Route.STATUS_CHOICES],
+        )
+        recent_routes = routes.order_by('-created_at')[:5].values(
+            'id', 'name', 'status', 'start_location', 'end_location', 'created_at'
+        )
+        return {
+            'total_routes': counts['total'],
+            'active_routes': counts['active'],
+            'completed_routes': counts['completed'],
+            'planned_routes': counts['planned'],
+            'total_deliveries': counts['children'],
+            'status_distribution': distribution,
+            'recent_routes': list(recent_routes),
+        }
+
+
+distance_matrix_service = DistanceMatrixService()
+delivery_update_service = DeliveryUpdateService()
+route_stats_service = RouteStatsService()
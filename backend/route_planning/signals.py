@@ -0,0 +1,21 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Route, Delivery
+from .services import RouteStatsService
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def invalidate_route_stats(sender, instance, **kwargs):
+    """Drop the owner's cached route_stats once the write is committed"""
+    transaction.on_commit(partial(RouteStatsService.invalidate, instance.created_by_id))
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def invalidate_route_stats_for_delivery(sender, instance, created=False, **kwargs):
+    # Only new or removed deliveries change the counts
+    if created or kwargs.get('signal') is post_delete:
+        owner_id = Route.objects.filter(id=instance.route_id).values_list('created_by_id', flat=True).first()
+        if owner_id:
+            transaction.on_commit(partial(RouteStatsService.invalidate, owner_id))
@@ -0,0 +1,63 @@
+"""
+Proof-of-delivery signatures stored as gzip-compressed files.
+
+Driver apps send signatures either as a data URL (``data:image/png;base64,...``)
+or as raw SVG/stroke text. The payload is decoded to its original bytes and
+gzip-compressed; stroke and SVG data typically shrink 5-10x. prepare() picks
+a unique storage name up front, so the row can point at the file before
+write() stores it once the row is committed.
+"""
+import base64
+import binascii
+import gzip
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'svg': 'image/svg+xml',
+    'txt': 'text/plain',
+}
+MEDIA_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/svg+xml': 'svg', 'text/plain': 'txt'}
+
+
+def decode(payload):
+    """Original bytes and file extension of a signature payload"""
+    payload = payload.strip()
+    if payload.startswith('data:'):
+        header, _, body = payload.partition(',')
+        media_type = header[5:].split(';')[0]
+        extension = MEDIA_EXTENSIONS.get(media_type)
+        if extension is None:
+            raise ValueError(f'Unsupported signature type: {media_type}')
+        if ';base64' in header:
+            try:
+                return base64.b64decode(body, validate=True), extension
+            except binascii.Error:
+                raise ValueError('Signature is not valid base64')
+        return body.encode('utf-8'), extension
+    return payload.encode('utf-8'), 'svg' if payload.startswith('<svg') else 'txt'
+
+
+def prepare(tracking_number, payload):
+    """(storage name, compressed bytes) of a signature, without storing it"""
+    content, extension = decode(payload)
+    name = f'delivery_signatures/{timezone.now():%Y/%m}/{tracking_number}-{uuid.uuid4().hex[:12]}.{extension}.gz'
+    return name, gzip.compress(content)
+
+
+def write(name, data, storage=default_storage):
+    """Store prepared signature bytes under their name"""
+    return storage.save(name, ContentFile(data))
+
+
+def read(name, storage=default_storage):
+    """(bytes, content type) of a stored signature"""
+    with storage.open(name, 'rb') as handle:
+        content = gzip.decompress(handle.read())
+    extension = name.rsplit('.', 2)[-2]
+    return content, CONTENT_TYPES.get(extension, 'application/octet-stream')
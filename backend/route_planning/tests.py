@@ -1,3 +1,215 @@
-from django.test import TestCase
+import base64
+import importlib
+import os
+import tempfile
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from route_planning.models import Route, Waypoint, Delivery
+from route_planning import signatures
+from route_planning.services import (
+    RouteOptimizer, DistanceMatrixService, DispatchPlanner, DeliveryUpdateService, RouteStatsService,
+)
+from sales.models import Customer, SalesOrder
+from warehouse.models import Warehouse
 
-# Create your tests here.
+User = get_user_model()
+
+class RouteOptimizerTest(TestCase):
+    def test_orders_stops_between_depots(self):
+        user = User.objects.create_user(username='driver', password='driver')
+        route = Route.objects.create(
+            name='Coast', start_location='Accra', end_location='Accra', created_by=user,
+            start_latitude=5.60, start_longitude=-0.20, end_latitude=5.60, end_longitude=-0.20,
+        )
+        # Stops east of the depot, inserted out of order, plus one without coordinates
+        for order, (name, longitude) in enumerate([('Tema', 0.00), ('Ada', 0.60), ('Prampram', 0.10), ('Aflao', 1.10)], start=1):
+            Waypoint.objects.create(route=route, name=name, address=name, latitude=5.60, longitude=longitude, order=order)
+        Waypoint.objects.create(route=route, name='Unknown', address='Unknown', order=5)
+
+        result = RouteOptimizer(speed_kmh=60, service_minutes=0).optimize(route)
+        self.assertEqual([stop['name'] for stop in result['stops']], ['Tema', 'Prampram', 'Ada', 'Aflao', 'Unknown'])
+        self.assertLess(result['estimated_distance'], result['original_distance'])
+        self.assertEqual(list(route.waypoints.order_by('order').values_list('name', flat=True))[-1], 'Unknown')
+        route.refresh_from_db()
+        self.assertAlmostEqual(route.estimated_distance, 2 * 1.30 * 110.7, delta=2)
+        self.assertEqual(route.estimated_duration, round(route.estimated_distance))
+
+
+class DistanceMatrixServiceTest(TestCase):
+    def test_customers_to_warehouses_with_cache(self):
+        accra = Warehouse.objects.create(name='Accra', code='ACC', address='Accra', latitude=5.60, longitude=-0.19)
+        kumasi = Warehouse.objects.create(name='Kumasi', code='KSI', address='Kumasi', latitude=6.69, longitude=-1.62)
+        customer = Customer.objects.create(name='Tema Pharmacy', email='tema@example.com', latitude=5.67, longitude=-0.02)
+        service = DistanceMatrixService()
+        service.clear_cache()
+
+        result = service.query({'customers': [customer.id]}, {'warehouses': [kumasi.id, accra.id]})
+        self.assertEqual(result['nearest'][0]['destination'], 1)
+        self.assertAlmostEqual(result['distances'][0][1], 20.3, delta=0.5)
+        self.assertIs(service.matrix([[5.67, -0.02]], [[6.69, -1.62], [5.60, -0.19]]),
+                      service.matrix([[5.67, -0.02]], [[6.69, -1.62], [5.60, -0.19]]))
+
+        Customer.objects.filter(id=customer.id).update(latitude=None)
+        with self.assertRaises(ValueError):
+            service.query({'customers': [customer.id]}, {'warehouses': [accra.id]})
+
+
+class DispatchPlannerTest(TestCase):
+    def test_one_route_per_vehicle_by_sector(self):
+        dispatcher = User.objects.create_user(username='dispatch', password='dispatch')
+        drivers = [User.objects.create_user(username=f'driver{i}', password='driver') for i in range(2)]
+        depot = (5.60, -0.20)
+        # Three customers north of the depot, three south; one without coordinates
+        for index, latitude in enumerate([5.70, 5.75, 5.80, 5.50, 5.45, 5.40, None]):
+            customer = Customer.objects.create(
+                name=f'Customer {index}', email=f'c{index}@example.com',
+                latitude=latitude, longitude=-0.20 if latitude else None,
+            )
+            SalesOrder.objects.create(customer=customer, status='confirmed')
+        SalesOrder.objects.create(customer=Customer.objects.get(name='Customer 0'), status='confirmed')
+
+        vehicles = [{'vehicle': f'VAN-{i}', 'driver': driver.id} for i, driver in enumerate(drivers)]
+        result = DispatchPlanner().plan(vehicles, depot, user=dispatcher)
+
+        self.assertEqual(Route.objects.count(), 2)
+        self.assertEqual(Waypoint.objects.count(), 6)
+        self.assertEqual(Delivery.objects.count(), 7)
+        self.assertEqual(result['unplanned'], [{'order': SalesOrder.objects.get(customer__latitude__isnull=True).id, 'reason': 'customer has no coordinates'}])
+        for route in Route.objects.all():
+            latitudes = list(route.waypoints.values_list('latitude', flat=True))
+            self.assertTrue(all(lat > 5.6 for lat in latitudes) or all(lat < 5.6 for lat in latitudes))
+            self.assertEqual(latitudes, sorted(latitudes, key=lambda lat: abs(lat - 5.6)))
+
+        # Orders on live deliveries are not planned again
+        self.assertEqual(DispatchPlanner().plan(vehicles, depot, user=dispatcher, dry_run=True)['planned_orders'], 0)
+
+    def test_plan_without_user(self):
+        driver = User.objects.create_user(username='driver', password='driver')
+        customer = Customer.objects.create(name='Customer', email='c@example.com', latitude=5.70, longitude=-0.20)
+        SalesOrder.objects.create(customer=customer, status='confirmed')
+
+        vehicles = [{'vehicle': 'VAN-0', 'driver': driver.id}]
+
+        self.assertEqual(DispatchPlanner().plan(vehicles, (5.60, -0.20), dry_run=True)['planned_orders'], 1)
+        with self.assertRaises(ValueError):
+            DispatchPlanner().plan(vehicles, (5.60, -0.20))
+        self.assertFalse(Route.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DeliveryUpdateServiceTest(TestCase):
+    def test_batch_update_advances_actuals_and_stores_signature(self):
+        user = User.objects.create_user(username='driver', password='driver')
+        route = Route.objects.create(
+            name='Coast', start_location='Accra', end_location='Accra', created_by=user,
+            start_latitude=5.60, start_longitude=-0.20, start_time='2026-01-05T08:00:00Z',
+        )
+        stops = [
+            Waypoint.objects.create(route=route, name=name, address=name, latitude=5.60, longitude=longitude, order=order)
+            for order, (name, longitude) in enumerate([('Tema', -0.10), ('Ada', 0.00)], start=1)
+        ]
+        delivery = Delivery.objects.create(route=route, waypoint=stops[0], tracking_number='DLV-1', recipient_name='Tema')
+        svg = '<svg><path d="M0 0 L10 10"/></svg>' * 20
+        service = DeliveryUpdateService()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = service.apply(
+                route.id,
+                waypoint_updates=[{'id': stops[0].id, 'arrived_at': '2026-01-05T08:30:00Z'}],
+                delivery_updates=[{'tracking_number': 'DLV-1', 'status': 'delivered', 'signature': 'data:image/svg+xml;base64,' + base64.b64encode(svg.encode()).decode()}],
+            )
+        self.assertEqual(result['status'], 'active')
+        self.assertAlmostEqual(result['actual_distance'], 11.1, delta=0.2)
+        self.assertEqual(result['actual_duration'], 30)
+        delivery.refresh_from_db()
+        self.assertTrue(delivery.signature_file.name.endswith('.svg.gz'))
+        self.assertEqual(signatures.read(delivery.signature_file.name), (svg.encode(), 'image/svg+xml'))
+
+        # Re-sending a completed stop does not double count; the last stop completes the route
+        result = service.apply(route.id, waypoint_updates=[
+            {'id': stops[0].id}, {'id': stops[1].id, 'arrived_at': '2026-01-05T09:00:00Z', 'distance_km': 12.5},
+        ])
+        self.assertEqual(result['status'], 'completed')
+        self.assertAlmostEqual(result['actual_distance'], 23.6, delta=0.2)
+        self.assertEqual(result['actual_duration'], 60)
+
+    def test_rolled_back_updates_store_no_signature_files(self):
+        user = User.objects.create_user(username='driver', password='driver')
+        route = Route.objects.create(name='Coast', start_location='Accra', end_location='Accra', created_by=user)
+        stop = Waypoint.objects.create(route=route, name='Tema', address='Tema', order=1)
+        for number in (1, 2):
+            Delivery.objects.create(route=route, waypoint=stop, tracking_number=f'DLV-{number}', recipient_name='Tema')
+        signed = {'tracking_number': 'DLV-1', 'signature': '<svg/>'}
+        service = DeliveryUpdateService()
+
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            # A bad update after a signature
+            with self.assertRaises(ValueError):
+                service.apply(route.id, delivery_updates=[signed, {'tracking_number': 'DLV-2', 'status': 'lost'}])
+            # A failure after the update, in the caller's transaction
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                service.apply(route.id, delivery_updates=[signed])
+                raise RuntimeError
+            self.assertEqual(callbacks, [])
+            self.assertFalse(any(files for _, _, files in os.walk(settings.MEDIA_ROOT)))
+
+            # Until the file is written the download says so instead of failing
+            Delivery.objects.filter(tracking_number='DLV-1').update(signature_file='delivery_signatures/missing.svg.gz')
+            client = APIClient()
+            client.force_authenticate(user)
+            delivery = Delivery.objects.get(tracking_number='DLV-1')
+            self.assertEqual(client.get(f'/api/route-planning/deliveries/{delivery.id}/signature/').status_code, 404)
+
+    def test_signature_migration_round_trip_and_unreadable_inline_signature(self):
+        migration = importlib.import_module('route_planning.migrations.0004_delivery_signature_files')
+        user = User.objects.create_user(username='driver', password='driver')
+        route = Route.objects.create(name='Coast', start_location='Accra', end_location='Accra', created_by=user)
+        stop = Waypoint.objects.create(route=route, name='Tema', address='Tema', order=1)
+        svg = '<svg><path d="M0 0 L10 10"/></svg>'
+        signed = Delivery.objects.create(route=route, waypoint=stop, tracking_number='DLV-1', recipient_name='Tema', signature=svg)
+        broken = Delivery.objects.create(
+            route=route, waypoint=stop, tracking_number='DLV-2', recipient_name='Tema', signature='data:image/png;base64,@@@',
+        )
+
+        migration.move_inline_signatures(apps, None)
+        signed.refresh_from_db()
+        self.assertEqual((signed.signature, signatures.read(signed.signature_file.name)), ('', (svg.encode(), 'image/svg+xml')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            migration.restore_inline_signatures(apps, connection.schema_editor())
+        signed.refresh_from_db()
+        self.assertFalse(signed.signature_file)
+        self.assertEqual(signatures.decode(signed.signature), (svg.encode(), 'svg'))
+
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get(f'/api/route-planning/deliveries/{signed.id}/signature/').content, svg.encode())
+        self.assertEqual(client.get(f'/api/route-planning/deliveries/{broken.id}/signature/').status_code, 400)
+
+
+class RouteStatsServiceTest(TestCase):
+    def test_counts_in_one_query_and_cache_per_user(self):
+        user = User.objects.create_user(username='dispatch', password='dispatch')
+        other = User.objects.create_user(username='other', password='other')
+        for index, status in enumerate(['planned', 'planned', 'active', 'completed']):
+            route = Route.objects.create(name=f'R{index}', start_location='A', end_location='B', status=status, created_by=user)
+            stop = Waypoint.objects.create(route=route, name='Stop', address='Stop', order=1)
+            for number in range(index):
+                Delivery.objects.create(route=route, waypoint=stop, tracking_number=f'T{index}-{number}', recipient_name='X')
+        Route.objects.create(name='Other', start_location='A', end_location='B', created_by=other)
+
+        service = RouteStatsService()
+        with self.assertNumQueries(2):
+            stats = service.build(user)
+        self.assertEqual(stats['total_routes'], 4)
+        self.assertEqual(stats['planned_routes'], 2)
+        self.assertEqual(stats['total_deliveries'], 6)
+        self.assertEqual(stats['status_distribution'][0], {'status': 'planned', 'count': 2})
+
+        service.get(user)
+        with self.assertNumQueries(0):
+            service.get(user)
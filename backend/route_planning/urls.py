@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (
-    RouteListCreateView, RouteDetailView, route_stats, create_route, add_waypoint
+    RouteListCreateView, RouteDetailView, route_stats, create_route, add_waypoint,
+    optimize_route, distance_matrix, plan_dispatch, update_route_progress, delivery_signature
 )
 
 urlpatterns = [
@@ -9,4 +10,9 @@ urlpatterns = [
     path('stats/', route_stats, name='route-stats'),
     path('create/', create_route, name='create-route'),
     path('waypoints/add/', add_waypoint, name='add-waypoint'),
+    path('<int:route_id>/optimize/', optimize_route, name='optimize-route'),
+    path('distance-matrix/', distance_matrix, name='distance-matrix'),
+    path('dispatch/plan/', plan_dispatch, name='plan-dispatch'),
+    path('<int:route_id>/progress/', update_route_progress, name='update-route-progress'),
+    path('deliveries/<int:delivery_id>/signature/', delivery_signature, name='delivery-signature'),
 ]
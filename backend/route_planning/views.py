@@ -1,9 +1,18 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Count, Avg
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from datetime import date, time
+from warehouse.models import Warehouse
 from .models import Route, Waypoint, Delivery
 from .serializers import RouteSerializer, WaypointSerializer, DeliverySerializer
+from . import signatures
+from .services import (
+    RouteOptimizer, DispatchPlanner, distance_matrix_service, delivery_update_service, route_stats_service
+)
+
+User = get_user_model()
 
 class RouteListCreateView(generics.ListCreateAPIView):
     serializer_class = RouteSerializer
@@ -21,31 +30,7 @@ class RouteDetailView(generics.RetrieveUpdateDestroyAPIView):
 @permission_classes([permissions.IsAuthenticated])
 def route_stats(request):
     """Get route planning statistics for dashboard"""
-    user_routes = Route.objects.filter(created_by=request.user)
-    total_routes = user_routes.count()
-    active_routes = user_routes.filter(status='active').count()
-    completed_routes = user_routes.filter(status='completed').count()
-    total_deliveries = Delivery.objects.filter(route__created_by=request.user).count()
-    
-    # Route status distribution
-    status_stats = user_routes.values('status').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Recent routes
-    recent_routes = user_routes.order_by('-created_at')[:5].values(
-        'id', 'name', 'status', 'start_location', 'end_location', 'created_at'
-    )
-    
-    return Response({
-        'total_routes': total_routes,
-        'active_routes': active_routes,
-        'completed_routes': completed_routes,
-        'planned_routes': user_routes.filter(status='planned').count(),
-        'total_deliveries': total_deliveries,
-        'status_distribution': list(status_stats),
-        'recent_routes': list(recent_routes)
-    })
+    return Response(route_stats_service.get(request.user))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -72,3 +57,134 @@ def add_waypoint(request):
             'waypoint': WaypointSerializer(waypoint).data
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def optimize_route(request, route_id):
+    """Reorder a route's waypoints to minimise distance and refresh ETAs"""
+    try:
+        route = Route.objects.get(id=route_id)
+    except Route.DoesNotExist:
+        return Response({'error': 'Route not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    speed_kmh = request.data.get('speed_kmh')
+    service_minutes = request.data.get('service_minutes')
+    try:
+        optimizer = RouteOptimizer(
+            speed_kmh=float(speed_kmh) if speed_kmh else None,
+            service_minutes=float(service_minutes) if service_minutes not in (None, '') else None,
+        )
+        result = optimizer.optimize(
+            route,
+            start_waypoint_id=request.data.get('start_waypoint'),
+            end_waypoint_id=request.data.get('end_waypoint'),
+            return_to_start=str(request.data.get('return_to_start', '')).lower() in ('1', 'true', 'yes'),
+            save=str(request.data.get('dry_run', '')).lower() not in ('1', 'true', 'yes'),
+        )
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(result)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def distance_matrix(request):
+    """
+    Haversine distances (km) between two point sets, each a list of
+    [lat, lng] pairs or {"customers"|"waypoints"|"warehouses": [ids]}
+    """
+    try:
+        result = distance_matrix_service.query(
+            request.data.get('origins'),
+            request.data.get('destinations'),
+            speed_kmh=request.data.get('speed_kmh'),
+        )
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def plan_dispatch(request):
+    """
+    Build one route per vehicle from the day's confirmed sales orders.
+    Body: vehicles [{vehicle, driver, capacity}], warehouse id or depot
+    [lat, lng], optional date, departure_time (HH:MM), order_ids,
+    return_to_depot and dry_run.
+    """
+    data = request.data
+    dry_run = data.get('dry_run') in (True, 'true', '1')
+    try:
+        if data.get('warehouse'):
+            warehouse = Warehouse.objects.filter(id=data['warehouse']).values('latitude', 'longitude').first()
+            if not warehouse or warehouse['latitude'] is None or warehouse['longitude'] is None:
+                raise ValueError('Warehouse not found or has no coordinates')
+            depot = (warehouse['latitude'], warehouse['longitude'])
+        elif data.get('depot'):
+            depot = tuple(float(value) for value in data['depot'])
+        else:
+            raise ValueError('warehouse or depot is required')
+
+        vehicles = data.get('vehicles') or []
+        drivers = {vehicle.get('driver') for vehicle in vehicles if vehicle.get('driver')}
+        if drivers - set(User.objects.filter(id__in=drivers).values_list('id', flat=True)):
+            raise ValueError('Unknown driver in vehicles')
+
+        result = DispatchPlanner().plan(
+            vehicles,
+            depot,
+            day=date.fromisoformat(data['date']) if data.get('date') else None,
+            order_ids=data.get('order_ids'),
+            departure_time=time.fromisoformat(data['departure_time']) if data.get('departure_time') else None,
+            return_to_depot=data.get('return_to_depot', True) not in (False, 'false', '0'),
+            user=request.user,
+            dry_run=dry_run,
+        )
+    except (ValueError, TypeError) as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(result, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def update_route_progress(request, route_id):
+    """
+    Batch driver update for a route.
+    Body: waypoints [{id, completed, arrived_at, distance_km, notes}],
+    deliveries [{id or tracking_number, status, delivered_at, notes, signature}]
+    """
+    try:
+        result = delivery_update_service.apply(
+            route_id,
+            waypoint_updates=request.data.get('waypoints') or [],
+            delivery_updates=request.data.get('deliveries') or [],
+        )
+    except Route.DoesNotExist:
+        return Response({'error': 'Route not found'}, status=status.HTTP_404_NOT_FOUND)
+    except (ValueError, KeyError, TypeError) as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def delivery_signature(request, delivery_id):
+    """Decompressed proof-of-delivery signature"""
+    delivery = Delivery.objects.filter(id=delivery_id).only('signature', 'signature_file').first()
+    if delivery is None:
+        return Response({'error': 'Delivery not found'}, status=status.HTTP_404_NOT_FOUND)
+    if delivery.signature_file:
+        try:
+            content, content_type = signatures.read(delivery.signature_file.name)
+        except FileNotFoundError:
+            # Files are written right after the update commits
+            return Response({'error': 'Signature file is not stored yet'}, status=status.HTTP_404_NOT_FOUND)
+    elif delivery.signature:
+        try:
+            content, extension = signatures.decode(delivery.signature)
+        except ValueError as exc:
+            # Payloads the file migration could not read are left inline as sent
+            return Response({'error': f'Stored signature is unreadable: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = signatures.CONTENT_TYPES[extension]
+    else:
+        return Response({'error': 'No signature captured'}, status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(content, content_type=content_type)
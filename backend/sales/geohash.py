@@ -0,0 +1,87 @@
+"""
+Geohash encoding and cell covering for Customer.geohash.
+
+A geohash interleaves longitude and latitude bisection bits into base32, so
+points in the same cell share a prefix and every cell is one contiguous
+range of the sorted column; a plain B-tree index answers "all customers in
+these cells" with a handful of range scans.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # ~4.8 m x 4.8 m cells
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        bounds, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (bounds[0] + bounds[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            bounds[0] = middle
+        else:
+            value *= 2
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(latitude, longitude) span in degrees of a cell at ``precision``"""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 - lon_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def successor(prefix):
+    """Smallest geohash string sorting after every string starting with ``prefix``; None if unbounded"""
+    while prefix:
+        position = BASE32.index(prefix[-1])
+        if position < len(BASE32) - 1:
+            return prefix[:-1] + BASE32[position + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def covering_cells(south, west, north, east, max_cells=24):
+    """
+    Geohash prefixes whose cells cover the bounding box, at the finest
+    precision needing at most ``max_cells`` cells. A box running past
+    longitude +/-180 wraps around to the other side of the antimeridian.
+    """
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    elif west < -180 or east > 180:
+        # Split at the antimeridian and cover each side separately
+        if west < -180:
+            sides = [(west + 360, 180.0), (-180.0, east)]
+        else:
+            sides = [(west, 180.0), (-180.0, east - 360)]
+        return sorted({
+            cell for side_west, side_east in sides
+            for cell in covering_cells(south, side_west, north, side_east, max_cells // 2)
+        })
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0 - 1e-9)
+    for precision in range(PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        rows = math.floor((north + 90) / lat_step) - math.floor((south + 90) / lat_step) + 1
+        columns = math.floor((east + 180) / lon_step) - math.floor((west + 180) / lon_step) + 1
+        if rows * columns <= max_cells:
+            break
+    else:
+        return ['']
+
+    first_lat = (math.floor((south + 90) / lat_step) + 0.5) * lat_step - 90
+    first_lon = (math.floor((west + 180) / lon_step) + 0.5) * lon_step - 180
+    return sorted({
+        encode(first_lat + row * lat_step, first_lon + column * lon_step, precision)
+        for row in range(rows)
+        for column in range(columns)
+    })
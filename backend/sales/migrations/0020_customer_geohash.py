@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:22
+
+from django.db import migrations, models
+
+from sales.geohash import encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Customer = apps.get_model('sales', 'Customer')
+    located = Customer.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    batch = []
+    for customer in located.iterator(chunk_size=2000):
+        customer.geohash = encode(customer.latitude, customer.longitude)
+        batch.append(customer)
+        if len(batch) == 2000:
+            Customer.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['geohash'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0019_alter_sale_options_alter_sale_customer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
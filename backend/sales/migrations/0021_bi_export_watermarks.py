@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_sale_updated_at(apps, schema_editor):
+    # Existing sales were last written when they were recorded
+    Sale = apps.get_model('sales', 'Sale')
+    Sale.objects.update(updated_at=models.F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0020_customer_geohash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_sale_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['updated_at', 'id'], name='sales_custo_updated_694c69_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['updated_at', 'id'], name='sales_payme_updated_15732a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['updated_at', 'id'], name='sales_sale_updated_76412c_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+
+def backfill_item_updated_at(apps, schema_editor):
+    # Existing lines were last written no later than their order
+    SalesOrder = apps.get_model('sales', 'SalesOrder')
+    SalesOrderItem = apps.get_model('sales', 'SalesOrderItem')
+    SalesOrderItem.objects.update(updated_at=models.Subquery(
+        SalesOrder.objects.filter(pk=models.OuterRef('sales_order_id')).values('updated_at')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_search_index_version'),
+        ('sales', '0021_bi_export_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesorderitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_item_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='salesorderitem',
+            index=models.Index(fields=['updated_at', 'id'], name='sales_sales_updated_962c0c_idx'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+from .geohash import encode as encode_geohash
 
 class Customer(models.Model):
     CUSTOMER_TYPE_CHOICES = [
@@ -22,6 +23,25 @@ class Customer(models.Model):
     longitude = models.FloatField(null=True, blank=True, help_text='GPS Longitude')
     location_accuracy = models.FloatField(null=True, blank=True, help_text='GPS accuracy in meters')
     location_timestamp = models.DateTimeField(null=True, blank=True, help_text='When location was captured')
+    # Derived from latitude/longitude on save; indexed for nearby-customer lookups
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Keyset order of the incremental BI export
+        indexes = [models.Index(fields=['updated_at', 'id'])]
+
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'updated_at'}
+            if {'latitude', 'longitude'} & set(update_fields):
+                kwargs['update_fields'] |= {'geohash'}
+        super().save(*args, **kwargs)
 
     def check_and_update_blacklist(self):
         # Blacklist if any unpaid sale is overdue
@@ -187,6 +207,7 @@ class Sale(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True)
     staff = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales')
     date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=50, default='pending')
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default='SLL')
@@ -197,6 +218,7 @@ class Sale(models.Model):
     
     class Meta:
         ordering = ['-date']
+        indexes = [models.Index(fields=['updated_at', 'id'])]
 
 class Promotion(models.Model):
     """Model for sales promotions with product binding and price reduction"""
@@ -361,7 +383,11 @@ class SalesOrderItem(models.Model):
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     line_total = models.DecimalField(max_digits=10, decimal_places=2)
-    
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at', 'id'])]
+
     def save(self, *args, **kwargs):
         self.line_total = self.quantity * self.unit_price
         super().save(*args, **kwargs)
@@ -520,3 +546,4 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['updated_at', 'id'])]
@@ -0,0 +1,108 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from utils.geo import EARTH_RADIUS_KM, haversine_matrix
+from . import geohash
+from .models import Customer, Sale, SalesOrder
+
+
+class CustomerLocatorService:
+    """
+    Radius and k-nearest customer lookups around a point.
+
+    Candidates come from the geohash cells covering the search circle's
+    bounding box (range scans on the indexed Customer.geohash column) and
+    are then filtered and ranked by exact haversine distance. k-nearest
+    searches widen the radius until k customers fall inside it, so the
+    result is exact rather than approximate.
+    """
+
+    MAX_RADIUS_KM = 1000
+    MAX_RESULTS = 500
+    INITIAL_KNN_RADIUS_KM = 1
+    RESULT_FIELDS = ['id', 'name', 'customer_type', 'phone', 'address', 'latitude', 'longitude', 'is_blacklisted']
+
+    def within(self, latitude, longitude, radius_km, limit=MAX_RESULTS, queryset=None):
+        """Customers within ``radius_km`` of the point, nearest first, at most ``limit``"""
+        radius_km = float(radius_km)
+        if not 0 < radius_km <= self.MAX_RADIUS_KM:
+            raise ValueError(f'radius must be between 0 and {self.MAX_RADIUS_KM} km')
+        # The nearest ``limit`` inside the radius; dense areas never scan the whole circle
+        return self.nearest(latitude, longitude, k=limit, max_radius_km=radius_km, queryset=queryset)
+
+    def nearest(self, latitude, longitude, k=20, max_radius_km=MAX_RADIUS_KM, queryset=None):
+        """The ``k`` customers nearest the point, no further than ``max_radius_km``"""
+        latitude, longitude = self._validate(latitude, longitude)
+        k = max(1, min(int(k), self.MAX_RESULTS))
+        max_radius_km = min(float(max_radius_km), self.MAX_RADIUS_KM)
+        radius = min(self.INITIAL_KNN_RADIUS_KM, max_radius_km)
+        while True:
+            ids, distances = self._candidates(latitude, longitude, radius, queryset)
+            inside = distances <= radius
+            if inside.sum() >= k or radius >= max_radius_km:
+                return self._rows(ids[inside], distances[inside], k)
+            radius = min(radius * 3, max_radius_km)
+
+    def unvisited(self, user, days):
+        """Customers without a sale or sales order by ``user`` in the last ``days`` days"""
+        since = timezone.now() - timedelta(days=int(days))
+        return Customer.objects.exclude(
+            id__in=Sale.objects.filter(staff=user, date__gte=since, customer__isnull=False).values('customer_id')
+        ).exclude(
+            id__in=SalesOrder.objects.filter(sales_agent=user, created_at__gte=since).values('customer_id')
+        )
+
+    def _validate(self, latitude, longitude):
+        latitude, longitude = float(latitude), float(longitude)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError('Coordinates out of range')
+        return latitude, longitude
+
+    def _candidates(self, latitude, longitude, radius_km, queryset):
+        angle = radius_km / EARTH_RADIUS_KM
+        lat_delta = math.degrees(angle)
+        if abs(latitude) + lat_delta >= 90:
+            lon_delta = 180.0
+        else:
+            lon_delta = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+        cells = geohash.covering_cells(
+            latitude - lat_delta, longitude - lon_delta, latitude + lat_delta, longitude + lon_delta
+        )
+        # Cells adjacent in geohash order collapse into one range scan
+        ranges = []
+        for cell in cells:
+            if ranges and ranges[-1][1] == cell:
+                ranges[-1][1] = geohash.successor(cell)
+            else:
+                ranges.append([cell, geohash.successor(cell)])
+        match = Q()
+        for lower, upper in ranges:
+            bounds = Q(geohash__gte=lower) if lower else ~Q(geohash='')
+            if upper:
+                bounds &= Q(geohash__lt=upper)
+            match |= bounds
+
+        queryset = Customer.objects.all() if queryset is None else queryset
+        rows = np.array(
+            list(queryset.filter(match).values_list('id', 'latitude', 'longitude')), dtype=float
+        ).reshape(-1, 3)
+        distances = haversine_matrix([(latitude, longitude)], rows[:, 1:])[0]
+        return rows[:, 0].astype(int), distances
+
+    def _rows(self, ids, distances, limit):
+        order = np.argsort(distances, kind='stable')[:limit]
+        ranked = [(int(ids[i]), float(distances[i])) for i in order]
+        rows = {
+            row['id']: row
+            for row in Customer.objects.filter(id__in=[pk for pk, _ in ranked]).values(*self.RESULT_FIELDS)
+        }
+        for pk, distance in ranked:
+            rows[pk]['distance_km'] = round(distance, 3)
+        return [rows[pk] for pk, _ in ranked]
+
+
+customer_locator = CustomerLocatorService()
@@ -0,0 +1,146 @@
+import itertools
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from sales import geohash
+from sales.models import Customer, Sale, SalesOrder
+from sales.services import CustomerLocatorService
+from utils.geo import haversine_matrix
+
+User = get_user_model()
+
+class GeohashTest(SimpleTestCase):
+    def covered(self, latitude, longitude, cells):
+        cell = geohash.encode(latitude, longitude)
+        return any(cell.startswith(prefix) for prefix in cells)
+
+    def test_encode(self):
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash.encode(0, 0, 1), 's')
+        self.assertEqual(geohash.encode(-0.000001, -0.000001, 1), '7')
+        self.assertEqual(geohash.encode(-90, -180), '0' * geohash.PRECISION)
+        self.assertEqual(geohash.encode(90, 180), 'z' * geohash.PRECISION)
+        self.assertEqual(geohash.cell_size(1), (45.0, 45.0))
+        self.assertEqual(geohash.cell_size(2), (5.625, 11.25))
+
+    def test_successor(self):
+        self.assertEqual(geohash.successor('u4p'), 'u4q')
+        self.assertEqual(geohash.successor('bz'), 'c')
+        self.assertEqual(geohash.successor('ezz'), 'f')
+        self.assertIsNone(geohash.successor('zz'))
+        self.assertIsNone(geohash.successor(''))
+        # Everything under a prefix sorts between it and its successor
+        for cell in ('s', 'sz', 'szzzzzzzz'):
+            self.assertTrue('s' <= cell < geohash.successor('s'))
+
+    def test_covering_cells_cover_the_box(self):
+        lat_step, lon_step = geohash.cell_size(5)
+        boxes = [
+            (8.40, -13.30, 8.50, -13.10),
+            # Edges exactly on cell boundaries, and a box inside a single cell
+            (lat_step * 10, lon_step * 10, lat_step * 12, lon_step * 12),
+            (0.0, 0.0, 1e-6, 1e-6),
+            (-1.0, -1.0, 1.0, 1.0),
+            (89.5, 170.0, 90.0, 180.0),
+            (-90.0, -180.0, -89.5, -170.0),
+        ]
+        for south, west, north, east in boxes:
+            cells = geohash.covering_cells(south, west, north, east)
+            self.assertLessEqual(len(cells), 24)
+            for fraction_lat, fraction_lon in itertools.product((0, 0.25, 0.5, 0.999999, 1), repeat=2):
+                latitude = south + (north - south) * fraction_lat
+                longitude = west + (east - west) * fraction_lon
+                self.assertTrue(self.covered(latitude, longitude, cells), (latitude, longitude, cells))
+
+    def test_covering_cells_wrap_around_the_antimeridian(self):
+        cells = geohash.covering_cells(-1.0, 179.5, 1.0, 180.5)
+        for longitude in (179.5, 179.99, 180.0, -180.0, -179.9, -179.5):
+            self.assertTrue(self.covered(0.5, longitude, cells), longitude)
+        self.assertFalse(self.covered(0.5, 178.0, cells))
+        self.assertFalse(self.covered(0.5, -178.0, cells))
+        self.assertEqual(cells, geohash.covering_cells(-1.0, -180.5, 1.0, -179.5))
+        self.assertEqual(geohash.covering_cells(-90, -360, 90, 360), [''])
+
+    def test_haversine_matrix(self):
+        distances = haversine_matrix([(0, 0), (0, 179.5)], [(0, 1), (0, -179.5)])
+        self.assertEqual(distances.shape, (2, 2))
+        self.assertAlmostEqual(distances[0, 0], 111.195, places=2)
+        self.assertAlmostEqual(distances[1, 1], 111.195, places=2)
+
+
+class CustomerLocatorServiceTest(TestCase):
+    def setUp(self):
+        self.service = CustomerLocatorService()
+        self.rep = User.objects.create_user(username='rep', password='rep')
+
+    def customer(self, name, latitude, longitude, **fields):
+        return Customer.objects.create(name=name, email=f'{name}@example.com', latitude=latitude, longitude=longitude, **fields)
+
+    def names(self, rows):
+        return [row['name'] for row in rows]
+
+    def test_within_spans_cell_edges_nearest_first(self):
+        # The equator and prime meridian are edges of cells at every precision
+        self.customer('north', 0.001, 0.0)
+        self.customer('south', -0.002, 0.0)
+        self.customer('west', 0.0, -0.003)
+        self.customer('far', 0.0, 0.5)
+        self.customer('nowhere', None, None)
+
+        rows = self.service.within(0.0, 0.0, 1)
+        self.assertEqual(self.names(rows), ['north', 'south', 'west'])
+        self.assertEqual([row['distance_km'] for row in rows], [0.111, 0.222, 0.334])
+        self.assertEqual(self.names(self.service.within(0.0, 0.0, 1, limit=2)), ['north', 'south'])
+        self.assertEqual(self.names(self.service.within(0.0, 0.0, 60)), ['north', 'south', 'west', 'far'])
+
+    def test_lookups_cross_the_antimeridian(self):
+        self.customer('east', 0.0, 179.999)
+        self.customer('west', 0.0, -179.995)
+        self.customer('home', 0.0, 178.0)
+
+        self.assertEqual(self.names(self.service.within(0.0, 179.999, 5)), ['east', 'west'])
+        self.assertEqual(self.names(self.service.within(0.0, -179.996, 5)), ['west', 'east'])
+        self.assertEqual(self.names(self.service.nearest(0.0, -180.0, k=3)), ['east', 'west', 'home'])
+
+    def test_nearest_widens_until_k_and_respects_the_cap(self):
+        for index, offset in enumerate((0.01, 0.1, 1.0)):
+            self.customer(f'c{index}', 8.0 + offset, -13.0)
+        self.assertEqual(self.names(self.service.nearest(8.0, -13.0, k=2)), ['c0', 'c1'])
+        self.assertEqual(self.names(self.service.nearest(8.0, -13.0, k=3, max_radius_km=50)), ['c0', 'c1'])
+        with self.assertRaises(ValueError):
+            self.service.within(8.0, -13.0, 0)
+        with self.assertRaises(ValueError):
+            self.service.nearest(91, 0)
+
+    def test_unvisited(self):
+        sold, ordered, idle = (self.customer(name, 8.0, -13.0) for name in ('sold', 'ordered', 'idle'))
+        Sale.objects.create(customer=sold, staff=self.rep, total=1, status='completed')
+        SalesOrder.objects.create(customer=ordered, sales_agent=self.rep)
+        stale = Sale.objects.create(customer=idle, staff=self.rep, total=1, status='completed')
+        Sale.objects.filter(pk=stale.pk).update(date=timezone.now() - timedelta(days=40))
+
+        self.assertEqual(list(self.service.unvisited(self.rep, 30)), [idle])
+        self.assertEqual(list(self.service.unvisited(self.rep, 60)), [])
+
+    def test_nearby_action(self):
+        near = self.customer('near', 8.001, -13.0, customer_type='wholesaler')
+        self.customer('retail', 8.002, -13.0)
+        self.customer('visited', 8.003, -13.0, customer_type='wholesaler')
+        Sale.objects.create(customer=Customer.objects.get(name='visited'), staff=self.rep, total=1, status='completed')
+        client = APIClient()
+        client.force_authenticate(self.rep)
+
+        def nearby(**params):
+            return client.get('/api/sales/customers/nearby/', {'lat': 8.0, 'lng': -13.0, **params})
+
+        self.assertEqual(self.names(nearby(radius=1).json()['customers']), ['near', 'retail', 'visited'])
+        self.assertEqual(self.names(nearby(k=1).json()['customers']), ['near'])
+        self.assertEqual(
+            self.names(nearby(radius=1, customer_type='wholesaler', unvisited_days=7).json()['customers']), ['near'],
+        )
+        self.assertEqual(self.names(nearby(k=5, exclude=f'{near.id}').json()['customers']), ['retail', 'visited'])
+        self.assertEqual(nearby().status_code, 400)
+        self.assertEqual(nearby(radius=5000).status_code, 400)
+        self.assertEqual(client.get('/api/sales/customers/nearby/', {'radius': 1}).status_code, 400)
@@ -13,6 +13,7 @@ from .serializers import (
     LeadSerializer, SaleSerializer, PromotionSerializer, PromotionProductSerializer,
     SalesOrderSerializer, SalesOrderItemSerializer, FinanceTransactionSerializer, PaymentSerializer
 )
+from .services import CustomerLocatorService, customer_locator
 
 class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all().order_by('-id')  # Show all customers for all regions, newest first
@@ -60,6 +61,48 @@ class CustomerViewSet(viewsets.ModelViewSet):
             else:
                 return Response(approval_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Customers around a point: ?lat=&lng=&radius=<km> for everyone in
+        range, ?k=<n> for the n nearest (optionally capped by radius).
+        unvisited_days=<d> skips customers the caller sold to in the last d
+        days; exclude=<id,id> and customer_type narrow further.
+        """
+        params = request.query_params
+        try:
+            latitude, longitude = params['lat'], params['lng']
+        except KeyError:
+            return Response({'error': 'lat and lng are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            queryset = Customer.objects.all()
+            if params.get('unvisited_days'):
+                queryset = customer_locator.unvisited(request.user, params['unvisited_days'])
+            if params.get('exclude'):
+                queryset = queryset.exclude(id__in=[int(pk) for pk in params['exclude'].split(',') if pk])
+            if params.get('customer_type'):
+                queryset = queryset.filter(customer_type=params['customer_type'])
+
+            if params.get('k'):
+                customers = customer_locator.nearest(
+                    latitude, longitude, k=params['k'],
+                    max_radius_km=params.get('radius') or CustomerLocatorService.MAX_RADIUS_KM,
+                    queryset=queryset,
+                )
+            elif params.get('radius'):
+                customers = customer_locator.within(
+                    latitude, longitude, params['radius'],
+                    limit=int(params.get('limit', CustomerLocatorService.MAX_RESULTS)),
+                    queryset=queryset,
+                )
+            else:
+                return Response({'error': 'radius or k is required'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'count': len(customers), 'customers': customers})
+
 class CustomerApprovalViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing customer approval requests
@@ -0,0 +1,35 @@
+from utils.stats import CachedUserStatsService
+from .models import Survey, SurveyResponse
+
+
+class SurveyStatsService(CachedUserStatsService):
+    """
+    Per-user payload for survey_stats: survey counts per status and the
+    response total from one query, and recent surveys and responses from
+    two LIMIT queries. Dropped early when the user's surveys or their
+    responses change (see signals.py).
+    """
+
+    CACHE_KEY = 'surveys:stats:{user_id}'
+
+    def build(self, user):
+        surveys = Survey.objects.filter(created_by=user)
+        counts, distribution = self.status_counts(
+            surveys, SurveyResponse.objects.all(), 'survey', [choice for choice, _ in Survey.STATUS_CHOICES],
+        )
+        recent_surveys = surveys.order_by('-created_at')[:5].values('id', 'title', 'status', 'created_at')
+        recent_responses = SurveyResponse.objects.filter(survey__created_by=user).order_by('-submitted_at')[:10].values(
+            'id', 'survey__title', 'respondent_email', 'submitted_at', 'is_complete'
+        )
+        return {
+            'total_surveys': counts['total'],
+            'published_surveys': counts['published'],
+            'draft_surveys': counts['draft'],
+            'total_responses': counts['children'],
+            'status_distribution': distribution,
+            'recent_surveys': list(recent_surveys),
+            'recent_responses': list(recent_responses),
+        }
+
+
+survey_stats_service = SurveyStatsService()
@@ -0,0 +1,19 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Survey, SurveyResponse
+from .services import SurveyStatsService
+
+@receiver(post_save, sender=Survey)
+@receiver(post_delete, sender=Survey)
+def invalidate_survey_stats(sender, instance, **kwargs):
+    """Drop the owner's cached survey_stats once the write is committed"""
+    transaction.on_commit(partial(SurveyStatsService.invalidate, instance.created_by_id))
+
+@receiver(post_save, sender=SurveyResponse)
+@receiver(post_delete, sender=SurveyResponse)
+def invalidate_survey_stats_for_response(sender, instance, **kwargs):
+    owner_id = Survey.objects.filter(id=instance.survey_id).values_list('created_by_id', flat=True).first()
+    if owner_id:
+        transaction.on_commit(partial(SurveyStatsService.invalidate, owner_id))
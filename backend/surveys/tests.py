@@ -1,3 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Survey, SurveyResponse
+from .services import SurveyStatsService
+
+User = get_user_model()
+
+
+class SurveyStatsServiceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='research', password='research')
+        other = User.objects.create_user(username='other', password='other')
+        for index, status in enumerate(['draft', 'published', 'published', 'closed']):
+            survey = Survey.objects.create(title=f'S{index}', status=status, created_by=self.user)
+            for number in range(index):
+                SurveyResponse.objects.create(survey=survey, respondent_email=f'r{number}@example.com')
+        Survey.objects.create(title='Other', created_by=other)
+
+    def test_counts_in_one_query_and_cache_per_user(self):
+        service = SurveyStatsService()
+        with self.assertNumQueries(3):
+            stats = service.build(self.user)
+        self.assertEqual(
+            (stats['total_surveys'], stats['published_surveys'], stats['draft_surveys'], stats['total_responses']),
+            (4, 2, 1, 6),
+        )
+        self.assertEqual(stats['status_distribution'][0], {'status': 'published', 'count': 2})
+        self.assertEqual(len(stats['recent_responses']), 6)
+
+        service.get(self.user)
+        with self.assertNumQueries(0):
+            service.get(self.user)
+
+    def test_new_responses_invalidate_the_owner(self):
+        service = SurveyStatsService()
+        self.assertEqual(service.get(self.user)['total_responses'], 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            SurveyResponse.objects.create(survey=Survey.objects.get(title='S0'))
+        self.assertEqual(service.get(self.user)['total_responses'], 7)
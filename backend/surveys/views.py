@@ -1,9 +1,9 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Count
 from .models import Survey, SurveyQuestion, SurveyResponse, SurveyAnswer
 from .serializers import SurveySerializer, SurveyQuestionSerializer, SurveyResponseSerializer
+from .services import survey_stats_service
 
 class SurveyListCreateView(generics.ListCreateAPIView):
     queryset = Survey.objects.all()
@@ -38,36 +38,7 @@ class SurveyResponseListView(generics.ListAPIView):
 @permission_classes([permissions.IsAuthenticated])
 def survey_stats(request):
     """Get survey statistics for dashboard"""
-    user_surveys = Survey.objects.filter(created_by=request.user)
-    total_surveys = user_surveys.count()
-    published_surveys = user_surveys.filter(status='published').count()
-    total_responses = SurveyResponse.objects.filter(survey__created_by=request.user).count()
-    
-    # Survey status distribution
-    status_stats = user_surveys.values('status').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Recent activity
-    recent_surveys = user_surveys.order_by('-created_at')[:5].values(
-        'id', 'title', 'status', 'created_at'
-    )
-    
-    recent_responses = SurveyResponse.objects.filter(
-        survey__created_by=request.user
-    ).select_related('survey').order_by('-submitted_at')[:10].values(
-        'id', 'survey__title', 'respondent_email', 'submitted_at', 'is_complete'
-    )
-    
-    return Response({
-        'total_surveys': total_surveys,
-        'published_surveys': published_surveys,
-        'draft_surveys': user_surveys.filter(status='draft').count(),
-        'total_responses': total_responses,
-        'status_distribution': list(status_stats),
-        'recent_surveys': list(recent_surveys),
-        'recent_responses': list(recent_responses)
-    })
+    return Response(survey_stats_service.get(request.user))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
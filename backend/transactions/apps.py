@@ -5,3 +5,7 @@ class TransactionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'transactions'
     verbose_name = 'Transaction Management'
+
+    def ready(self):
+        # Import signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,113 @@
+"""
+Buffered writes for audit rows (TransactionLog, WorkflowAuditLog).
+
+Audit rows used to be written one INSERT at a time in the request path.
+``audit_log.add(row)`` instead collects them and writes each model's rows
+with a single bulk_create:
+
+* inside ``audit_log.batch()`` (every request, via AuditLogMiddleware)
+  they are written when the batch exits, in a ``finally`` so a view that
+  raises still leaves its audit trail;
+* rows added inside ``transaction.atomic`` wait on their own ``on_commit``
+  hook, so rolling back the transaction or the savepoint (nested
+  ``atomic``) they were added in drops them along with the changes they
+  describe. Within a batch the hooks only hand the rows to the batch; a
+  batch that exits inside a transaction writes them from one ``on_commit``
+  hook registered at its exit, which runs after every hook added inside it
+  and is only rolled back together with all of them;
+* anywhere else (and on commit, outside any batch) they are written
+  straight away.
+
+A failed bulk write falls back to writing rows one at a time so a single
+bad row cannot lose the rest, and audit failures are logged, never raised
+into the code being audited.
+"""
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def add(self, row):
+        """Queue an unsaved audit row for writing"""
+        state = self._state()
+        if connection.in_atomic_block:
+            hook = partial(self._commit, row) if state.depth else partial(self._write, [row])
+            transaction.on_commit(hook, robust=True)
+        elif state.depth:
+            state.batched.append(row)
+        else:
+            self._write([row])
+        return row
+
+    @contextmanager
+    def batch(self):
+        """Hold rows until the outermost batch exits (or, inside a transaction, commits)"""
+        state = self._state()
+        state.depth += 1
+        try:
+            yield self
+        finally:
+            state.depth -= 1
+            if not state.depth:
+                if connection.in_atomic_block:
+                    transaction.on_commit(self._flush, robust=True)
+                else:
+                    self._flush()
+
+    def _commit(self, row):
+        self._state().batched.append(row)
+
+    def _flush(self):
+        state = self._state()
+        rows, state.batched = state.batched, []
+        self._write(rows)
+
+    def _state(self):
+        state = self._local
+        if not hasattr(state, 'depth'):
+            state.depth = 0
+            state.batched = []
+        return state
+
+    def _write(self, rows):
+        by_model = defaultdict(list)
+        for row in rows:
+            by_model[type(row)].append(row)
+        for model, model_rows in by_model.items():
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(model_rows)
+            except DatabaseError:
+                logger.exception('Bulk write of %s %s rows failed; writing them one by one', len(model_rows), model.__name__)
+                for row in model_rows:
+                    try:
+                        with transaction.atomic():
+                            row.save()
+                    except DatabaseError:
+                        fields = {name: value for name, value in vars(row).items() if not name.startswith('_')}
+                        logger.exception('Dropped %s audit row %r', model.__name__, fields)
+
+
+audit_log = AuditLogWriter()
+
+
+class AuditLogMiddleware:
+    """Writes each request's audit rows together once the response is ready, or after an error"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit_log.batch():
+            return self.get_response(request)
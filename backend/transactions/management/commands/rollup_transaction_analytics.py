@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from transactions.services import transaction_analytics_service
+
+
+class Command(BaseCommand):
+    help = 'Roll up transactions into daily per-module TransactionAnalytics rows (only days changed since the last run).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Re-roll every day of the last N days instead of only changed days')
+
+    def handle(self, *args, **options):
+        if options['days']:
+            end = timezone.localdate()
+            start = end - timedelta(days=options['days'])
+            transaction_analytics_service.rebuild(start, end)
+            self.stdout.write(self.style.SUCCESS(f'Rolled up {start} to {end}'))
+            return
+        days = transaction_analytics_service.refresh()
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {len(days)} changed day(s)'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from transactions.services import TransactionRetryService, transaction_retry_service
+
+
+class Command(BaseCommand):
+    help = 'Retry failed transactions whose backoff has elapsed. Runs until interrupted; start several for more throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no transactions are due')
+        parser.add_argument('--sleep', type=float, default=TransactionRetryService.POLL_SECONDS,
+                            help='Seconds to wait between polls when nothing is due')
+        parser.add_argument('--batch-size', type=int, default=TransactionRetryService.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        retried = transaction_retry_service.work(
+            once=options['once'], sleep=options['sleep'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Retried {retried} transaction(s)'))
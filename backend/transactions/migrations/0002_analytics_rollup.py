@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionanalytics',
+            name='completed_transactions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transactionanalytics',
+            name='valued_transactions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['updated_at'], name='transaction_updated_468e55_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_targets(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    TransactionTarget = apps.get_model('transactions', 'TransactionTarget')
+    batch = []
+    for transaction_id, target_modules in Transaction.objects.values_list('id', 'target_modules').iterator(chunk_size=5000):
+        batch.extend(
+            TransactionTarget(transaction_id=transaction_id, module=module) for module in set(target_modules or [])
+        )
+        if len(batch) >= 5000:
+            TransactionTarget.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TransactionTarget.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_analytics_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('module', models.CharField(choices=[('sales', 'Sales'), ('inventory', 'Inventory'), ('procurement', 'Procurement'), ('manufacturing', 'Manufacturing'), ('accounting', 'Accounting'), ('hr', 'Human Resources'), ('pos', 'Point of Sale'), ('warehouse', 'Warehouse'), ('customers', 'Customers'), ('reporting', 'Reporting')], max_length=20)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='transactions.transaction')),
+            ],
+            options={
+                'db_table': 'transaction_targets',
+                'unique_together': {('module', 'transaction')},
+            },
+        ),
+        migrations.RunPython(backfill_targets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# Transaction.MAX_RETRIES as of this migration
+MAX_RETRIES = 5
+
+
+def schedule_failed_transactions(apps, schema_editor):
+    """Failed transactions have never been retried; make them due now instead of looking exhausted"""
+    Transaction = apps.get_model('transactions', 'Transaction')
+    Transaction.objects.filter(status='failed', retry_count__lt=MAX_RETRIES).update(next_retry_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_transaction_targets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'next_retry_at'], name='transaction_status_69b2da_idx'),
+        ),
+        migrations.RunPython(schedule_failed_transactions, migrations.RunPython.noop),
+    ]
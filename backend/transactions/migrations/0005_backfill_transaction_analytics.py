@@ -0,0 +1,77 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Roll up every day of history once at deploy, so the analytics endpoints
+    have rollups to serve from the first request. A frozen copy of
+    TransactionAnalyticsService.rollup_day over all days in one pass; skipped
+    when rollup_transaction_analytics has already run.
+    """
+    Transaction = apps.get_model('transactions', 'Transaction')
+    TransactionAnalytics = apps.get_model('transactions', 'TransactionAnalytics')
+    if TransactionAnalytics.objects.exists():
+        return
+
+    stats = defaultdict(lambda: {
+        'incoming': 0, 'outgoing': 0, 'value': Decimal('0'), 'valued': 0, 'completed': 0,
+        'processing': timedelta(0), 'timed': 0, 'sources': Counter(), 'targets': Counter(),
+    })
+    rows = Transaction.objects.values_list('source_module', 'target_modules', 'status', 'amount', 'created_at', 'completed_at')
+    for source, targets, status, amount, created_at, completed_at in rows.iterator(chunk_size=5000):
+        day = timezone.localtime(created_at).date()
+        targets = targets or []
+        stats[day, source]['outgoing'] += 1
+        for target in targets:
+            stats[day, target]['incoming'] += 1
+            stats[day, target]['sources'][source] += 1
+            stats[day, source]['targets'][target] += 1
+        for module in {source, *targets}:
+            module_stats = stats[day, module]
+            if amount is not None:
+                module_stats['value'] += amount
+                module_stats['valued'] += 1
+            if status == 'completed':
+                module_stats['completed'] += 1
+                if completed_at:
+                    module_stats['processing'] += completed_at - created_at
+                    module_stats['timed'] += 1
+
+    now = timezone.now()
+    rollups = []
+    for (day, module), module_stats in stats.items():
+        total = module_stats['incoming'] + module_stats['outgoing']
+        rollups.append(TransactionAnalytics(
+            module=module,
+            date=day,
+            incoming_transactions=module_stats['incoming'],
+            outgoing_transactions=module_stats['outgoing'],
+            total_transactions=total,
+            total_value=module_stats['value'],
+            average_value=(module_stats['value'] / module_stats['valued']).quantize(Decimal('0.01')) if module_stats['valued'] else 0,
+            valued_transactions=module_stats['valued'],
+            success_rate=round(Decimal(module_stats['completed'] * 100) / total, 2) if total else 0,
+            completed_transactions=module_stats['completed'],
+            average_processing_time=module_stats['processing'] / module_stats['timed'] if module_stats['timed'] else None,
+            top_sources=[{'source_module': name, 'count': count} for name, count in module_stats['sources'].most_common()],
+            top_targets=[{'module': name, 'count': count} for name, count in module_stats['targets'].most_common()],
+            created_at=now,
+            updated_at=now,
+        ))
+    TransactionAnalytics.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_transaction_retries'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_backfill_transaction_analytics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionAnalyticsDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+            ],
+            options={
+                'db_table': 'transaction_analytics_dirty_days',
+            },
+        ),
+    ]
@@ -1,8 +1,11 @@
 # transactions/models.py - Backend transaction models for ERP module integration
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from datetime import timedelta
 import json
+import random
 
 User = get_user_model()
 
@@ -49,6 +52,11 @@ class Transaction(models.Model):
         ('reporting', 'Reporting'),
     ]
 
+    # Failed transactions are retried with exponential backoff
+    MAX_RETRIES = 5
+    RETRY_BASE_DELAY = timedelta(seconds=30)
+    RETRY_MAX_DELAY = timedelta(hours=1)
+
     # Core fields
     transaction_id = models.CharField(max_length=100, unique=True, db_index=True)
     transaction_type = models.CharField(max_length=50, choices=TRANSACTION_TYPES, db_index=True)
@@ -75,6 +83,7 @@ class Transaction(models.Model):
     # Error handling
     error_message = models.TextField(blank=True)
     retry_count = models.IntegerField(default=0)
+    next_retry_at = models.DateTimeField(null=True, blank=True)  # None once retries are exhausted
     
     # Workflow tracking
     workflow_id = models.CharField(max_length=100, blank=True, db_index=True)
@@ -88,6 +97,8 @@ class Transaction(models.Model):
             models.Index(fields=['source_module', 'created_at']),
             models.Index(fields=['transaction_type', 'status']),
             models.Index(fields=['workflow_id', 'workflow_step']),
+            models.Index(fields=['updated_at']),  # analytics rollup change scan
+            models.Index(fields=['status', 'next_retry_at']),  # retry queue
         ]
 
     def __str__(self):
@@ -100,8 +111,45 @@ class Transaction(models.Model):
         if self.status == 'completed' and not self.completed_at:
             self.completed_at = timezone.now()
             
+        adding = self._state.adding
         super().save(*args, **kwargs)
 
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'target_modules' in update_fields:
+            self.sync_targets(adding)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored targets so saves that leave them alone skip sync_targets
+        if 'target_modules' in instance.__dict__:
+            instance._synced_targets = set(instance.target_modules or [])
+        return instance
+
+    def sync_targets(self, adding=False):
+        """Mirror target_modules into the indexed TransactionTarget rows"""
+        targets = set(self.target_modules or [])
+        if targets == getattr(self, '_synced_targets', None):
+            return
+        if not adding:
+            TransactionTarget.objects.filter(transaction=self).exclude(module__in=targets).delete()
+        TransactionTarget.objects.bulk_create(
+            [TransactionTarget(transaction=self, module=module) for module in targets], ignore_conflicts=True
+        )
+        self._synced_targets = targets
+
+    @classmethod
+    def involving(cls, module):
+        """
+        Q for transactions sent from or to ``module``: the UNION of two
+        index scans (source_module, TransactionTarget.module). OR-ing the
+        source filter with a subquery left PostgreSQL a seq scan with a
+        hashed subplan.
+        """
+        return Q(pk__in=cls.objects.filter(source_module=module).order_by().values('pk').union(
+            TransactionTarget.objects.filter(module=module).order_by().values('transaction_id')
+        ))
+
     def generate_transaction_id(self):
         """Generate unique transaction ID"""
         import uuid
@@ -126,6 +174,7 @@ class Transaction(models.Model):
         """Mark transaction as completed"""
         self.status = 'completed'
         self.completed_at = timezone.now()
+        self.next_retry_at = None
         if user:
             self.metadata['completed_by'] = user.id
         self.save()
@@ -134,10 +183,19 @@ class Transaction(models.Model):
         """Mark transaction as failed"""
         self.status = 'failed'
         self.error_message = error_message
+        self.schedule_retry()
         if user:
             self.metadata['failed_by'] = user.id
         self.save()
 
+    def schedule_retry(self):
+        """Set next_retry_at with jittered exponential backoff, or clear it once retries are exhausted"""
+        if self.retry_count >= self.MAX_RETRIES:
+            self.next_retry_at = None
+            return
+        delay = min(self.RETRY_BASE_DELAY * 2 ** self.retry_count, self.RETRY_MAX_DELAY)
+        self.next_retry_at = timezone.now() + delay * random.uniform(0.8, 1.2)
+
     def add_metadata(self, key, value):
         """Add metadata to transaction"""
         if not self.metadata:
@@ -146,6 +204,22 @@ class Transaction(models.Model):
         self.save()
 
 
+class TransactionTarget(models.Model):
+    """
+    One row per (transaction, target module), mirroring Transaction.target_modules
+    so per-module lookups are index scans instead of JSON containment filters
+    """
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='targets')
+    module = models.CharField(max_length=20, choices=Transaction.MODULE_CHOICES)
+
+    class Meta:
+        db_table = 'transaction_targets'
+        unique_together = ['module', 'transaction']
+
+    def __str__(self):
+        return f"{self.transaction_id} -> {self.module}"
+
+
 class TransactionLog(models.Model):
     """
     Detailed log of transaction processing steps
@@ -201,9 +275,11 @@ class TransactionAnalytics(models.Model):
     # Financial metrics
     total_value = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     average_value = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    valued_transactions = models.IntegerField(default=0)  # transactions with an amount
     
     # Performance metrics
     success_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    completed_transactions = models.IntegerField(default=0)
     average_processing_time = models.DurationField(null=True, blank=True)
     
     # Top connections
@@ -220,3 +296,18 @@ class TransactionAnalytics(models.Model):
 
     def __str__(self):
         return f"{self.module} - {self.date}"
+
+
+class TransactionAnalyticsDirtyDay(models.Model):
+    """
+    A day whose rollups must be re-rolled although none of its remaining
+    transactions changed: one was deleted. Recorded by a post_delete signal
+    and cleared by TransactionAnalyticsService.refresh().
+    """
+    date = models.DateField(unique=True)
+
+    class Meta:
+        db_table = 'transaction_analytics_dirty_days'
+
+    def __str__(self):
+        return str(self.date)
@@ -0,0 +1,375 @@
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from urllib.request import Request, urlopen
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction as db_transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from .models import ModuleIntegration, Transaction, TransactionAnalytics, TransactionAnalyticsDirtyDay, TransactionLog
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionAnalyticsService:
+    """
+    Daily per-module rollups of cross-module transactions in
+    TransactionAnalytics.
+
+    refresh() re-rolls only the days holding transactions created or
+    changed since the last run (a status change moves that day's success
+    rate) and the days a transaction was deleted from (recorded in
+    TransactionAnalyticsDirtyDay), reading each day once for every module.
+    The analytics endpoints then add up at most a few hundred rollup rows
+    instead of scanning Transaction per module on every request. They never
+    roll up inline: history is backfilled by migration 0005 and ``manage.py
+    rollup_transaction_analytics`` keeps the rollups current, so a response
+    is as fresh as its ``rolled_up_at``.
+    """
+
+    MODULES = [module for module, _ in Transaction.MODULE_CHOICES]
+    PERIODS = {'7d': 7, '30d': 30, '90d': 90}
+    DEFAULT_PERIOD = '30d'
+    TOP = 5
+    # Re-read changes this far before the last run, covering transactions
+    # that committed while that run was reading
+    SCAN_OVERLAP = timedelta(minutes=10)
+    ROLLUP_FIELDS = [
+        'incoming_transactions', 'outgoing_transactions', 'total_transactions', 'total_value', 'average_value',
+        'valued_transactions', 'success_rate', 'completed_transactions', 'average_processing_time',
+        'top_sources', 'top_targets', 'updated_at',
+    ]
+
+    def refresh(self):
+        """Re-roll the days changed since the last run; returns them"""
+        last_run = TransactionAnalytics.objects.aggregate(last=Max('updated_at'))['last']
+        changed = Transaction.objects.all()
+        if last_run:
+            changed = changed.filter(updated_at__gte=last_run - self.SCAN_OVERLAP)
+        # Days that lost a transaction have nothing left to show up in ``changed``
+        dirty = dict(TransactionAnalyticsDirtyDay.objects.values_list('id', 'date'))
+        # Truncated in the current time zone, matching rollup_day's day bounds
+        days = sorted({value.date() for value in changed.datetimes('created_at', 'day')} | set(dirty.values()))
+        for day in days:
+            self.rollup_day(day)
+        TransactionAnalyticsDirtyDay.objects.filter(id__in=dirty).delete()
+        return days
+
+    def rebuild(self, start, end):
+        """Re-roll every day in [start, end]"""
+        day = start
+        while day <= end:
+            self.rollup_day(day)
+            day += timedelta(days=1)
+
+    def rollup_day(self, day):
+        start = self._day_start(day)
+        transactions = Transaction.objects.filter(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+        stats = defaultdict(lambda: {
+            'incoming': 0, 'outgoing': 0, 'value': Decimal('0'), 'valued': 0, 'completed': 0,
+            'processing': timedelta(0), 'timed': 0, 'sources': Counter(), 'targets': Counter(),
+        })
+        rows = transactions.values_list('source_module', 'target_modules', 'status', 'amount', 'created_at', 'completed_at')
+        for source, targets, status, amount, created_at, completed_at in rows.iterator(chunk_size=5000):
+            targets = targets or []
+            stats[source]['outgoing'] += 1
+            for target in targets:
+                stats[target]['incoming'] += 1
+                stats[target]['sources'][source] += 1
+                stats[source]['targets'][target] += 1
+            for module in {source, *targets}:
+                module_stats = stats[module]
+                if amount is not None:
+                    module_stats['value'] += amount
+                    module_stats['valued'] += 1
+                if status == 'completed':
+                    module_stats['completed'] += 1
+                    if completed_at:
+                        module_stats['processing'] += completed_at - created_at
+                        module_stats['timed'] += 1
+
+        now = timezone.now()
+        rollups = []
+        for module, module_stats in stats.items():
+            total = module_stats['incoming'] + module_stats['outgoing']
+            rollups.append(TransactionAnalytics(
+                module=module,
+                date=day,
+                incoming_transactions=module_stats['incoming'],
+                outgoing_transactions=module_stats['outgoing'],
+                total_transactions=total,
+                total_value=module_stats['value'],
+                average_value=(module_stats['value'] / module_stats['valued']).quantize(Decimal('0.01')) if module_stats['valued'] else 0,
+                valued_transactions=module_stats['valued'],
+                success_rate=round(Decimal(module_stats['completed'] * 100) / total, 2) if total else 0,
+                completed_transactions=module_stats['completed'],
+                average_processing_time=module_stats['processing'] / module_stats['timed'] if module_stats['timed'] else None,
+                top_sources=[{'source_module': name, 'count': count} for name, count in module_stats['sources'].most_common()],
+                top_targets=[{'module': name, 'count': count} for name, count in module_stats['targets'].most_common()],
+                updated_at=now,
+            ))
+        TransactionAnalytics.objects.filter(date=day).exclude(module__in=list(stats)).delete()
+        TransactionAnalytics.objects.bulk_create(
+            rollups, update_conflicts=True, unique_fields=['module', 'date'], update_fields=self.ROLLUP_FIELDS,
+        )
+        return rollups
+
+    def summaries(self, modules, period=DEFAULT_PERIOD):
+        """Analytics for each module over ``period``, from the rollups"""
+        end = timezone.localdate()
+        start = end - timedelta(days=self.PERIODS.get(period, self.PERIODS[self.DEFAULT_PERIOD]))
+        last_run = TransactionAnalytics.objects.aggregate(last=Max('updated_at'))['last']
+
+        totals = {module: {
+            'incoming': 0, 'outgoing': 0, 'total': 0, 'value': Decimal('0'), 'valued': 0, 'completed': 0,
+            'processing': timedelta(0), 'sources': Counter(), 'targets': Counter(),
+        } for module in modules}
+        rollups = TransactionAnalytics.objects.filter(module__in=modules, date__gte=start, date__lte=end)
+        for rollup in rollups:
+            module_totals = totals[rollup.module]
+            module_totals['incoming'] += rollup.incoming_transactions
+            module_totals['outgoing'] += rollup.outgoing_transactions
+            module_totals['total'] += rollup.total_transactions
+            module_totals['value'] += rollup.total_value
+            module_totals['valued'] += rollup.valued_transactions
+            module_totals['completed'] += rollup.completed_transactions
+            if rollup.average_processing_time:
+                module_totals['processing'] += rollup.average_processing_time * rollup.completed_transactions
+            module_totals['sources'].update({row['source_module']: row['count'] for row in rollup.top_sources})
+            module_totals['targets'].update({row['module']: row['count'] for row in rollup.top_targets})
+
+        return {module: {
+            'module': module,
+            'incoming_transactions': module_totals['incoming'],
+            'outgoing_transactions': module_totals['outgoing'],
+            'total_transactions': module_totals['total'],
+            'total_value': float(module_totals['value']),
+            'average_value': float(module_totals['value'] / module_totals['valued']) if module_totals['valued'] else 0,
+            'success_rate': round(module_totals['completed'] * 100 / module_totals['total'], 2) if module_totals['total'] else 0,
+            'average_processing_seconds': (
+                round((module_totals['processing'] / module_totals['completed']).total_seconds(), 1)
+                if module_totals['completed'] and module_totals['processing'] else None
+            ),
+            'top_sources': [
+                {'source_module': name, 'count': count} for name, count in module_totals['sources'].most_common(self.TOP)
+            ],
+            'top_targets': [{'module': name, 'count': count} for name, count in module_totals['targets'].most_common(self.TOP)],
+            'period_start': start,
+            'period_end': end,
+            'rolled_up_at': last_run,
+        } for module, module_totals in totals.items()}
+
+    def _day_start(self, day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+transaction_analytics_service = TransactionAnalyticsService()
+
+
+class TransactionDispatcher:
+    """
+    Delivers a transaction to a target module through the active
+    ModuleIntegration rows for its (source_module, target_module) pair,
+    using the handler for each row's integration_type:
+
+    - ``webhook``: POSTs the transaction as JSON to ``configuration['url']``
+      (optional ``headers``, ``timeout`` seconds); any non-2xx response or
+      network error is a failure.
+
+    A target with no active integration, or an integration type with no
+    handler, is a delivery failure too, so the transaction stays failed
+    instead of being reported delivered to nobody. Receivers get the
+    transaction_id in X-Transaction-Id and must tolerate repeats: a worker
+    that dies mid-batch redelivers it.
+    """
+
+    TIMEOUT = 10
+
+    def __init__(self):
+        self.handlers = {'webhook': self._webhook}
+
+    def integrations(self, transactions):
+        """Active integrations by (source_module, target_module) for a batch, in one query"""
+        sources = {txn.source_module for txn in transactions}
+        targets = {module for txn in transactions for module in txn.target_modules or []}
+        integrations = defaultdict(list)
+        for integration in ModuleIntegration.objects.filter(
+            is_active=True, source_module__in=sources, target_module__in=targets,
+        ).order_by('id'):
+            integrations[integration.source_module, integration.target_module].append(integration)
+        return integrations
+
+    def deliver(self, txn, module, integrations):
+        """Run every integration for ``module``; raises on the first failure"""
+        pending = integrations.get((txn.source_module, module))
+        if not pending:
+            raise LookupError(f'No active integration from {txn.source_module} to {module}')
+        for integration in pending:
+            handler = self.handlers.get(integration.integration_type)
+            if handler is None:
+                raise LookupError(f'No dispatch handler for integration type {integration.integration_type}')
+            handler(txn, integration)
+
+    def payload(self, txn):
+        return {
+            'id': txn.id,
+            'transaction_id': txn.transaction_id,
+            'transaction_type': txn.transaction_type,
+            'source_module': txn.source_module,
+            'target_modules': txn.target_modules,
+            'transaction_data': txn.transaction_data,
+            'amount': txn.amount,
+            'currency': txn.currency,
+            'created_at': txn.created_at,
+        }
+
+    def _webhook(self, txn, integration):
+        configuration = integration.configuration or {}
+        if not configuration.get('url'):
+            raise ValueError(f'Integration {integration.id} has no url')
+        request = Request(
+            configuration['url'],
+            data=json.dumps(self.payload(txn), cls=DjangoJSONEncoder).encode(),
+            headers={
+                'Content-Type': 'application/json',
+                'X-Transaction-Id': txn.transaction_id,
+                **configuration.get('headers', {}),
+            },
+            method='POST',
+        )
+        # urlopen raises HTTPError for 4xx/5xx
+        with urlopen(request, timeout=configuration.get('timeout', self.TIMEOUT)):
+            pass
+
+
+transaction_dispatcher = TransactionDispatcher()
+
+
+class TransactionRetryService:
+    """
+    Retries failed transactions in the background.
+
+    Failed transactions carry next_retry_at, set by Transaction.schedule_retry
+    with exponential backoff. Workers (``manage.py run_transaction_retry_worker``)
+    claim due transactions in batches with SELECT ... FOR UPDATE SKIP LOCKED,
+    mark them processing and push next_retry_at past a lease, so a worker
+    that dies leaves its batch to be picked up again instead of stuck. Each
+    claimed transaction is re-dispatched through TransactionDispatcher to the
+    target modules it has not yet been delivered to. Outcomes are written
+    only while the row is still processing under the same lease: a batch
+    that outlives its lease and was claimed again, or a transaction completed
+    or failed through the API meanwhile, keeps the newer state. Logs are
+    saved with one TransactionLog bulk_create per batch.
+    """
+
+    BATCH_SIZE = 100
+    LEASE = timedelta(minutes=5)
+    POLL_SECONDS = 5
+    # processing rows past their lease belong to a worker that died
+    CLAIMABLE_STATUSES = ['failed', 'processing']
+    RESULT_FIELDS = ['status', 'error_message', 'retry_count', 'next_retry_at', 'completed_at', 'metadata', 'updated_at']
+
+    def work(self, once=False, sleep=POLL_SECONDS, batch_size=BATCH_SIZE):
+        """Retry due transactions until interrupted, or until none are due when ``once``"""
+        retried = 0
+        while True:
+            batch = self.claim(batch_size)
+            if not batch:
+                if once:
+                    return retried
+                time.sleep(sleep)
+                continue
+            self.process(batch)
+            retried += len(batch)
+
+    def claim(self, batch_size=BATCH_SIZE):
+        now = timezone.now()
+        lease = now + self.LEASE
+        with db_transaction.atomic():
+            batch = list(
+                Transaction.objects.select_for_update(skip_locked=True)
+                .filter(status__in=self.CLAIMABLE_STATUSES, next_retry_at__lte=now).order_by('next_retry_at')[:batch_size]
+            )
+            if batch:
+                Transaction.objects.filter(pk__in=[txn.pk for txn in batch]).update(status='processing', next_retry_at=lease)
+                for txn in batch:
+                    txn.status, txn.next_retry_at = 'processing', lease
+        return batch
+
+    def process(self, batch):
+        now = timezone.now()
+        logs = []
+        integrations = transaction_dispatcher.integrations(batch)
+        for txn in batch:
+            lease = txn.next_retry_at
+            txn.retry_count += 1
+            delivered = set(txn.metadata.get('delivered_modules', []))
+            errors = []
+            for module in txn.target_modules or []:
+                if module in delivered:
+                    continue
+                try:
+                    transaction_dispatcher.deliver(txn, module, integrations)
+                except Exception as exc:
+                    errors.append(f'{module}: {exc}')
+                else:
+                    delivered.add(module)
+            txn.metadata['delivered_modules'] = sorted(delivered)
+            txn.updated_at = timezone.now()
+
+            if errors:
+                txn.status = 'failed'
+                txn.error_message = '; '.join(errors)
+                txn.schedule_retry()
+                logger.warning('Retry %s of transaction %s failed: %s', txn.retry_count, txn.transaction_id, txn.error_message)
+                message = txn.error_message if txn.next_retry_at else f'{txn.error_message} (retries exhausted)'
+            else:
+                txn.status = 'completed'
+                txn.completed_at = txn.updated_at
+                txn.error_message = ''
+                txn.next_retry_at = None
+                message = 'Delivered to all target modules'
+
+            written = Transaction.objects.filter(pk=txn.pk, status='processing', next_retry_at=lease).update(
+                **{field: getattr(txn, field) for field in self.RESULT_FIELDS}
+            )
+            if not written:
+                logger.warning('Transaction %s changed while retry %s was running; keeping the newer state', txn.transaction_id, txn.retry_count)
+                continue
+            logs.append(TransactionLog(
+                transaction=txn,
+                step=f'Retry {txn.retry_count}',
+                status=txn.status,
+                message=message,
+                data={'next_retry_at': txn.next_retry_at.isoformat() if txn.next_retry_at else None},
+                created_at=now,
+            ))
+        TransactionLog.objects.bulk_create(logs)
+        return batch
+
+    def metrics(self):
+        """Retry queue depth and age"""
+        now = timezone.now()
+        queued = Q(status='failed') | Q(status='processing', next_retry_at__isnull=False)
+        stats = Transaction.objects.filter(queued).aggregate(
+            failed=Count('id', filter=Q(status='failed')),
+            retrying=Count('id', filter=Q(status='processing', next_retry_at__gt=now)),
+            due=Count('id', filter=Q(next_retry_at__lte=now)),
+            scheduled=Count('id', filter=Q(status='failed', next_retry_at__gt=now)),
+            exhausted=Count('id', filter=Q(next_retry_at__isnull=True)),
+            oldest_due=Min('next_retry_at', filter=Q(next_retry_at__lte=now)),
+            oldest_created=Min('created_at', filter=Q(next_retry_at__isnull=False)),
+        )
+        oldest_due, oldest_created = stats.pop('oldest_due'), stats.pop('oldest_created')
+        # How far behind the workers are, and how long the oldest retryable transaction has waited
+        stats['oldest_due_seconds'] = round((now - oldest_due).total_seconds(), 1) if oldest_due else 0
+        stats['oldest_pending_seconds'] = round((now - oldest_created).total_seconds(), 1) if oldest_created else 0
+        return stats
+
+
+transaction_retry_service = TransactionRetryService()
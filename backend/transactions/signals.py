@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Transaction, TransactionAnalyticsDirtyDay
+
+@receiver(post_delete, sender=Transaction)
+def mark_analytics_day_dirty(sender, instance, **kwargs):
+    """Have the next rollup re-roll the deleted transaction's day; rolled back with the delete"""
+    TransactionAnalyticsDirtyDay.objects.bulk_create(
+        [TransactionAnalyticsDirtyDay(date=timezone.localdate(instance.created_at))], ignore_conflicts=True,
+    )
@@ -0,0 +1,399 @@
+import importlib
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.error import URLError
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from transactions.models import (
+    ModuleIntegration, Transaction, TransactionAnalytics, TransactionAnalyticsDirtyDay, TransactionLog, TransactionTarget,
+)
+from transactions.audit import AuditLogMiddleware, audit_log
+from transactions.services import TransactionRetryService, transaction_analytics_service
+
+User = get_user_model()
+
+class TransactionAnalyticsServiceTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        Transaction.objects.create(
+            transaction_type='SALES_ORDER_CREATED', source_module='sales', target_modules=['inventory', 'accounting'],
+            amount=Decimal('100'), status='completed', created_at=now - timedelta(days=2),
+            completed_at=now - timedelta(days=2) + timedelta(seconds=30),
+        )
+        Transaction.objects.create(
+            transaction_type='SALES_ORDER_CREATED', source_module='sales', target_modules=['inventory'],
+            amount=Decimal('50'), created_at=now - timedelta(days=1),
+        )
+        Transaction.objects.create(
+            transaction_type='INVENTORY_MOVEMENT', source_module='inventory', target_modules=['accounting'],
+            created_at=now - timedelta(days=40),
+        )
+
+    def test_summaries_serve_existing_rollups_without_rolling_up(self):
+        self.assertEqual(transaction_analytics_service.summaries(['sales'])['sales']['total_transactions'], 0)
+        self.assertFalse(TransactionAnalytics.objects.exists())
+
+        transaction_analytics_service.refresh()
+        Transaction.objects.create(transaction_type='SALES_ORDER_CREATED', source_module='sales', target_modules=['pos'])
+        # Only the rollup rows are read; the new transaction waits for the next refresh
+        with self.assertNumQueries(2):
+            sales = transaction_analytics_service.summaries(['sales'])['sales']
+        self.assertEqual((sales['outgoing_transactions'], sales['total_value'], sales['success_rate']), (2, 150.0, 50.0))
+        self.assertIsNotNone(sales['rolled_up_at'])
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='analyst', password='analyst'))
+        modules = client.get('/api/transactions/analytics/cross-module/', {'period': '90d'}).json()
+        self.assertEqual((modules['inventory']['incoming_transactions'], modules['inventory']['outgoing_transactions']), (2, 1))
+
+    def test_deleted_transactions_re_roll_their_day(self):
+        transaction_analytics_service.refresh()
+        completed = Transaction.objects.get(status='completed')
+        day = timezone.localdate(completed.created_at)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='clerk', password='clerk'))
+        self.assertEqual(client.delete(f'/api/transactions/{completed.pk}/').status_code, 204)
+        self.assertEqual(list(TransactionAnalyticsDirtyDay.objects.values_list('date', flat=True)), [day])
+
+        self.assertIn(day, transaction_analytics_service.refresh())
+        self.assertFalse(TransactionAnalytics.objects.filter(date=day).exists())
+        sales = transaction_analytics_service.summaries(['sales'])['sales']
+        self.assertEqual((sales['outgoing_transactions'], sales['total_value']), (1, 50.0))
+        self.assertFalse(TransactionAnalyticsDirtyDay.objects.exists())
+
+    def test_migration_backfills_history_once(self):
+        migration = importlib.import_module('transactions.migrations.0005_backfill_transaction_analytics')
+        migration.backfill_rollups(apps, None)
+        backfilled = {
+            (row.module, row.date): (row.incoming_transactions, row.outgoing_transactions, row.total_value)
+            for row in TransactionAnalytics.objects.all()
+        }
+
+        TransactionAnalytics.objects.all().delete()
+        transaction_analytics_service.refresh()
+        self.assertEqual(backfilled, {
+            (row.module, row.date): (row.incoming_transactions, row.outgoing_transactions, row.total_value)
+            for row in TransactionAnalytics.objects.all()
+        })
+
+        # Rollups already there (the command has run) are left alone
+        with self.assertNumQueries(1):
+            migration.backfill_rollups(apps, None)
+
+
+class TransactionTargetTest(TestCase):
+    def targets(self, txn):
+        return set(TransactionTarget.objects.filter(transaction=txn).values_list('module', flat=True))
+
+    def test_sync_targets_tracks_target_module_edits(self):
+        txn = Transaction.objects.create(
+            transaction_type='SALES_ORDER_CREATED', source_module='sales', target_modules=['inventory', 'accounting'],
+        )
+        self.assertEqual(self.targets(txn), {'inventory', 'accounting'})
+
+        txn = Transaction.objects.get(pk=txn.pk)
+        txn.status = 'processing'
+        with CaptureQueriesContext(connection) as queries:
+            txn.save()
+        self.assertEqual(len(queries), 1)  # unchanged targets are not re-synced
+
+        txn.target_modules = ['inventory', 'pos']
+        txn.save()
+        self.assertEqual(self.targets(txn), {'inventory', 'pos'})
+        txn.target_modules = []
+        txn.save(update_fields=['target_modules'])
+        self.assertEqual(self.targets(txn), set())
+
+        # update_fields without target_modules leaves the rows alone
+        txn.target_modules = ['hr']
+        txn.save(update_fields=['status'])
+        self.assertEqual(self.targets(txn), set())
+
+    def test_involving_matches_source_or_target(self):
+        sent = Transaction.objects.create(transaction_type='SALES_ORDER_CREATED', source_module='accounting', target_modules=['sales'])
+        received = Transaction.objects.create(transaction_type='PAYROLL_PROCESSED', source_module='hr', target_modules=['accounting'])
+        both = Transaction.objects.create(transaction_type='PAYMENT_RECEIVED', source_module='accounting', target_modules=['accounting'])
+        Transaction.objects.create(transaction_type='INVENTORY_MOVEMENT', source_module='inventory', target_modules=['warehouse'])
+
+        involved = Transaction.objects.filter(Transaction.involving('accounting')).filter(status='pending')
+        self.assertEqual(sorted(involved.values_list('pk', flat=True)), sorted([sent.pk, received.pk, both.pk]))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='clerk', password='clerk'))
+        self.assertEqual(len(client.get('/api/transactions/module/accounting/').json()), 3)
+        self.assertEqual(len(client.get('/api/transactions/', {'module': 'hr', 'limit': 10}).json()), 1)
+
+
+class TransactionRetryServiceTest(TestCase):
+    def setUp(self):
+        self.service = TransactionRetryService()
+        for target in ('inventory', 'accounting'):
+            ModuleIntegration.objects.create(
+                source_module='sales', target_module=target, integration_type='webhook',
+                configuration={'url': f'https://{target}.example.com/transactions'},
+            )
+
+    def failed(self, **fields):
+        return Transaction.objects.create(**{
+            'transaction_type': 'SALES_ORDER_CREATED', 'source_module': 'sales', 'target_modules': ['inventory', 'accounting'],
+            'status': 'failed', 'next_retry_at': timezone.now() - timedelta(seconds=1), **fields,
+        })
+
+    def retry(self, side_effect=None):
+        with mock.patch('transactions.services.urlopen', side_effect=side_effect) as urlopen:
+            self.service.process(self.service.claim())
+        return [call.args[0].full_url for call in urlopen.call_args_list]
+
+    def test_delivers_to_every_target_and_completes(self):
+        txn = self.failed()
+        self.assertEqual(self.retry(), ['https://inventory.example.com/transactions', 'https://accounting.example.com/transactions'])
+        txn.refresh_from_db()
+        self.assertEqual((txn.status, txn.retry_count, txn.next_retry_at), ('completed', 1, None))
+        self.assertEqual(txn.metadata['delivered_modules'], ['accounting', 'inventory'])
+        self.assertEqual(TransactionLog.objects.get(transaction=txn).message, 'Delivered to all target modules')
+
+    def test_failure_backs_off_and_skips_delivered_modules_next_time(self):
+        txn = self.failed()
+
+        def fail_accounting(request, timeout):
+            if 'accounting' in request.full_url:
+                raise URLError('connection refused')
+            return mock.MagicMock()
+
+        self.retry(fail_accounting)
+        txn.refresh_from_db()
+        self.assertEqual((txn.status, txn.retry_count, txn.metadata['delivered_modules']), ('failed', 1, ['inventory']))
+        self.assertIn('accounting: <urlopen error connection refused>', txn.error_message)
+        # 30s doubled once, with up to 20% jitter either way
+        delay = txn.next_retry_at - timezone.now()
+        self.assertTrue(timedelta(seconds=47) < delay < timedelta(seconds=73), delay)
+
+        Transaction.objects.filter(pk=txn.pk).update(next_retry_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.retry(), ['https://accounting.example.com/transactions'])
+        txn.refresh_from_db()
+        self.assertEqual(txn.status, 'completed')
+
+    def test_target_without_integration_is_a_failure(self):
+        ModuleIntegration.objects.filter(target_module='accounting').update(is_active=False)
+        txn = self.failed(target_modules=['accounting'])
+        self.assertEqual(self.retry(), [])
+        txn.refresh_from_db()
+        self.assertEqual(txn.status, 'failed')
+        self.assertEqual(txn.error_message, 'accounting: No active integration from sales to accounting')
+
+    def test_retries_exhausted(self):
+        txn = self.failed(retry_count=Transaction.MAX_RETRIES - 1)
+        self.retry(URLError('timed out'))
+        txn.refresh_from_db()
+        self.assertEqual((txn.status, txn.retry_count, txn.next_retry_at), ('failed', Transaction.MAX_RETRIES, None))
+        self.assertTrue(TransactionLog.objects.get(transaction=txn).message.endswith('(retries exhausted)'))
+        self.assertEqual(self.service.metrics()['exhausted'], 1)
+        self.assertEqual(self.service.claim(), [])
+
+    def test_claim_leases_due_transactions(self):
+        due = [self.failed() for _ in range(3)]
+        self.failed(next_retry_at=timezone.now() + timedelta(minutes=1))
+        self.failed(next_retry_at=None)
+
+        batch = self.service.claim(batch_size=2)
+        self.assertEqual([txn.pk for txn in batch], [txn.pk for txn in due[:2]])
+        leased = Transaction.objects.filter(pk__in=[txn.pk for txn in batch]).values_list('status', 'next_retry_at')
+        self.assertTrue(all(
+            status == 'processing' and value > timezone.now() + self.service.LEASE - timedelta(seconds=5)
+            for status, value in leased
+        ))
+        # Leased transactions are not handed to the next worker
+        self.assertEqual([txn.pk for txn in self.service.claim()], [due[2].pk])
+        self.assertEqual(self.service.claim(), [])
+        self.assertEqual(self.service.metrics()['retrying'], 3)
+
+    def test_expired_lease_is_reclaimed_and_the_stale_batch_is_dropped(self):
+        txn = self.failed()
+        stale = self.service.claim()
+        Transaction.objects.filter(pk=txn.pk).update(next_retry_at=timezone.now() - timedelta(seconds=1))
+
+        fresh = self.service.claim()
+        self.assertEqual([row.pk for row in fresh], [txn.pk])
+        with mock.patch('transactions.services.urlopen'):
+            self.service.process(fresh)
+            self.service.process(stale)
+        txn.refresh_from_db()
+        self.assertEqual((txn.status, txn.retry_count), ('completed', 1))
+        self.assertEqual(TransactionLog.objects.filter(transaction=txn).count(), 1)
+
+    def test_api_changes_during_a_batch_are_kept(self):
+        completed, failed = self.failed(), self.failed()
+        batch = self.service.claim()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='clerk', password='clerk'))
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(f'/api/transactions/{completed.pk}/complete/')
+            client.post(f'/api/transactions/{failed.pk}/fail/', {'error_message': 'Rejected by accounting'})
+
+        with mock.patch('transactions.services.urlopen', side_effect=URLError('timed out')):
+            self.service.process(batch)
+        completed.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((completed.status, completed.retry_count), ('completed', 0))
+        self.assertEqual((failed.status, failed.retry_count, failed.error_message), ('failed', 0, 'Rejected by accounting'))
+        self.assertFalse(TransactionLog.objects.filter(step__startswith='Retry').exists())
+
+    def test_migration_schedules_transactions_that_failed_before_retries(self):
+        migration = importlib.import_module('transactions.migrations.0004_transaction_retries')
+        never_retried = self.failed(next_retry_at=None)
+        exhausted = self.failed(next_retry_at=None, retry_count=Transaction.MAX_RETRIES)
+        pending = Transaction.objects.create(transaction_type='SALES_ORDER_CREATED', source_module='sales', target_modules=['inventory'])
+
+        migration.schedule_failed_transactions(apps, None)
+        self.assertEqual([txn.pk for txn in self.service.claim()], [never_retried.pk])
+        for txn in (exhausted, pending):
+            txn.refresh_from_db()
+            self.assertIsNone(txn.next_retry_at)
+
+
+class TransactionRetryClaimConcurrencyTest(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_claim_skips_rows_locked_by_another_worker(self):
+        due = timezone.now() - timedelta(seconds=1)
+        locked, free = (
+            Transaction.objects.create(
+                transaction_type='SALES_ORDER_CREATED', source_module='sales', target_modules=['inventory'],
+                status='failed', next_retry_at=due,
+            )
+            for _ in range(2)
+        )
+        claimed = []
+
+        def other_worker():
+            try:
+                claimed.extend(txn.pk for txn in TransactionRetryService().claim())
+            finally:
+                connections.close_all()
+
+        with transaction.atomic():
+            list(Transaction.objects.select_for_update().filter(pk=locked.pk))
+            worker = threading.Thread(target=other_worker)
+            worker.start()
+            worker.join(timeout=10)
+        self.assertEqual(claimed, [free.pk])
+
+
+class AuditLogWriterTest(TransactionTestCase):
+    def setUp(self):
+        self.txn = Transaction.objects.create(transaction_type='SALES_ORDER_CREATED', source_module='sales', target_modules=[])
+
+    def log(self, step):
+        return audit_log.add(TransactionLog(transaction=self.txn, step=step, status='pending', message=step))
+
+    def steps(self):
+        return sorted(TransactionLog.objects.values_list('step', flat=True))
+
+    def inserts(self, queries):
+        return [query for query in queries if query['sql'].startswith('INSERT INTO "transaction_logs"')]
+
+    def test_rows_are_written_on_commit(self):
+        with transaction.atomic():
+            self.log('a')
+            self.log('b')
+            self.assertEqual(self.steps(), [])
+        self.assertEqual(self.steps(), ['a', 'b'])
+
+    def test_batched_rows_are_written_together(self):
+        # A batch around the transaction (the middleware) ...
+        with CaptureQueriesContext(connection) as queries:
+            with audit_log.batch():
+                self.log('outside')
+                with transaction.atomic():
+                    self.log('a')
+                    self.log('b')
+                self.assertEqual(self.steps(), [])
+        self.assertEqual(len(self.inserts(queries)), 1)
+
+        # ... and one inside it
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                with audit_log.batch():
+                    self.log('c')
+                    with transaction.atomic():
+                        self.log('d')
+                self.log('unbatched')
+                self.assertEqual(self.steps(), ['a', 'b', 'outside'])
+        self.assertEqual(len(self.inserts(queries)), 2)
+        self.assertEqual(self.steps(), ['a', 'b', 'c', 'd', 'outside', 'unbatched'])
+
+    def test_batch_inside_a_transaction_follows_its_savepoints(self):
+        with transaction.atomic():
+            with audit_log.batch():
+                self.log('kept')
+                try:
+                    with transaction.atomic():
+                        self.log('inner')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+        self.assertEqual(self.steps(), ['kept'])
+
+        with transaction.atomic():
+            self.log('outer')
+            try:
+                with transaction.atomic(), audit_log.batch():
+                    self.log('batched')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with audit_log.batch():
+                self.log('later')
+        self.assertEqual(self.steps(), ['kept', 'later', 'outer'])
+
+    def test_rolled_back_transaction_drops_its_rows(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.log('lost')
+                raise RuntimeError
+        with transaction.atomic():
+            self.log('kept')
+        self.assertEqual(self.steps(), ['kept'])
+
+    def test_rolled_back_savepoint_drops_only_its_rows(self):
+        with transaction.atomic():
+            self.log('before')
+            try:
+                with transaction.atomic():
+                    self.log('inner')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.log('after')
+        self.assertEqual(self.steps(), ['after', 'before'])
+
+        # The first row of the transaction added inside the savepoint that rolls back
+        TransactionLog.objects.all().delete()
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    self.log('inner')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                self.log('nested')
+        self.assertEqual(self.steps(), ['nested'])
+
+    def test_view_that_raises_keeps_rows_outside_its_transaction(self):
+        def view(request):
+            self.log('request')
+            with transaction.atomic():
+                self.log('rolled back')
+                raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            AuditLogMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.steps(), ['request'])
@@ -9,13 +9,13 @@ urlpatterns = [
     
     # Module-specific endpoints
     path('module/<str:module_id>/', views.module_transactions, name='module-transactions'),
+    # Cross-module analytics (before the per-module route, which would shadow it)
+    path('analytics/cross-module/', views.cross_module_analytics, name='cross-module-analytics'),
     path('analytics/<str:module_id>/', views.transaction_analytics, name='transaction-analytics'),
     
     # Workflow endpoints
     path('workflow/', views.create_workflow_transaction, name='create-workflow-transaction'),
     path('<int:transaction_id>/complete/', views.complete_transaction, name='complete-transaction'),
     path('<int:transaction_id>/fail/', views.fail_transaction, name='fail-transaction'),
-    
-    # Cross-module analytics
-    path('analytics/cross-module/', views.cross_module_analytics, name='cross-module-analytics'),
+    path('retry-queue/', views.retry_queue_metrics, name='transaction-retry-queue'),
 ]
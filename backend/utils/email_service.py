@@ -265,6 +265,24 @@ Warehouse: {context.get('warehouse_name', 'N/A')}
 
 Stock level is below minimum threshold.
 
+Best regards,
+ERP System Team
+            """
+        elif template_key == 'INVENTORY_DIGEST':
+            lines = "\n".join(
+                f"- {item['product_name']} ({item['product_sku']}) @ {item['warehouse_name']}: "
+                f"{item['current_stock']} on hand, min {item['minimum_stock']}, reorder {item['suggested_quantity']}"
+                for item in context.get('items', [])
+            )
+            return f"""
+Low Stock Digest
+
+{context.get('item_count', 0)} product(s) are below their minimum stock level:
+
+{lines}
+
+Reorder here: {context.get('reorder_url', 'N/A')}
+
 Best regards,
 ERP System Team
             """
@@ -423,5 +441,30 @@ ERP System Team
             
         return success
 
+    def send_inventory_digest(self, recipient_email: str, alerts) -> bool:
+        """Send a single low stock digest covering several LowStockAlert rows"""
+        items = [
+            {
+                'product_name': alert.product.name,
+                'product_sku': alert.product.sku,
+                'warehouse_name': alert.warehouse.name,
+                'current_stock': alert.on_hand,
+                'minimum_stock': alert.min_stock,
+                'suggested_quantity': alert.suggested_quantity,
+            }
+            for alert in alerts
+        ]
+        context = {
+            'items': items,
+            'item_count': len(items),
+            'reorder_url': f"{os.environ.get('FRONTEND_URL', 'http://localhost:3000')}/inventory/reorder"
+        }
+
+        return self.send_email(
+            template_key='INVENTORY_DIGEST',
+            recipient_email=recipient_email,
+            context=context
+        )
+
 # Global email service instance
 email_service = EmailService()
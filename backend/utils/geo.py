@@ -0,0 +1,19 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_matrix(origins, destinations):
+    """
+    Great-circle distances in km between every origin and destination.
+    Both arguments are (n, 2) array-likes of (latitude, longitude) degrees.
+    """
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    lat1, lon1 = origins[:, 0:1], origins[:, 1:2]
+    lat2, lon2 = destinations[:, 0], destinations[:, 1]
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
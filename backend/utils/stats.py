@@ -0,0 +1,57 @@
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+class CachedUserStatsService:
+    """
+    Per-user dashboard payload, cached for CACHE_TIMEOUT seconds so polling
+    dashboards hit the database at most that often.
+
+    Subclasses set CACHE_KEY and implement build(user); apps call
+    invalidate(user_id) from their signals to drop a payload early when
+    the user's rows change. status_counts() is the shared aggregate query.
+    """
+
+    CACHE_KEY = None
+    CACHE_TIMEOUT = 30
+
+    @classmethod
+    def invalidate(cls, user_id):
+        cache.delete(cls.CACHE_KEY.format(user_id=user_id))
+
+    def get(self, user):
+        key = self.CACHE_KEY.format(user_id=user.id)
+        payload = cache.get(key)
+        if payload is None:
+            payload = self.build(user)
+            cache.set(key, payload, self.CACHE_TIMEOUT)
+        return payload
+
+    def build(self, user):
+        raise NotImplementedError
+
+    @staticmethod
+    def status_counts(parents, children, parent_field, statuses):
+        """
+        Counts of ``parents`` per status plus ``total`` and ``children`` (the
+        number of ``children`` pointing at them through ``parent_field``) in
+        one conditional-aggregate query, and the non-zero statuses largest
+        first. Children are counted by a correlated subquery so the join
+        never multiplies parent rows.
+        """
+        child_count = children.filter(**{parent_field: OuterRef('pk')}).order_by().values(parent_field).annotate(
+            count=Count('id')
+        ).values('count')
+        counts = parents.annotate(
+            child_count=Coalesce(Subquery(child_count, output_field=IntegerField()), 0)
+        ).aggregate(
+            total=Count('id'),
+            children=Coalesce(Sum('child_count'), 0),
+            **{status: Count('id', filter=Q(status=status)) for status in statuses},
+        )
+        distribution = sorted(
+            ({'status': status, 'count': counts[status]} for status in statuses if counts[status]),
+            key=lambda row: -row['count'],
+        )
+        return counts, distribution
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from warehouse.services import stock_movement_archive_service
+
+class Command(BaseCommand):
+    help = 'Create upcoming stock movement partitions and roll old movements into monthly summaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=12, help='Whole months of movements to keep (default: 12)')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Partitions to create ahead of the current month')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Movements deleted per batch outside dropped partitions')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be archived without changing anything')
+
+    def handle(self, *args, **options):
+        service = stock_movement_archive_service
+
+        if not options['dry_run']:
+            created = service.ensure_partitions(months_ahead=options['months_ahead'])
+            for name in created:
+                self.stdout.write(f'Created partition {name}')
+
+        stats = service.archive(
+            keep_months=options['keep_months'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+        prefix = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {stats['movements']} movements before {stats['cutoff']:%Y-%m} into {stats['summaries']} summaries; "
+            f"{stats['balances']} balance movements, {stats['partitions_dropped']} partitions dropped"
+        ))
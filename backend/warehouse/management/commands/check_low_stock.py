@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from warehouse.services import low_stock_service
+
+class Command(BaseCommand):
+    help = 'Scan per-warehouse stock against product reorder points and email low stock digests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-email',
+            action='store_true',
+            help='Only refresh low stock alerts, do not send digests',
+        )
+
+    def handle(self, *args, **options):
+        result = low_stock_service.detect()
+        self.stdout.write(
+            f"Low stock alerts: {result['opened']} opened, {result['updated']} updated, {result['resolved']} resolved"
+        )
+
+        if options['no_email']:
+            return
+
+        sent = low_stock_service.send_digests()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {sent['recipients']} digest(s) covering {sent['alerts']} alert(s)"
+        ))
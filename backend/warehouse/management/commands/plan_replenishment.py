@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from warehouse.services import ReplenishmentPlanner
+
+class Command(BaseCommand):
+    help = 'Propose (and optionally create) transfers that rebalance stock between warehouses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--velocity-days', type=int, default=30, help='Days of outbound history used for velocity')
+        parser.add_argument('--lead-days', type=int, default=7, help='Days of demand the reorder point covers')
+        parser.add_argument('--cover-days', type=int, default=30, help='Days of demand a replenished warehouse should hold')
+        parser.add_argument('--warehouse', type=int, action='append', help='Only plan between these warehouse ids (repeatable)')
+        parser.add_argument('--create', action='store_true', help='Create the suggested transfers as pending requests')
+
+    def handle(self, *args, **options):
+        planner = ReplenishmentPlanner(
+            velocity_days=options['velocity_days'],
+            lead_days=options['lead_days'],
+            cover_days=options['cover_days'],
+        )
+        plan = planner.plan(warehouse_ids=options['warehouse'])
+        self.stdout.write(
+            f"{plan['transfer_count']} transfers, {plan['line_count']} lines, {plan['moved_quantity']} units; "
+            f"{plan['unmet_lines']} needs ({plan['unmet_quantity']} units) cannot be met from surplus"
+        )
+
+        if not options['create']:
+            return
+
+        created, errors = planner.create_transfers(plan)
+        for error in errors:
+            self.stderr.write(f"{error['from_warehouse']} -> {error['to_warehouse']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} transfer requests'))
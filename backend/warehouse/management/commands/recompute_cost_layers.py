@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from warehouse.services import InventoryValuationService
+
+class Command(BaseCommand):
+    help = 'Rebuild inventory cost layers and COGS by replaying the stock movement history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--method',
+            choices=InventoryValuationService.METHODS,
+            help='Costing method (default: settings.INVENTORY_COSTING_METHOD)',
+        )
+        parser.add_argument('--warehouse', type=int, action='append', help='Only replay this warehouse id (repeatable)')
+        parser.add_argument('--product', type=int, action='append', help='Only replay this product id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows written per bulk insert')
+
+    def handle(self, *args, **options):
+        try:
+            service = InventoryValuationService(method=options['method'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'Replaying stock movements using {service.method} costing...')
+        stats = service.recompute(
+            warehouse_ids=options['warehouse'],
+            product_ids=options['product'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {stats['movements']} movements: {stats['layers']} cost layers, "
+            f"{stats['consumptions']} consumptions"
+        ))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_lines_for_existing_transfers(apps, schema_editor):
+    WarehouseTransfer = apps.get_model('warehouse', 'WarehouseTransfer')
+    WarehouseTransferLine = apps.get_model('warehouse', 'WarehouseTransferLine')
+    transfers = WarehouseTransfer.objects.filter(product__isnull=False).values_list(
+        'id', 'product_id', 'quantity', 'actual_quantity_sent', 'actual_quantity_received'
+    )
+    WarehouseTransferLine.objects.bulk_create([
+        WarehouseTransferLine(
+            transfer_id=transfer_id,
+            product_id=product_id,
+            quantity=quantity or 0,
+            quantity_sent=sent,
+            quantity_received=received or 0,
+        )
+        for transfer_id, product_id, quantity, sent, received in transfers.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_product_search_indexes'),
+        ('warehouse', '0004_cost_layers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='warehousetransfer',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='inventory.product'),
+        ),
+        migrations.AlterField(
+            model_name='warehousetransfer',
+            name='quantity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='warehousetransfer',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending Approval'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('in_transit', 'In Transit'), ('partially_received', 'Partially Received'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='WarehouseTransferLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('quantity_sent', models.PositiveIntegerField(blank=True, null=True)),
+                ('quantity_received', models.PositiveIntegerField(default=0)),
+                ('notes', models.TextField(blank=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.product')),
+                ('transfer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='warehouse.warehousetransfer')),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('transfer', 'product'), name='unique_transfer_line_product')],
+            },
+        ),
+        migrations.RunPython(create_lines_for_existing_transfers, migrations.RunPython.noop),
+    ]
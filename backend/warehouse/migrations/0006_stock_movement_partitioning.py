@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_product_search_indexes'),
+        ('warehouse', '0005_transfer_lines'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovementSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='First day of the month')),
+                ('movement_type', models.CharField(choices=[('in', 'Stock In'), ('out', 'Stock Out'), ('transfer', 'Transfer'), ('adjustment', 'Adjustment'), ('balance', 'Archived Balance')], max_length=20)),
+                ('movement_count', models.PositiveIntegerField()),
+                ('quantity', models.BigIntegerField()),
+                ('cost', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('first_movement_at', models.DateTimeField()),
+                ('last_movement_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-period', 'warehouse', 'product'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='costlayer',
+            name='movement',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cost_layers', to='warehouse.stockmovement'),
+        ),
+        migrations.AlterField(
+            model_name='costlayerconsumption',
+            name='movement',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='cost_consumptions', to='warehouse.stockmovement'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='movement_type',
+            field=models.CharField(choices=[('in', 'Stock In'), ('out', 'Stock Out'), ('transfer', 'Transfer'), ('adjustment', 'Adjustment'), ('balance', 'Archived Balance')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['created_at'], name='stockmovement_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['warehouse', 'created_at'], name='stockmovement_wh_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockmovementsummary',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movement_summaries', to='inventory.product'),
+        ),
+        migrations.AddField(
+            model_name='stockmovementsummary',
+            name='warehouse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movement_summaries', to='warehouse.warehouse'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockmovementsummary',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'product', 'period', 'movement_type'), name='unique_stock_movement_summary'),
+        ),
+    ]
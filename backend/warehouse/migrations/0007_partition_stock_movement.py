@@ -0,0 +1,106 @@
+from datetime import date
+
+from django.db import migrations
+
+TABLE = 'warehouse_stockmovement'
+OLD_TABLE = 'warehouse_stockmovement_unpartitioned'
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Copy warehouse_stockmovement into a new table, partitioned by month on
+    created_at or plain, keeping its sequence, foreign keys and indexes.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+            [TABLE, TABLE],
+        )
+        index_definitions = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [TABLE]
+        )
+        is_identity = bool(cursor.fetchone()[0])
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN(created_at) FROM {TABLE}')
+        first_created = cursor.fetchone()[0]
+
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+    for name, _ in foreign_keys:
+        execute(f'ALTER TABLE {OLD_TABLE} DROP CONSTRAINT {name}')
+    for definition in index_definitions:
+        execute('DROP INDEX {}'.format(definition.split(' INDEX ', 1)[1].split(' ON ', 1)[0]))
+
+    if partitioned:
+        execute(f'CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)')
+        # Unique indexes on a partitioned table must include the partition key
+        execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, created_at)')
+        month = date.today().replace(day=1)
+        start = first_created.date().replace(day=1) if first_created else month
+        end = _add_months(month, MONTHS_AHEAD)
+        while start <= end:
+            following = _add_months(start, 1)
+            execute(
+                f"CREATE TABLE {TABLE}_p{start:%Y_%m} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{following.isoformat()}')"
+            )
+            start = following
+        execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+    else:
+        execute(f'CREATE TABLE {TABLE} (LIKE {OLD_TABLE} INCLUDING DEFAULTS)')
+        execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id)')
+
+    if is_identity:
+        execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    elif sequence:
+        # serial column: the copied default still uses this sequence, keep it alive
+        execute(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id')
+
+    execute(f'INSERT INTO {TABLE} SELECT * FROM {OLD_TABLE}')
+    if is_identity:
+        execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)"
+        )
+    execute(f'DROP TABLE {OLD_TABLE}')
+
+    for name, definition in foreign_keys:
+        execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+    for definition in index_definitions:
+        execute(definition)
+
+
+def partition_stock_movements(apps, schema_editor):
+    # PostgreSQL only; other backends keep the plain table and rely on the
+    # created_at indexes added in 0006
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_stock_movements(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0006_stock_movement_partitioning'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_stock_movements, unpartition_stock_movements),
+    ]
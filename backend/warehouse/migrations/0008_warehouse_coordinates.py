@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_partition_stock_movement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warehouse',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='warehouse',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
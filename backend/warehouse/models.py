@@ -8,6 +8,8 @@ class Warehouse(models.Model):
     name = models.CharField(max_length=100)
     code = models.CharField(max_length=20, unique=True)
     address = models.TextField()
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     manager = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     capacity = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
@@ -38,6 +40,8 @@ class WarehouseTransfer(models.Model):
         ('pending', 'Pending Approval'),
         ('approved', 'Approved'),
         ('rejected', 'Rejected'),
+        ('in_transit', 'In Transit'),
+        ('partially_received', 'Partially Received'),
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ]
@@ -52,8 +56,9 @@ class WarehouseTransfer(models.Model):
     transfer_number = models.CharField(max_length=50, unique=True)
     from_warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='outgoing_transfers')
     to_warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='incoming_transfers')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField()
+    # Single-product transfers keep product/quantity; every transfer also has lines
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True)
+    quantity = models.PositiveIntegerField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=TRANSFER_STATUS, default='pending')
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
     
@@ -85,7 +90,7 @@ class WarehouseTransfer(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"Transfer {self.transfer_number}: {self.product.name} from {self.from_warehouse.name} to {self.to_warehouse.name}"
+        return f"Transfer {self.transfer_number}: {self.from_warehouse.name} to {self.to_warehouse.name}"
 
     def save(self, *args, **kwargs):
         if not self.transfer_number:
@@ -106,12 +111,37 @@ class WarehouseTransfer(models.Model):
         
         super().save(*args, **kwargs)
 
+class WarehouseTransferLine(models.Model):
+    """One product on a transfer document, with sent and received quantities"""
+    transfer = models.ForeignKey(WarehouseTransfer, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    quantity_sent = models.PositiveIntegerField(null=True, blank=True)
+    quantity_received = models.PositiveIntegerField(default=0)
+    notes = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['transfer', 'product'], name='unique_transfer_line_product'),
+        ]
+
+    @property
+    def quantity_outstanding(self):
+        if self.quantity_sent is None:
+            return self.quantity
+        return max(self.quantity_sent - self.quantity_received, 0)
+
+    def __str__(self):
+        return f"{self.transfer.transfer_number} - {self.product.name} x {self.quantity}"
+
 class StockMovement(models.Model):
     MOVEMENT_TYPES = [
         ('in', 'Stock In'),
         ('out', 'Stock Out'),
         ('transfer', 'Transfer'),
         ('adjustment', 'Adjustment'),
+        ('balance', 'Archived Balance'),
     ]
     
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
@@ -120,10 +150,116 @@ class StockMovement(models.Model):
     transfer = models.ForeignKey(WarehouseTransfer, on_delete=models.CASCADE, null=True, blank=True, related_name='movements')
     movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPES)
     quantity = models.IntegerField()
+    # Receipt cost per unit; filled from Product.cost when costing the movement if not given
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
     reference = models.CharField(max_length=100, blank=True)
     notes = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # On PostgreSQL the table is range-partitioned by month on created_at
+        # (migration 0007); the primary key there is (id, created_at)
+        indexes = [
+            models.Index(fields=['created_at'], name='stockmovement_created_idx'),
+            models.Index(fields=['warehouse', 'created_at'], name='stockmovement_wh_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.warehouse.name} - {self.movement_type} - {self.quantity}"
+
+class StockMovementSummary(models.Model):
+    """Monthly roll-up of archived stock movements per warehouse, product and type"""
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='movement_summaries')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='movement_summaries')
+    period = models.DateField(help_text='First day of the month')
+    movement_type = models.CharField(max_length=20, choices=StockMovement.MOVEMENT_TYPES)
+    movement_count = models.PositiveIntegerField()
+    quantity = models.BigIntegerField()
+    # Cost of goods issued by the archived outgoing movements
+    cost = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    first_movement_at = models.DateTimeField()
+    last_movement_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-period', 'warehouse', 'product']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['warehouse', 'product', 'period', 'movement_type'], name='unique_stock_movement_summary'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse.name} - {self.period:%Y-%m} - {self.movement_type}: {self.quantity}"
+
+class LowStockAlert(models.Model):
+    """Open/resolved low-stock condition for a product in a warehouse"""
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('resolved', 'Resolved'),
+    ]
+
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='low_stock_alerts')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='low_stock_alerts')
+    on_hand = models.IntegerField()
+    min_stock = models.IntegerField()
+    suggested_quantity = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open', db_index=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['warehouse', 'product'],
+                condition=models.Q(status='open'),
+                name='unique_open_low_stock_alert',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse.name} - {self.product.name}: {self.on_hand}/{self.min_stock}"
+
+class CostLayer(models.Model):
+    """
+    Quantity of a product received into a warehouse at a given unit cost.
+    FIFO keeps one layer per receipt; weighted average keeps a single open
+    layer per (warehouse, product) whose cost is re-averaged on each receipt.
+    """
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='cost_layers')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cost_layers')
+    # No database constraint: the partitioned movement table has no unique index on id alone.
+    # Archiving re-points open layers to the balance movement that replaces their receipt.
+    movement = models.ForeignKey(
+        StockMovement, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False, related_name='cost_layers'
+    )
+    received_at = models.DateTimeField()
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4)
+    quantity_received = models.IntegerField()
+    quantity_remaining = models.IntegerField()
+
+    class Meta:
+        ordering = ['received_at', 'id']
+        indexes = [
+            models.Index(fields=['warehouse', 'product', 'received_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse.name} - {self.product.name}: {self.quantity_remaining} @ {self.unit_cost}"
+
+class CostLayerConsumption(models.Model):
+    """Cost of goods issued by an outgoing movement, drawn from a layer"""
+    movement = models.ForeignKey(
+        StockMovement, on_delete=models.CASCADE, db_constraint=False, related_name='cost_consumptions'
+    )
+    # Null when stock went negative and the product's standard cost was used
+    layer = models.ForeignKey(CostLayer, on_delete=models.CASCADE, null=True, blank=True, related_name='consumptions')
+    quantity = models.IntegerField()
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4)
+
+    def __str__(self):
+        return f"Movement {self.movement_id}: {self.quantity} @ {self.unit_cost}"
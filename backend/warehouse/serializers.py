@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from .models import Warehouse, WarehouseLocation, StockMovement, WarehouseTransfer
+from .models import (
+    Warehouse, WarehouseLocation, StockMovement, StockMovementSummary, WarehouseTransfer, WarehouseTransferLine,
+    LowStockAlert
+)
 from users.serializers import UserSerializer
 from inventory.models import Product
 
@@ -9,7 +12,7 @@ class WarehouseSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Warehouse
-        fields = ['id', 'name', 'code', 'address', 'manager', 'manager_name', 'capacity', 'is_active', 'location_count', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'code', 'address', 'latitude', 'longitude', 'manager', 'manager_name', 'capacity', 'is_active', 'location_count', 'created_at', 'updated_at']
     
     def get_location_count(self, obj):
         return obj.locations.filter(is_active=True).count()
@@ -21,6 +24,19 @@ class WarehouseLocationSerializer(serializers.ModelSerializer):
         model = WarehouseLocation
         fields = ['id', 'warehouse', 'warehouse_name', 'name', 'code', 'aisle', 'shelf', 'bin', 'is_active', 'created_at']
 
+class WarehouseTransferLineSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_sku = serializers.CharField(source='product.sku', read_only=True)
+    quantity_outstanding = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = WarehouseTransferLine
+        fields = [
+            'id', 'product', 'product_name', 'product_sku', 'quantity',
+            'quantity_sent', 'quantity_received', 'quantity_outstanding', 'notes'
+        ]
+        read_only_fields = ['quantity_sent', 'quantity_received']
+
 class WarehouseTransferSerializer(serializers.ModelSerializer):
     from_warehouse_name = serializers.CharField(source='from_warehouse.name', read_only=True)
     to_warehouse_name = serializers.CharField(source='to_warehouse.name', read_only=True)
@@ -31,6 +47,7 @@ class WarehouseTransferSerializer(serializers.ModelSerializer):
     completed_by_name = serializers.CharField(source='completed_by.username', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     priority_display = serializers.CharField(source='get_priority_display', read_only=True)
+    lines = WarehouseTransferLineSerializer(many=True, read_only=True)
     
     class Meta:
         model = WarehouseTransfer
@@ -42,13 +59,20 @@ class WarehouseTransferSerializer(serializers.ModelSerializer):
             'approved_by', 'approved_by_name', 'approval_date', 'approval_notes',
             'completed_by', 'completed_by_name', 'completion_date', 
             'actual_quantity_sent', 'actual_quantity_received',
-            'waybill_number', 'tracking_notes', 'created_at', 'updated_at'
+            'waybill_number', 'tracking_notes', 'lines', 'created_at', 'updated_at'
         ]
         read_only_fields = ['transfer_number', 'request_date', 'created_at', 'updated_at']
     
+    def validate(self, attrs):
+        if self.instance is None and not (attrs.get('product') and attrs.get('quantity')):
+            raise serializers.ValidationError('product and quantity are required; use transfers/create/ for multi-line transfers')
+        return attrs
+
     def create(self, validated_data):
         validated_data['requested_by'] = self.context['request'].user
-        return super().create(validated_data)
+        transfer = super().create(validated_data)
+        WarehouseTransferLine.objects.create(transfer=transfer, product=transfer.product, quantity=transfer.quantity)
+        return transfer
 
 class StockMovementSerializer(serializers.ModelSerializer):
     warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
@@ -57,9 +81,36 @@ class StockMovementSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = StockMovement
-        fields = ['id', 'warehouse', 'warehouse_name', 'location', 'location_name', 'movement_type', 'quantity', 'reference', 'notes', 'created_by', 'created_by_name', 'created_at']
+        fields = ['id', 'warehouse', 'warehouse_name', 'location', 'location_name', 'movement_type', 'quantity', 'unit_cost', 'reference', 'notes', 'created_by', 'created_by_name', 'created_at']
         read_only_fields = ['created_by']
     
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
+
+class StockMovementSummarySerializer(serializers.ModelSerializer):
+    warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_sku = serializers.CharField(source='product.sku', read_only=True)
+
+    class Meta:
+        model = StockMovementSummary
+        fields = [
+            'id', 'warehouse', 'warehouse_name', 'product', 'product_name', 'product_sku', 'period',
+            'movement_type', 'movement_count', 'quantity', 'cost', 'first_movement_at', 'last_movement_at', 'archived_at'
+        ]
+        read_only_fields = fields
+
+class LowStockAlertSerializer(serializers.ModelSerializer):
+    warehouse_name = serializers.CharField(source='warehouse.name', read_only=True)
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_sku = serializers.CharField(source='product.sku', read_only=True)
+
+    class Meta:
+        model = LowStockAlert
+        fields = [
+            'id', 'warehouse', 'warehouse_name', 'product', 'product_name', 'product_sku',
+            'on_hand', 'min_stock', 'suggested_quantity', 'status',
+            'notified_at', 'resolved_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,1387 @@
+import logging
+import re
+from collections import defaultdict, deque
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from inventory.models import Product
+from utils.email_service import email_service
+from .models import (
+    CostLayer, CostLayerConsumption, LowStockAlert, StockMovement, StockMovementSummary, Warehouse,
+    WarehouseLocation, WarehouseTransfer, WarehouseTransferLine
+)
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class LowStockService:
+    """
+    Reorder-point detection over per-warehouse stock levels.
+
+    Warehouse stock is the signed sum of StockMovement quantities for a
+    (warehouse, product) pair. Detection opens one LowStockAlert per pair that
+    drops below Product.min_stock and resolves it once stock recovers; digests
+    group every un-notified alert into a single email per recipient.
+    """
+
+    FALLBACK_RECIPIENT_ROLES = ['superadmin', 'admin']
+
+    def detect(self, warehouse_ids=None, product_ids=None):
+        """
+        Re-evaluate stock levels and sync LowStockAlert rows.
+
+        With no arguments the whole network is scanned; passing ids restricts
+        the scan to the touched warehouses/products so it can run after each
+        stock-changing operation.
+        """
+        movements = StockMovement.objects.filter(product__isnull=False, product__min_stock__gt=0)
+        open_alerts = LowStockAlert.objects.filter(status='open')
+        if warehouse_ids is not None:
+            movements = movements.filter(warehouse_id__in=warehouse_ids)
+            open_alerts = open_alerts.filter(warehouse_id__in=warehouse_ids)
+        if product_ids is not None:
+            movements = movements.filter(product_id__in=product_ids)
+            open_alerts = open_alerts.filter(product_id__in=product_ids)
+
+        low_stock = (
+            movements.values('warehouse_id', 'product_id', 'product__min_stock', 'product__max_stock')
+            .annotate(on_hand=Sum('quantity'))
+            .filter(on_hand__lt=F('product__min_stock'))
+        )
+
+        existing = {(alert.warehouse_id, alert.product_id): alert for alert in open_alerts}
+        now = timezone.now()
+        to_create, to_update = [], []
+
+        for row in low_stock:
+            key = (row['warehouse_id'], row['product_id'])
+            suggested = self.suggest_reorder_quantity(
+                row['on_hand'], row['product__min_stock'], row['product__max_stock']
+            )
+            alert = existing.pop(key, None)
+            if alert is None:
+                to_create.append(LowStockAlert(
+                    warehouse_id=key[0],
+                    product_id=key[1],
+                    on_hand=row['on_hand'],
+                    min_stock=row['product__min_stock'],
+                    suggested_quantity=suggested,
+                ))
+            elif alert.on_hand != row['on_hand'] or alert.suggested_quantity != suggested:
+                alert.on_hand = row['on_hand']
+                alert.min_stock = row['product__min_stock']
+                alert.suggested_quantity = suggested
+                alert.updated_at = now
+                to_update.append(alert)
+
+        # Whatever is still in `existing` is back above its reorder point
+        resolved = list(existing.values())
+        for alert in resolved:
+            alert.status = 'resolved'
+            alert.resolved_at = now
+            alert.updated_at = now
+
+        LowStockAlert.objects.bulk_create(to_create)
+        if to_update:
+            LowStockAlert.objects.bulk_update(
+                to_update, ['on_hand', 'min_stock', 'suggested_quantity', 'updated_at']
+            )
+        if resolved:
+            LowStockAlert.objects.bulk_update(resolved, ['status', 'resolved_at', 'updated_at'])
+
+        return {
+            'opened': len(to_create),
+            'updated': len(to_update),
+            'resolved': len(resolved),
+        }
+
+    @staticmethod
+    def suggest_reorder_quantity(on_hand, min_stock, max_stock):
+        """Quantity needed to bring stock back up to max_stock (or min_stock when unset)"""
+        target = max_stock if max_stock and max_stock > min_stock else min_stock
+        return max(target - on_hand, 0)
+
+    def send_digests(self):
+        """Send one digest per recipient covering all un-notified open alerts"""
+        alerts = list(
+            LowStockAlert.objects.filter(status='open', notified_at__isnull=True)
+            .select_related('warehouse__manager', 'product')
+            .order_by('warehouse__name', 'product__name')
+        )
+        if not alerts:
+            return {'alerts': 0, 'recipients': 0}
+
+        fallback_emails = None
+        by_recipient = defaultdict(list)
+        for alert in alerts:
+            manager = alert.warehouse.manager
+            if manager and manager.email:
+                recipients = [manager.email]
+            else:
+                if fallback_emails is None:
+                    fallback_emails = list(
+                        User.objects.filter(
+                            role__in=self.FALLBACK_RECIPIENT_ROLES, is_active=True
+                        ).exclude(email='').values_list('email', flat=True)
+                    )
+                recipients = fallback_emails
+            for email in recipients:
+                by_recipient[email].append(alert)
+
+        notified_ids = set()
+        for email, recipient_alerts in by_recipient.items():
+            if email_service.send_inventory_digest(email, recipient_alerts):
+                notified_ids.update(alert.id for alert in recipient_alerts)
+            else:
+                logger.warning(f"Low stock digest to {email} failed; alerts will be retried")
+
+        if notified_ids:
+            LowStockAlert.objects.filter(id__in=notified_ids).update(notified_at=timezone.now())
+
+        return {'alerts': len(notified_ids), 'recipients': len(by_recipient)}
+
+
+low_stock_service = LowStockService()
+
+
+class InventoryValuationService:
+    """
+    Perpetual inventory costing on top of StockMovement.
+
+    Incoming movements (positive quantity) add cost layers, outgoing ones
+    (negative quantity) consume them oldest-first and record the issued cost
+    as CostLayerConsumption rows, which is the COGS ledger. Receipts are
+    costed at StockMovement.unit_cost (defaulting to Product.cost at the
+    time of receipt), except transfer receipts which carry the cost the
+    matching transfer-out consumed at the source warehouse.
+    """
+
+    METHODS = ['fifo', 'weighted_average']
+    COST_PLACES = Decimal('0.0001')
+    GROUPINGS = {
+        'warehouse': ['warehouse_id', 'warehouse__name'],
+        'category': ['product__category_id', 'product__category__name'],
+        'warehouse_category': ['warehouse_id', 'warehouse__name', 'product__category_id', 'product__category__name'],
+        'product': ['warehouse_id', 'warehouse__name', 'product_id', 'product__sku', 'product__name'],
+    }
+
+    def __init__(self, method=None):
+        self.method = method or getattr(settings, 'INVENTORY_COSTING_METHOD', 'fifo')
+        if self.method not in self.METHODS:
+            raise ValueError(f"Unknown costing method '{self.method}'. Use one of: {', '.join(self.METHODS)}")
+
+    def _receive(self, layers, movement_id, warehouse_id, product_id, quantity, received_at, unit_cost):
+        """Add a receipt to the open layers of one (warehouse, product); returns (layer, created)"""
+        unit_cost = Decimal(unit_cost)
+        if self.method == 'weighted_average' and layers:
+            layer = layers[-1]
+            total = layer.quantity_remaining * layer.unit_cost + quantity * unit_cost
+            layer.quantity_received += quantity
+            layer.quantity_remaining += quantity
+            layer.unit_cost = (total / layer.quantity_remaining).quantize(self.COST_PLACES)
+            return layer, False
+
+        layer = CostLayer(
+            warehouse_id=warehouse_id,
+            product_id=product_id,
+            movement_id=movement_id,
+            received_at=received_at,
+            unit_cost=unit_cost.quantize(self.COST_PLACES),
+            quantity_received=quantity,
+            quantity_remaining=quantity,
+        )
+        layers.append(layer)
+        return layer, True
+
+    def _issue(self, layers, movement_id, quantity, standard_cost):
+        """Consume ``quantity`` from the open layers oldest-first; returns (consumptions, touched layers)"""
+        consumptions, touched = [], []
+        while quantity and layers:
+            layer = layers[0]
+            taken = min(quantity, layer.quantity_remaining)
+            layer.quantity_remaining -= taken
+            quantity -= taken
+            consumptions.append(CostLayerConsumption(
+                movement_id=movement_id, layer=layer, quantity=taken, unit_cost=layer.unit_cost
+            ))
+            touched.append(layer)
+            if layer.quantity_remaining == 0:
+                layers.popleft()
+
+        if quantity:
+            # Issued more than was ever received here: cost the shortfall at standard cost
+            consumptions.append(CostLayerConsumption(
+                movement_id=movement_id, layer=None, quantity=quantity,
+                unit_cost=Decimal(standard_cost).quantize(self.COST_PLACES),
+            ))
+        return consumptions, touched
+
+    @staticmethod
+    def _average_cost(consumptions):
+        quantity = sum(c.quantity for c in consumptions)
+        if not quantity:
+            return None
+        return sum(c.quantity * c.unit_cost for c in consumptions) / quantity
+
+    def _transfer_cost(self, transfer_id, product_id):
+        """Average cost issued by the outgoing side of a transfer, if it was costed"""
+        return self._average_cost(list(
+            CostLayerConsumption.objects.filter(
+                movement__transfer_id=transfer_id,
+                movement__product_id=product_id,
+                movement__quantity__lt=0,
+            )
+        ))
+
+    def apply_movement(self, movement):
+        """
+        Cost a single, already saved StockMovement. Called from the post_save
+        signal; bulk writers that bypass signals must call apply_movements.
+        """
+        self.apply_movements([movement])
+
+    def apply_movements(self, movements):
+        """
+        Cost already saved StockMovements, in list order. Open layers,
+        standard costs and transfer-out costs are each read with one query
+        for the whole batch and the results written in bulk, so costing a
+        multi-line transfer does not cost queries per line.
+        """
+        movements = [movement for movement in movements if movement.product_id and movement.quantity]
+        if not movements:
+            return
+
+        with transaction.atomic():
+            pairs = {(movement.warehouse_id, movement.product_id) for movement in movements}
+            product_ids = {product_id for _, product_id in pairs}
+            open_layers = defaultdict(deque)
+            locked = (
+                CostLayer.objects.select_for_update()
+                .filter(
+                    warehouse_id__in={warehouse_id for warehouse_id, _ in pairs},
+                    product_id__in=product_ids,
+                    quantity_remaining__gt=0,
+                )
+                .order_by('received_at', 'id')
+            )
+            for layer in locked:
+                if (layer.warehouse_id, layer.product_id) in pairs:
+                    open_layers[(layer.warehouse_id, layer.product_id)].append(layer)
+            standard_costs = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'cost'))
+            transfer_issues = self._transfer_issues({
+                (movement.transfer_id, movement.product_id)
+                for movement in movements if movement.transfer_id and movement.quantity > 0
+            })
+
+            new_layers, consumptions, dirty, pinned = [], [], set(), []
+            for movement in movements:
+                layers = open_layers[(movement.warehouse_id, movement.product_id)]
+                standard_cost = standard_costs[movement.product_id]
+                if movement.quantity > 0:
+                    unit_cost = movement.unit_cost
+                    if movement.transfer_id:
+                        unit_cost = self._average_cost(transfer_issues.get((movement.transfer_id, movement.product_id), []))
+                    if unit_cost is None:
+                        unit_cost = standard_cost
+                    if movement.unit_cost is None:
+                        # Pin the receipt cost so a later recompute does not pick up a changed Product.cost
+                        movement.unit_cost = Decimal(unit_cost).quantize(self.COST_PLACES)
+                        pinned.append(movement)
+                    layer, created = self._receive(
+                        layers, movement.id, movement.warehouse_id, movement.product_id,
+                        movement.quantity, movement.created_at, unit_cost,
+                    )
+                    if created:
+                        new_layers.append(layer)
+                    elif layer.pk:
+                        dirty.add(layer)
+                else:
+                    issued, touched = self._issue(layers, movement.id, -movement.quantity, standard_cost)
+                    consumptions.extend(issued)
+                    dirty.update(layer for layer in touched if layer.pk)
+                    if movement.transfer_id:
+                        # A receipt later in the same batch is costed from this issue
+                        transfer_issues.setdefault((movement.transfer_id, movement.product_id), []).extend(issued)
+
+            # Layers first so consumptions can reference their primary keys
+            CostLayer.objects.bulk_create(new_layers)
+            CostLayerConsumption.objects.bulk_create(consumptions)
+            if dirty:
+                CostLayer.objects.bulk_update(list(dirty), ['unit_cost', 'quantity_received', 'quantity_remaining'])
+            if pinned:
+                StockMovement.objects.bulk_update(pinned, ['unit_cost'])
+
+    def _transfer_issues(self, keys):
+        """Consumptions of the outgoing side of each (transfer_id, product_id), in one query"""
+        issues = defaultdict(list)
+        if not keys:
+            return issues
+        consumptions = CostLayerConsumption.objects.filter(
+            movement__transfer_id__in={transfer_id for transfer_id, _ in keys},
+            movement__product_id__in={product_id for _, product_id in keys},
+            movement__quantity__lt=0,
+        ).annotate(transfer_id=F('movement__transfer_id'), product_id=F('movement__product_id'))
+        for consumption in consumptions:
+            key = (consumption.transfer_id, consumption.product_id)
+            if key in keys:
+                issues[key].append(consumption)
+        return issues
+
+    def recompute(self, warehouse_ids=None, product_ids=None, batch_size=5000):
+        """
+        Rebuild cost layers and consumptions by replaying movement history in
+        time order. Movements are streamed and layers/consumptions written in
+        batches, so memory is bounded by the number of open layers.
+        """
+        movements = StockMovement.objects.filter(product__isnull=False).exclude(quantity=0)
+        if warehouse_ids is not None:
+            movements = movements.filter(warehouse_id__in=warehouse_ids)
+        if product_ids is not None:
+            movements = movements.filter(product_id__in=product_ids)
+
+        scoped = warehouse_ids is not None or product_ids is not None
+        stats = {'movements': 0, 'layers': 0, 'consumptions': 0}
+        with transaction.atomic():
+            CostLayerConsumption.objects.filter(movement__in=movements).delete()
+            CostLayer.objects.filter(movement__in=movements).delete()
+
+            open_layers = defaultdict(deque)
+            transfer_costs = {}
+            pending_layers, pending_consumptions, dirty = [], [], set()
+
+            rows = movements.order_by('created_at', 'id').values_list(
+                'id', 'warehouse_id', 'product_id', 'transfer_id', 'quantity', 'created_at', 'unit_cost', 'product__cost'
+            ).iterator(chunk_size=batch_size)
+
+            for movement_id, warehouse_id, product_id, transfer_id, quantity, created_at, receipt_cost, standard_cost in rows:
+                stats['movements'] += 1
+                layers = open_layers[(warehouse_id, product_id)]
+                if quantity > 0:
+                    unit_cost = receipt_cost
+                    if transfer_id:
+                        unit_cost = transfer_costs.pop((transfer_id, product_id), None)
+                        if unit_cost is None and scoped:
+                            # The transfer-out may belong to a warehouse outside this replay
+                            unit_cost = self._transfer_cost(transfer_id, product_id)
+                        if unit_cost is None:
+                            unit_cost = receipt_cost
+                    layer, created = self._receive(
+                        layers, movement_id, warehouse_id, product_id, quantity, created_at,
+                        unit_cost if unit_cost is not None else standard_cost,
+                    )
+                    if created:
+                        pending_layers.append(layer)
+                    elif layer.pk:
+                        dirty.add(layer)
+                else:
+                    consumptions, touched = self._issue(layers, movement_id, -quantity, standard_cost)
+                    pending_consumptions.extend(consumptions)
+                    dirty.update(layer for layer in touched if layer.pk)
+                    if transfer_id:
+                        transfer_costs[(transfer_id, product_id)] = self._average_cost(consumptions)
+
+                if len(pending_layers) + len(pending_consumptions) >= batch_size:
+                    self._flush(pending_layers, pending_consumptions, stats, batch_size)
+
+            self._flush(pending_layers, pending_consumptions, stats, batch_size)
+            # Layers written in an earlier batch and changed afterwards
+            CostLayer.objects.bulk_update(
+                list(dirty), ['unit_cost', 'quantity_received', 'quantity_remaining'], batch_size=batch_size
+            )
+
+        return stats
+
+    def _flush(self, pending_layers, pending_consumptions, stats, batch_size):
+        # Layers first so consumptions can reference their primary keys
+        CostLayer.objects.bulk_create(pending_layers, batch_size=batch_size)
+        CostLayerConsumption.objects.bulk_create(pending_consumptions, batch_size=batch_size)
+        stats['layers'] += len(pending_layers)
+        stats['consumptions'] += len(pending_consumptions)
+        pending_layers.clear()
+        pending_consumptions.clear()
+
+    def valuation(self, group_by='warehouse', warehouse_id=None, category_id=None):
+        """On-hand quantity and value from open cost layers, in one grouped query"""
+        fields = self.GROUPINGS.get(group_by)
+        if fields is None:
+            raise ValueError(f"group_by must be one of: {', '.join(self.GROUPINGS)}")
+
+        layers = CostLayer.objects.filter(quantity_remaining__gt=0)
+        if warehouse_id:
+            layers = layers.filter(warehouse_id=warehouse_id)
+        if category_id:
+            layers = layers.filter(product__category_id=category_id)
+
+        return list(
+            layers.values(*fields)
+            .annotate(
+                quantity=Sum('quantity_remaining'),
+                value=Sum(F('quantity_remaining') * F('unit_cost'), output_field=DecimalField(max_digits=20, decimal_places=4)),
+            )
+            .order_by(*fields)
+        )
+
+    def cost_of_goods_sold(self, start=None, end=None, warehouse_id=None):
+        """Issued cost per warehouse for outgoing movements in [start, end]"""
+        consumptions = CostLayerConsumption.objects.all()
+        if start:
+            consumptions = consumptions.filter(movement__created_at__gte=start)
+        if end:
+            consumptions = consumptions.filter(movement__created_at__lte=end)
+        if warehouse_id:
+            consumptions = consumptions.filter(movement__warehouse_id=warehouse_id)
+
+        return list(
+            consumptions.values('movement__warehouse_id', 'movement__warehouse__name')
+            .annotate(
+                issued_quantity=Sum('quantity'),
+                cost=Sum(F('quantity') * F('unit_cost'), output_field=DecimalField(max_digits=20, decimal_places=4)),
+            )
+            .order_by('movement__warehouse__name')
+        )
+
+
+class TransferService:
+    """
+    Multi-line warehouse transfer documents.
+
+    Dispatch writes the outgoing side of every unsent line and receipt the
+    incoming side of the received quantities, each in one transaction with a
+    single StockMovement bulk insert and one Product.quantity UPDATE. Lines
+    may be received over several calls; the document stays
+    ``partially_received`` until every sent unit has arrived or it is closed
+    short. bulk_create skips the StockMovement post_save handlers, so costing
+    and low-stock checks are run here.
+    """
+
+    RECEIVABLE_STATUSES = ['approved', 'in_transit', 'partially_received']
+
+    def create(self, from_warehouse, to_warehouse, lines, user=None, **fields):
+        """Create a pending transfer; ``lines`` is a list of {'product', 'quantity', 'notes'}"""
+        if from_warehouse.id == to_warehouse.id:
+            raise ValueError('Source and destination warehouse must differ')
+        lines = self._clean_lines(lines)
+
+        products = Product.objects.in_bulk([line['product'] for line in lines])
+        errors = []
+        for line in lines:
+            product = products.get(line['product'])
+            if product is None:
+                errors.append(f"Product {line['product']} not found")
+            elif product.quantity < line['quantity']:
+                errors.append(
+                    f"Insufficient stock for {product.sku}. Available: {product.quantity}, Requested: {line['quantity']}"
+                )
+        if errors:
+            raise ValueError('; '.join(errors))
+
+        single = lines[0] if len(lines) == 1 else None
+        with transaction.atomic():
+            transfer = WarehouseTransfer.objects.create(
+                from_warehouse=from_warehouse,
+                to_warehouse=to_warehouse,
+                product_id=single['product'] if single else None,
+                quantity=single['quantity'] if single else None,
+                requested_by=user,
+                **fields,
+            )
+            WarehouseTransferLine.objects.bulk_create([
+                WarehouseTransferLine(
+                    transfer=transfer, product_id=line['product'], quantity=line['quantity'], notes=line['notes']
+                )
+                for line in lines
+            ])
+        return transfer
+
+    @staticmethod
+    def _clean_lines(lines):
+        if not lines:
+            raise ValueError('At least one line is required')
+        cleaned, seen = [], set()
+        for number, line in enumerate(lines, start=1):
+            try:
+                product_id = int(line['product'])
+                quantity = int(line['quantity'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f'Line {number}: product and quantity must be numbers')
+            if quantity <= 0:
+                raise ValueError(f'Line {number}: quantity must be positive')
+            if product_id in seen:
+                raise ValueError(f'Line {number}: product {product_id} appears more than once')
+            seen.add(product_id)
+            cleaned.append({'product': product_id, 'quantity': quantity, 'notes': line.get('notes', '')})
+        return cleaned
+
+    def approve_many(self, transfer_ids, user, notes=''):
+        """Approve every pending transfer in ``transfer_ids`` with one UPDATE"""
+        approved = WarehouseTransfer.objects.filter(id__in=transfer_ids, status='pending').update(
+            status='approved',
+            approved_by=user,
+            approval_date=timezone.now(),
+            approval_notes=notes,
+            updated_at=timezone.now(),
+        )
+        transaction.on_commit(WarehouseStatsService.invalidate)
+        return approved
+
+    def dispatch(self, transfer_id, user):
+        with transaction.atomic():
+            transfer = WarehouseTransfer.objects.select_for_update().select_related(
+                'from_warehouse', 'to_warehouse'
+            ).get(id=transfer_id)
+            if transfer.status != 'approved':
+                raise ValueError(f'Transfer must be approved first. Current status: {transfer.status}')
+            self._dispatch(transfer, user)
+            transfer.status = 'in_transit'
+            transfer.save()
+        return transfer
+
+    def _dispatch(self, transfer, user):
+        lines = list(transfer.lines.filter(quantity_sent__isnull=True))
+        if not lines:
+            return
+        available = dict(
+            Product.objects.select_for_update()
+            .filter(id__in=[line.product_id for line in lines])
+            .values_list('id', 'quantity')
+        )
+        short = [line for line in lines if available.get(line.product_id, 0) < line.quantity]
+        if short:
+            raise ValueError('Insufficient stock to dispatch: ' + ', '.join(
+                f'product {line.product_id} (available {available.get(line.product_id, 0)}, needed {line.quantity})'
+                for line in short
+            ))
+
+        for line in lines:
+            line.quantity_sent = line.quantity
+        self._write_movements([
+            StockMovement(
+                warehouse_id=transfer.from_warehouse_id,
+                product_id=line.product_id,
+                transfer=transfer,
+                movement_type='out',
+                quantity=-line.quantity,
+                reference=f'Transfer out to {transfer.to_warehouse.name}',
+                notes=f'Transfer {transfer.transfer_number}',
+                created_by=user,
+            )
+            for line in lines
+        ])
+        WarehouseTransferLine.objects.bulk_update(lines, ['quantity_sent'])
+        self._adjust_product_quantities({line.product_id: -line.quantity for line in lines})
+        transfer.actual_quantity_sent = (transfer.actual_quantity_sent or 0) + sum(line.quantity for line in lines)
+
+    def receive(self, transfer_id, user, quantities=None, close=False, tracking_notes=''):
+        """
+        Receive ``quantities`` ({line_id: quantity}) or everything outstanding.
+        Unsent lines are dispatched first; ``close`` completes the document
+        even when some sent quantity never arrived (and, without
+        ``quantities``, receives nothing further).
+        """
+        with transaction.atomic():
+            transfer = WarehouseTransfer.objects.select_for_update().select_related(
+                'from_warehouse', 'to_warehouse'
+            ).get(id=transfer_id)
+            if transfer.status not in self.RECEIVABLE_STATUSES:
+                raise ValueError(f'Transfer must be approved first. Current status: {transfer.status}')
+
+            self._dispatch(transfer, user)
+            lines = list(transfer.lines.all())
+            by_id = {line.id: line for line in lines}
+            if quantities is None and not close:
+                quantities = {line.id: line.quantity_outstanding for line in lines}
+
+            received = []
+            for line_id, quantity in (quantities or {}).items():
+                line = by_id.get(int(line_id))
+                if line is None:
+                    raise ValueError(f'Line {line_id} does not belong to transfer {transfer.transfer_number}')
+                quantity = int(quantity)
+                if quantity < 0 or quantity > line.quantity_outstanding:
+                    raise ValueError(
+                        f'Line {line_id}: received quantity must be between 0 and {line.quantity_outstanding}'
+                    )
+                if quantity:
+                    line.quantity_received += quantity
+                    received.append((line, quantity))
+
+            if received:
+                self._write_movements([
+                    StockMovement(
+                        warehouse_id=transfer.to_warehouse_id,
+                        product_id=line.product_id,
+                        transfer=transfer,
+                        movement_type='in',
+                        quantity=quantity,
+                        reference=f'Transfer in from {transfer.from_warehouse.name}',
+                        notes=f'Transfer {transfer.transfer_number}',
+                        created_by=user,
+                    )
+                    for line, quantity in received
+                ])
+                WarehouseTransferLine.objects.bulk_update([line for line, _ in received], ['quantity_received'])
+                self._adjust_product_quantities({line.product_id: quantity for line, quantity in received})
+
+            transfer.actual_quantity_received = sum(line.quantity_received for line in lines)
+            if tracking_notes:
+                transfer.tracking_notes = tracking_notes
+            if close or all(line.quantity_outstanding == 0 for line in lines):
+                transfer.status = 'completed'
+                transfer.completed_by = user
+                transfer.completion_date = timezone.now()
+            else:
+                transfer.status = 'partially_received'
+            transfer.save()
+        return transfer
+
+    def complete_many(self, transfer_ids, user):
+        """Dispatch and fully receive several transfers in one transaction"""
+        with transaction.atomic():
+            return [self.receive(transfer_id, user) for transfer_id in transfer_ids]
+
+    @staticmethod
+    def _adjust_product_quantities(deltas):
+        Product.objects.filter(id__in=deltas).update(quantity=F('quantity') + Case(
+            *[When(id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+    @staticmethod
+    def _write_movements(movements):
+        movements = StockMovement.objects.bulk_create(movements)
+        try:
+            with transaction.atomic():
+                InventoryValuationService().apply_movements(movements)
+        except Exception as e:
+            logger.error(f"Costing failed for stock movements {[movement.id for movement in movements]}: {str(e)}")
+
+        warehouse_ids = sorted({movement.warehouse_id for movement in movements})
+        product_ids = sorted({movement.product_id for movement in movements})
+        transaction.on_commit(
+            lambda: low_stock_service.detect(warehouse_ids=warehouse_ids, product_ids=product_ids)
+        )
+        transaction.on_commit(WarehouseStatsService.invalidate)
+        return movements
+
+
+transfer_service = TransferService()
+
+
+class WarehouseStatsService:
+    """
+    Dashboard payload for warehouse_stats.
+
+    Each section is one grouped or conditional-aggregate query, and the whole
+    payload is cached until a warehouse, location, transfer or movement write
+    invalidates it (see signals.py). CACHE_TIMEOUT only bounds how stale the
+    rolling 7-day figures can get when nothing is written.
+    """
+
+    CACHE_KEY = 'warehouse:stats'
+    CACHE_TIMEOUT = 300
+    ACTIVITY_DAYS = 7
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.CACHE_KEY)
+
+    def get(self):
+        payload = cache.get(self.CACHE_KEY)
+        if payload is None:
+            payload = self.build()
+            cache.set(self.CACHE_KEY, payload, self.CACHE_TIMEOUT)
+        return payload
+
+    def build(self):
+        since = timezone.now() - timedelta(days=self.ACTIVITY_DAYS)
+
+        warehouses = list(
+            Warehouse.objects.values('id', 'name', 'code', 'is_active')
+            .annotate(location_count=Count('locations', filter=Q(locations__is_active=True)))
+            .order_by('name')
+        )
+
+        movements_by_warehouse = {
+            row.pop('warehouse_id'): row
+            for row in StockMovement.objects.values('warehouse_id').annotate(
+                movement_count=Count('id'),
+                on_hand=Sum('quantity', filter=Q(product__isnull=False)),
+                inbound_last_7_days=Sum('quantity', filter=Q(quantity__gt=0, created_at__gte=since)),
+                outbound_last_7_days=Sum(-F('quantity'), filter=Q(quantity__lt=0, created_at__gte=since)),
+            ).order_by()
+        }
+        value_by_warehouse = dict(
+            CostLayer.objects.filter(quantity_remaining__gt=0)
+            .values('warehouse_id')
+            .annotate(value=Sum(F('quantity_remaining') * F('unit_cost'), output_field=DecimalField(max_digits=20, decimal_places=4)))
+            .order_by()
+            .values_list('warehouse_id', 'value')
+        )
+
+        for warehouse in warehouses:
+            movements = movements_by_warehouse.get(warehouse['id'], {})
+            warehouse.update({
+                'movement_count': movements.get('movement_count', 0),
+                'on_hand': movements.get('on_hand') or 0,
+                'inbound_last_7_days': movements.get('inbound_last_7_days') or 0,
+                'outbound_last_7_days': movements.get('outbound_last_7_days') or 0,
+                'stock_value': value_by_warehouse.get(warehouse['id']) or 0,
+            })
+
+        transfers = WarehouseTransfer.objects.aggregate(**{
+            f'{code}_transfers': Count('id', filter=Q(status=code))
+            for code, _ in WarehouseTransfer.TRANSFER_STATUS
+        })
+
+        movement_stats = list(
+            StockMovement.objects.values('movement_type').annotate(count=Count('id')).order_by('-count')
+        )
+
+        active = [warehouse for warehouse in warehouses if warehouse['is_active']]
+        return {
+            'total_warehouses': len(active),
+            'total_locations': sum(warehouse['location_count'] for warehouse in active),
+            'total_movements': sum(row['count'] for row in movement_stats),
+            'total_stock_value': sum(warehouse['stock_value'] for warehouse in warehouses),
+            **transfers,
+            'movement_stats': movement_stats,
+            'warehouses': warehouses,
+            'recent_activity': list(
+                StockMovement.objects.order_by('-created_at')[:10].values(
+                    'id', 'warehouse__name', 'movement_type', 'quantity', 'reference', 'created_at', 'created_by__username'
+                )
+            ),
+            'generated_at': timezone.now(),
+        }
+
+
+warehouse_stats_service = WarehouseStatsService()
+
+
+class StockMovementArchiveService:
+    """
+    Monthly partition upkeep and archival for StockMovement.
+
+    On PostgreSQL the movement table is range-partitioned by month on
+    created_at (warehouse migration 0007); elsewhere it is a plain table and
+    date-bounded queries use the created_at indexes instead. Archiving rolls
+    every movement before the cutoff month into StockMovementSummary rows and
+    replaces them with one ``balance`` movement per (warehouse, product), so
+    per-warehouse stock (the signed sum of movements) is unchanged and open
+    cost layers are re-pointed to the balance that now stands for their
+    receipt. Whole archived months are dropped as partitions.
+    """
+
+    TABLE = StockMovement._meta.db_table
+
+    @staticmethod
+    def month_start(value, offset=0):
+        index = value.year * 12 + value.month - 1 + offset
+        return date(index // 12, index % 12 + 1, 1)
+
+    def _as_datetime(self, month):
+        return timezone.make_aware(datetime(month.year, month.month, 1))
+
+    def is_partitioned(self):
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [self.TABLE]
+            )
+            return cursor.fetchone() is not None
+
+    def partitions(self):
+        """{month: partition table name} for the monthly partitions that exist"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT child.relname FROM pg_inherits '
+                'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                'WHERE pg_inherits.inhparent = %s::regclass',
+                [self.TABLE],
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        prefix = f'{self.TABLE}_p'
+        return {
+            date(int(name[-7:-3]), int(name[-2:]), 1): name
+            for name in names if name.startswith(prefix)
+        }
+
+    def ensure_partitions(self, months_ahead=3):
+        """
+        Create monthly partitions up to ``months_ahead`` months from now.
+
+        PostgreSQL refuses to create a partition while the DEFAULT partition
+        holds rows in its range, so when it does the DEFAULT partition is
+        detached, the month's rows are moved into the new partition and it
+        is reattached, all in one transaction.
+        """
+        if not self.is_partitioned():
+            return []
+        existing = self.partitions()
+        current = self.month_start(timezone.now())
+        default = f'{self.TABLE}_default'
+        created = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [default])
+            has_default = cursor.fetchone()[0]
+            detached = False
+            for offset in range(months_ahead + 1):
+                month = self.month_start(current, offset)
+                if month in existing:
+                    continue
+                name = f'{self.TABLE}_p{month:%Y_%m}'
+                bounds = [month.isoformat(), self.month_start(month, 1).isoformat()]
+                stranded = False
+                if has_default:
+                    cursor.execute(
+                        f'SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s)', bounds
+                    )
+                    stranded = cursor.fetchone()[0]
+                if stranded and not detached:
+                    cursor.execute(f'ALTER TABLE {self.TABLE} DETACH PARTITION {default}')
+                    detached = True
+                cursor.execute(
+                    f"CREATE TABLE {name} PARTITION OF {self.TABLE} "
+                    f"FOR VALUES FROM ('{bounds[0]}') TO ('{bounds[1]}')"
+                )
+                if stranded:
+                    cursor.execute(
+                        f'INSERT INTO {name} SELECT * FROM {default} WHERE created_at >= %s AND created_at < %s', bounds
+                    )
+                    cursor.execute(f'DELETE FROM {default} WHERE created_at >= %s AND created_at < %s', bounds)
+                created.append(name)
+            if detached:
+                cursor.execute(f'ALTER TABLE {self.TABLE} ATTACH PARTITION {default} DEFAULT')
+        return created
+
+    def archive(self, keep_months=12, dry_run=False, batch_size=5000):
+        """Archive every movement older than the last ``keep_months`` whole months"""
+        cutoff_month = self.month_start(timezone.now(), -keep_months)
+        cutoff = self._as_datetime(cutoff_month)
+        old = StockMovement.objects.filter(created_at__lt=cutoff)
+
+        with transaction.atomic():
+            summaries = self._summaries(old)
+            stats = {
+                'cutoff': cutoff_month,
+                'movements': sum(summary.movement_count for summary in summaries),
+                'summaries': len(summaries),
+                'balances': 0,
+                'partitions_dropped': 0,
+            }
+            if dry_run or not old.exists():
+                return stats
+
+            self._save_summaries(summaries)
+            stats['balances'] = self._write_balances(old, cutoff)
+
+            # Closed layers and COGS rows of archived movements are now only in the summaries
+            CostLayer.objects.filter(movement__created_at__lt=cutoff).update(movement=None)
+            CostLayerConsumption.objects.filter(movement__created_at__lt=cutoff).delete()
+
+            if self.is_partitioned():
+                with connection.cursor() as cursor:
+                    for month, name in self.partitions().items():
+                        if month < cutoff_month:
+                            cursor.execute(f'ALTER TABLE {self.TABLE} DETACH PARTITION {name}')
+                            cursor.execute(f'DROP TABLE {name}')
+                            stats['partitions_dropped'] += 1
+            # Rows outside dropped partitions (plain table, or the default partition)
+            while True:
+                ids = list(old.values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    break
+                StockMovement.objects.filter(id__in=ids).delete()
+
+        transaction.on_commit(WarehouseStatsService.invalidate)
+        return stats
+
+    def _summaries(self, movements):
+        rows = (
+            movements.exclude(movement_type='balance')
+            .annotate(period=TruncMonth('created_at'))
+            .values('warehouse_id', 'product_id', 'period', 'movement_type')
+            .annotate(
+                movement_count=Count('id'),
+                quantity=Sum('quantity'),
+                first_movement_at=Min('created_at'),
+                last_movement_at=Max('created_at'),
+            )
+            .order_by()
+        )
+        costs = {
+            (row['movement__warehouse_id'], row['movement__product_id'], row['period'].date(), row['movement__movement_type']): row['cost']
+            for row in CostLayerConsumption.objects.filter(movement__in=movements)
+            .annotate(period=TruncMonth('movement__created_at'))
+            .values('movement__warehouse_id', 'movement__product_id', 'period', 'movement__movement_type')
+            .annotate(cost=Sum(F('quantity') * F('unit_cost'), output_field=DecimalField(max_digits=20, decimal_places=4)))
+            .order_by()
+        }
+        summaries = []
+        for row in rows:
+            period = row.pop('period').date()
+            key = (row['warehouse_id'], row['product_id'], period, row['movement_type'])
+            summaries.append(StockMovementSummary(period=period, cost=costs.get(key) or 0, **row))
+        return summaries
+
+    def _save_summaries(self, summaries):
+        # Months archived before (e.g. back-dated movements) are added to, not replaced
+        existing = {
+            (summary.warehouse_id, summary.product_id, summary.period, summary.movement_type): summary
+            for summary in StockMovementSummary.objects.filter(period__in={summary.period for summary in summaries})
+        }
+        new, changed = [], []
+        for summary in summaries:
+            current = existing.get((summary.warehouse_id, summary.product_id, summary.period, summary.movement_type))
+            if current is None:
+                new.append(summary)
+                continue
+            current.movement_count += summary.movement_count
+            current.quantity += summary.quantity
+            current.cost += summary.cost
+            current.first_movement_at = min(current.first_movement_at, summary.first_movement_at)
+            current.last_movement_at = max(current.last_movement_at, summary.last_movement_at)
+            changed.append(current)
+        StockMovementSummary.objects.bulk_create(new, batch_size=1000)
+        StockMovementSummary.objects.bulk_update(
+            changed, ['movement_count', 'quantity', 'cost', 'first_movement_at', 'last_movement_at'], batch_size=1000
+        )
+
+    def _write_balances(self, old, cutoff):
+        open_costs = {
+            (row['warehouse_id'], row['product_id']): row['value'] / row['quantity']
+            for row in CostLayer.objects.filter(movement__created_at__lt=cutoff, quantity_remaining__gt=0)
+            .values('warehouse_id', 'product_id')
+            .annotate(
+                quantity=Sum('quantity_remaining'),
+                value=Sum(F('quantity_remaining') * F('unit_cost'), output_field=DecimalField(max_digits=20, decimal_places=4)),
+            )
+            .order_by()
+        }
+        balances = StockMovement.objects.bulk_create([
+            StockMovement(
+                warehouse_id=row['warehouse_id'],
+                product_id=row['product_id'],
+                movement_type='balance',
+                quantity=row['quantity'],
+                unit_cost=open_costs.get((row['warehouse_id'], row['product_id'])),
+                reference=f'Archived balance before {cutoff:%Y-%m}',
+            )
+            for row in old.filter(product__isnull=False).values('warehouse_id', 'product_id')
+            .annotate(quantity=Sum('quantity')).order_by()
+            if row['quantity'] or (row['warehouse_id'], row['product_id']) in open_costs
+        ], batch_size=1000)
+        # bulk_create fills created_at with now(); the balance belongs at the cutoff
+        StockMovement.objects.filter(id__in=[balance.id for balance in balances]).update(created_at=cutoff)
+
+        CostLayer.objects.filter(movement__created_at__lt=cutoff, quantity_remaining__gt=0).update(
+            movement_id=Subquery(
+                StockMovement.objects.filter(
+                    movement_type='balance',
+                    created_at=cutoff,
+                    warehouse_id=OuterRef('warehouse_id'),
+                    product_id=OuterRef('product_id'),
+                ).order_by('-id').values('id')[:1]
+            )
+        )
+        return len(balances)
+
+
+stock_movement_archive_service = StockMovementArchiveService()
+
+
+class PickListService:
+    """
+    Pick lists for sales orders and transfers, batched into waves.
+
+    Each line is picked from the location in its warehouse that holds the
+    most stock of the product (signed sum of located StockMovements). Sales
+    orders carry no warehouse, so unless one is given each line goes to the
+    warehouse with the most stock. Documents are packed into waves of at
+    most ``max_orders`` documents / ``max_lines`` lines per warehouse, picks
+    of the same product at the same location are merged, and stops are
+    ordered along an S-shaped walk: aisles in natural order, shelves and
+    bins ascending in one aisle and descending in the next. Lines without a
+    known location come last.
+    """
+
+    def build(self, order_ids=(), transfer_ids=(), warehouse_id=None, max_orders=10, max_lines=500):
+        documents = self._order_documents(order_ids, warehouse_id) + self._transfer_documents(transfer_ids)
+        product_ids = {line[0] for document in documents for line in document['lines']}
+        warehouse_ids = {document['warehouse_id'] for document in documents if document['warehouse_id']}
+
+        locations = self._pick_locations(warehouse_ids, product_ids)
+        products = {
+            row['id']: row for row in Product.objects.filter(id__in=product_ids).values('id', 'sku', 'name', 'unit')
+        }
+        warehouses = {
+            row['id']: row for row in Warehouse.objects.filter(id__in=warehouse_ids).values('id', 'name', 'code')
+        }
+
+        waves, unassigned = [], []
+        by_warehouse = defaultdict(list)
+        for document in documents:
+            if document['warehouse_id'] is None:
+                unassigned.extend(
+                    {'document': document['reference'], 'product': products[product_id]['sku'], 'quantity': quantity}
+                    for product_id, quantity in document['lines'] if product_id in products
+                )
+            else:
+                by_warehouse[document['warehouse_id']].append(document)
+
+        for warehouse_id in sorted(by_warehouse, key=lambda key: warehouses[key]['name']):
+            for batch in self._batches(by_warehouse[warehouse_id], max_orders, max_lines):
+                waves.append({
+                    'wave': len(waves) + 1,
+                    'warehouse': warehouses[warehouse_id],
+                    'documents': [document['reference'] for document in batch],
+                    'line_count': sum(len(document['lines']) for document in batch),
+                    'stops': self._route(batch, warehouse_id, locations, products),
+                })
+        return {'waves': waves, 'unassigned': unassigned}
+
+    def _order_documents(self, order_ids, warehouse_id):
+        if not order_ids:
+            return []
+        from sales.models import SalesOrderItem
+
+        items = list(
+            SalesOrderItem.objects.filter(sales_order_id__in=order_ids)
+            .values_list('sales_order_id', 'sales_order__order_number', 'product_id', 'quantity')
+            .order_by('sales_order_id', 'id')
+        )
+        stocked = {} if warehouse_id else self._best_stocked_warehouses({item[2] for item in items})
+
+        documents = {}
+        for order_id, order_number, product_id, quantity in items:
+            source = int(warehouse_id) if warehouse_id else stocked.get(product_id)
+            key = (order_id, source)
+            if key not in documents:
+                documents[key] = {'reference': order_number, 'warehouse_id': source, 'lines': []}
+            documents[key]['lines'].append((product_id, quantity))
+        return list(documents.values())
+
+    def _transfer_documents(self, transfer_ids):
+        if not transfer_ids:
+            return []
+        documents = {}
+        for transfer_id, number, warehouse_id, product_id, quantity in (
+            WarehouseTransferLine.objects.filter(transfer_id__in=transfer_ids, quantity_sent__isnull=True)
+            .values_list('transfer_id', 'transfer__transfer_number', 'transfer__from_warehouse_id', 'product_id', 'quantity')
+            .order_by('transfer_id', 'id')
+        ):
+            document = documents.setdefault(transfer_id, {'reference': number, 'warehouse_id': warehouse_id, 'lines': []})
+            document['lines'].append((product_id, quantity))
+        return list(documents.values())
+
+    @staticmethod
+    def _best_stocked_warehouses(product_ids):
+        best = {}
+        for warehouse_id, product_id, on_hand in (
+            StockMovement.objects.filter(product_id__in=product_ids)
+            .values('warehouse_id', 'product_id')
+            .annotate(on_hand=Sum('quantity'))
+            .filter(on_hand__gt=0)
+            .values_list('warehouse_id', 'product_id', 'on_hand')
+        ):
+            if product_id not in best or on_hand > best[product_id][1]:
+                best[product_id] = (warehouse_id, on_hand)
+        return {product_id: warehouse_id for product_id, (warehouse_id, _) in best.items()}
+
+    @staticmethod
+    def _pick_locations(warehouse_ids, product_ids):
+        """{(warehouse_id, product_id): location dict} for the best-stocked location"""
+        best = {}
+        for warehouse_id, product_id, location_id, on_hand in (
+            StockMovement.objects.filter(
+                warehouse_id__in=warehouse_ids, product_id__in=product_ids, location__isnull=False
+            )
+            .values('warehouse_id', 'product_id', 'location_id')
+            .annotate(on_hand=Sum('quantity'))
+            .filter(on_hand__gt=0)
+            .values_list('warehouse_id', 'product_id', 'location_id', 'on_hand')
+        ):
+            key = (warehouse_id, product_id)
+            if key not in best or on_hand > best[key][1]:
+                best[key] = (location_id, on_hand)
+
+        details = {
+            row['id']: row for row in WarehouseLocation.objects.filter(
+                id__in={location_id for location_id, _ in best.values()}
+            ).values('id', 'code', 'name', 'aisle', 'shelf', 'bin')
+        }
+        return {key: details[location_id] for key, (location_id, _) in best.items() if location_id in details}
+
+    @staticmethod
+    def _batches(documents, max_orders, max_lines):
+        batch, lines = [], 0
+        for document in documents:
+            size = len(document['lines'])
+            if batch and (len(batch) >= max_orders or lines + size > max_lines):
+                yield batch
+                batch, lines = [], 0
+            batch.append(document)
+            lines += size
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _natural_key(value):
+        """'A2' sorts before 'A10'"""
+        return tuple(
+            (0, int(part), '') if part.isdigit() else (1, 0, part.lower())
+            for part in re.split(r'(\d+)', value or '') if part
+        )
+
+    def _route(self, documents, warehouse_id, locations, products):
+        picks = {}
+        for document in documents:
+            for product_id, quantity in document['lines']:
+                location = locations.get((warehouse_id, product_id))
+                key = (location['id'] if location else None, product_id)
+                pick = picks.get(key)
+                if pick is None:
+                    product = products.get(product_id, {})
+                    pick = picks[key] = {
+                        'location': location,
+                        'product_id': product_id,
+                        'sku': product.get('sku'),
+                        'name': product.get('name'),
+                        'unit': product.get('unit'),
+                        'quantity': 0,
+                        'allocations': [],
+                    }
+                pick['quantity'] += quantity
+                pick['allocations'].append({'document': document['reference'], 'quantity': quantity})
+
+        by_aisle, unlocated = defaultdict(list), []
+        for pick in picks.values():
+            if pick['location']:
+                by_aisle[pick['location']['aisle']].append(pick)
+            else:
+                unlocated.append(pick)
+
+        route = []
+        for index, aisle in enumerate(sorted(by_aisle, key=self._natural_key)):
+            stops = sorted(by_aisle[aisle], key=lambda pick: (
+                self._natural_key(pick['location']['shelf']),
+                self._natural_key(pick['location']['bin']),
+                pick['location']['code'],
+                pick['sku'] or '',
+            ))
+            # Walk up every other aisle and back down the next
+            route.extend(reversed(stops) if index % 2 else stops)
+        route.extend(sorted(unlocated, key=lambda pick: pick['sku'] or ''))
+
+        for sequence, pick in enumerate(route, start=1):
+            pick['sequence'] = sequence
+        return route
+
+
+pick_list_service = PickListService()
+
+
+class ReplenishmentPlanner:
+    """
+    Proposes warehouse-to-warehouse transfers that rebalance stock.
+
+    Works on dense (warehouse x product) arrays for every pair that has
+    movement history, so a whole network is planned with a handful of NumPy
+    operations:
+
+    - velocity: outbound units per day over ``velocity_days``, excluding
+      transfer-outs (they move stock, they are not demand)
+    - reorder point: max(min_stock, velocity * lead_days)
+    - target: velocity * cover_days, raised to the reorder point and
+      clamped to [min_stock, max_stock]
+    - need: target - position where position (on_hand plus open inbound
+      transfers, less stock committed to unsent outbound lines) is below
+      the reorder point
+    - surplus: on_hand - committed - target where that is above target
+
+    Open transfers (pending through partially received) are netted out so a
+    plan created and then re-run, or ``plan_replenishment --create`` on a
+    schedule, does not propose the same moves twice.
+
+    Needs and surpluses of each product are matched largest-first (at most
+    needs + surpluses - 1 moves per product), and moves are grouped into one
+    multi-line transfer per (source, destination) pair.
+    """
+
+    OPEN_STATUSES = ['pending', *TransferService.RECEIVABLE_STATUSES]
+
+    def __init__(self, velocity_days=30, lead_days=7, cover_days=30):
+        self.velocity_days = velocity_days
+        self.lead_days = lead_days
+        self.cover_days = cover_days
+
+    def plan(self, warehouse_ids=None):
+        since = timezone.now() - timedelta(days=self.velocity_days)
+        movements = StockMovement.objects.filter(product__isnull=False, warehouse__is_active=True)
+        if warehouse_ids:
+            movements = movements.filter(warehouse_id__in=warehouse_ids)
+        rows = np.array(list(
+            movements.values('warehouse_id', 'product_id')
+            .annotate(
+                on_hand=Sum('quantity'),
+                outbound=Sum(-F('quantity'), filter=Q(quantity__lt=0, transfer__isnull=True, created_at__gte=since)),
+            )
+            .order_by()
+            .values_list('warehouse_id', 'product_id', 'on_hand', 'outbound')
+        ), dtype=float).reshape(-1, 4)
+        rows = np.nan_to_num(rows)
+
+        warehouse_keys = np.unique(rows[:, 0]).astype(np.int64)
+        product_keys = np.unique(rows[:, 1]).astype(np.int64)
+        w = np.searchsorted(warehouse_keys, rows[:, 0])
+        p = np.searchsorted(product_keys, rows[:, 1])
+        shape = (len(warehouse_keys), len(product_keys))
+
+        on_hand = np.zeros(shape)
+        velocity = np.zeros(shape)
+        carried = np.zeros(shape, dtype=bool)
+        on_hand[w, p] = rows[:, 2]
+        velocity[w, p] = rows[:, 3] / self.velocity_days
+        carried[w, p] = True
+        inbound, committed = self._open_transfers(warehouse_keys, product_keys)
+        position = on_hand + inbound - committed
+
+        limits = dict((row[0], row[1:]) for row in Product.objects.filter(
+            id__in=product_keys.tolist()
+        ).values_list('id', 'min_stock', 'max_stock'))
+        min_stock = np.array([limits[key][0] for key in product_keys.tolist()], dtype=float)
+        max_stock = np.array([limits[key][1] or np.inf for key in product_keys.tolist()], dtype=float)
+
+        reorder_point = np.maximum(min_stock, np.ceil(velocity * self.lead_days))
+        target = np.maximum(np.minimum(np.maximum(np.ceil(velocity * self.cover_days), reorder_point), max_stock), min_stock)
+        need = np.where(carried & (position < reorder_point), np.ceil(target - position), 0).astype(np.int64)
+        surplus = np.where(carried, np.floor(np.maximum(on_hand - committed - target, 0)), 0).astype(np.int64)
+
+        product_index, source_index, destination_index, quantities = self._allocate(need.T, surplus.T)
+        shortfall = need.sum(axis=0) - np.bincount(product_index, weights=quantities, minlength=shape[1]).astype(np.int64)
+
+        return self._documents(
+            warehouse_keys[source_index], warehouse_keys[destination_index], product_keys[product_index], quantities,
+            unmet_lines=int((shortfall > 0).sum()), unmet_quantity=int(shortfall.sum()),
+        )
+
+    def _open_transfers(self, warehouse_keys, product_keys):
+        """
+        (inbound, committed) arrays shaped like on_hand: units still to
+        arrive at each destination, and units on unsent lines that are still
+        in each source's on_hand. Sent units already left the source.
+        """
+        shape = (len(warehouse_keys), len(product_keys))
+        inbound, committed = np.zeros(shape), np.zeros(shape)
+        rows = np.array(list(
+            WarehouseTransferLine.objects.filter(
+                transfer__status__in=self.OPEN_STATUSES, product_id__in=product_keys.tolist(),
+            ).values_list(
+                'transfer__from_warehouse_id', 'transfer__to_warehouse_id', 'product_id',
+                'quantity', 'quantity_sent', 'quantity_received',
+            )
+        ), dtype=float).reshape(-1, 6)
+        if not len(rows):
+            return inbound, committed
+
+        unsent = np.isnan(rows[:, 4])
+        outstanding = np.where(unsent, rows[:, 3], np.maximum(rows[:, 4] - rows[:, 5], 0))
+        p = np.searchsorted(product_keys, rows[:, 2])
+        for column, totals, quantities in ((1, inbound, outstanding), (0, committed, np.where(unsent, rows[:, 3], 0))):
+            w = np.searchsorted(warehouse_keys, rows[:, column]).clip(max=len(warehouse_keys) - 1)
+            known = warehouse_keys[w] == rows[:, column]
+            np.add.at(totals, (w[known], p[known]), quantities[known])
+        return inbound, committed
+
+    @staticmethod
+    def _allocate(need, surplus):
+        """
+        Match per-product needs and surpluses (product x warehouse arrays).
+
+        Each product's sorted needs and surpluses become back-to-back
+        intervals on one shared axis, offset per product; every segment
+        between consecutive interval ends is one move from the surplus
+        interval to the need interval it overlaps. Returns parallel arrays
+        (product, source warehouse, destination warehouse, quantity) of
+        row/column indices.
+        """
+        moved = np.minimum(need.sum(axis=1), surplus.sum(axis=1))
+        offsets = np.concatenate([[0], np.cumsum(moved)[:-1]])
+
+        def intervals(amounts):
+            order = np.argsort(-amounts, axis=1, kind='stable')
+            ranked = np.take_along_axis(amounts, order, axis=1)
+            ends = np.minimum(np.cumsum(ranked, axis=1), moved[:, None])
+            lengths = np.diff(ends, axis=1, prepend=0)
+            keep = lengths > 0
+            products = np.nonzero(keep)[0]
+            return (ends + offsets[:, None])[keep], products, order[keep]
+
+        need_ends, need_products, need_warehouses = intervals(need)
+        surplus_ends, _, surplus_warehouses = intervals(surplus)
+        if not len(need_ends):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, empty
+
+        breaks = np.union1d(need_ends, surplus_ends)
+        starts = np.concatenate([[0], breaks[:-1]])
+        need_at = np.searchsorted(need_ends, starts, side='right')
+        surplus_at = np.searchsorted(surplus_ends, starts, side='right')
+        return need_products[need_at], surplus_warehouses[surplus_at], need_warehouses[need_at], breaks - starts
+
+    @staticmethod
+    def _documents(sources, destinations, products, quantities, **totals):
+        documents = {}
+        for source, destination, product, quantity in zip(
+            sources.tolist(), destinations.tolist(), products.tolist(), quantities.tolist()
+        ):
+            document = documents.setdefault((source, destination), {
+                'from_warehouse': source, 'to_warehouse': destination, 'total_quantity': 0, 'lines': [],
+            })
+            document['lines'].append({'product': product, 'quantity': quantity})
+            document['total_quantity'] += quantity
+
+        transfers = sorted(documents.values(), key=lambda document: -document['total_quantity'])
+        return {
+            'transfers': transfers,
+            'transfer_count': len(transfers),
+            'line_count': len(quantities),
+            'moved_quantity': int(sum(quantities.tolist())),
+            **totals,
+        }
+
+    def create_transfers(self, plan, user=None):
+        """Turn a plan into pending multi-line transfers; returns (created, errors)"""
+        warehouses = Warehouse.objects.in_bulk(
+            {document['from_warehouse'] for document in plan['transfers']}
+            | {document['to_warehouse'] for document in plan['transfers']}
+        )
+        created, errors = [], []
+        for document in plan['transfers']:
+            try:
+                created.append(transfer_service.create(
+                    warehouses[document['from_warehouse']],
+                    warehouses[document['to_warehouse']],
+                    document['lines'],
+                    user=user,
+                    request_notes='Suggested by the replenishment planner',
+                ))
+            except ValueError as e:
+                errors.append({
+                    'from_warehouse': document['from_warehouse'],
+                    'to_warehouse': document['to_warehouse'],
+                    'error': str(e),
+                })
+        return created, errors
@@ -0,0 +1,55 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import StockMovement, Warehouse, WarehouseLocation, WarehouseTransfer
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _check_low_stock(warehouse_id, product_id):
+    from .services import low_stock_service
+    try:
+        low_stock_service.detect(warehouse_ids=[warehouse_id], product_ids=[product_id])
+    except Exception as e:
+        logger.error(f"Low stock check failed for warehouse {warehouse_id}, product {product_id}: {str(e)}")
+
+@receiver(post_save, sender=StockMovement)
+def apply_stock_movement_cost(sender, instance, created, **kwargs):
+    """
+    Feed new movements into the cost layers. Runs in a savepoint so a costing
+    failure is logged without aborting the stock operation itself.
+    """
+    if not created or not instance.product_id:
+        return
+    from .services import InventoryValuationService
+    try:
+        with transaction.atomic():
+            InventoryValuationService().apply_movement(instance)
+    except Exception as e:
+        logger.error(f"Costing failed for stock movement {instance.id}: {str(e)}")
+
+@receiver(post_save, sender=StockMovement)
+def handle_stock_movement_created(sender, instance, created, **kwargs):
+    """
+    Re-evaluate the reorder point of the touched (warehouse, product) pair once
+    the movement is committed. Bulk writers bypass signals and call
+    LowStockService.detect themselves.
+    """
+    if created and instance.product_id:
+        transaction.on_commit(partial(_check_low_stock, instance.warehouse_id, instance.product_id))
+
+@receiver(post_save, sender=StockMovement)
+@receiver(post_save, sender=WarehouseTransfer)
+@receiver(post_delete, sender=WarehouseTransfer)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+@receiver(post_save, sender=WarehouseLocation)
+@receiver(post_delete, sender=WarehouseLocation)
+def invalidate_warehouse_stats(sender, instance, **kwargs):
+    """
+    Drop the cached dashboard payload once the write is committed. Movements
+    are append-only; archiving deletes them in bulk and invalidates itself.
+    """
+    from .services import WarehouseStatsService
+    transaction.on_commit(WarehouseStatsService.invalidate)
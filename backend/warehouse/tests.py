@@ -1,3 +1,378 @@
+from datetime import timedelta
+from django.core import mail
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from inventory.models import Category, Product
+from warehouse.models import Warehouse, WarehouseLocation, StockMovement, StockMovementSummary, LowStockAlert, WarehouseTransfer, CostLayer
+from warehouse.services import (
+    LowStockService, InventoryValuationService, TransferService, StockMovementArchiveService, PickListService,
+    ReplenishmentPlanner, WarehouseStatsService,
+)
 
-# Create your tests here.
+User = get_user_model()
+
+class LowStockServiceTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='wm', password='wm', email='wm@example.com', role='manager')
+        self.warehouse = Warehouse.objects.create(name='Accra', code='ACC', address='Accra', manager=self.manager)
+        category = Category.objects.create(name='Condoms')
+        self.product = Product.objects.create(name='Fiesta', category=category, sku='FCS-001', min_stock=10, max_stock=50)
+        self.other = Product.objects.create(name='Kiss', category=category, sku='KIS-001', min_stock=5)
+        self.service = LowStockService()
+
+    def move(self, product, quantity):
+        StockMovement.objects.create(warehouse=self.warehouse, product=product, movement_type='in' if quantity > 0 else 'out', quantity=quantity)
+
+    def test_detect_opens_and_resolves_alerts(self):
+        self.move(self.product, 20)
+        self.move(self.product, -14)
+        self.move(self.other, 8)
+        self.service.detect()
+        alert = LowStockAlert.objects.get(status='open')
+        self.assertEqual(alert.product, self.product)
+        self.assertEqual(alert.on_hand, 6)
+        self.assertEqual(alert.suggested_quantity, 44)
+
+        # Re-running does not duplicate the open alert
+        self.assertEqual(self.service.detect()['opened'], 0)
+
+        self.move(self.product, 30)
+        self.service.detect(warehouse_ids=[self.warehouse.id], product_ids=[self.product.id])
+        alert.refresh_from_db()
+        self.assertEqual(alert.status, 'resolved')
+
+    def test_digest_sent_once_per_recipient(self):
+        self.move(self.product, 2)
+        self.move(self.other, 1)
+        self.service.detect()
+        result = self.service.send_digests()
+        self.assertEqual(result, {'alerts': 2, 'recipients': 1})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.service.send_digests()['alerts'], 0)
+
+
+class InventoryValuationServiceTest(TestCase):
+    def setUp(self):
+        self.source = Warehouse.objects.create(name='Accra', code='ACC', address='Accra')
+        self.destination = Warehouse.objects.create(name='Kumasi', code='KSI', address='Kumasi')
+        category = Category.objects.create(name='Condoms')
+        self.product = Product.objects.create(name='Fiesta', category=category, sku='FCS-001', cost='2.00')
+
+    def move(self, warehouse, quantity, **kwargs):
+        return StockMovement.objects.create(warehouse=warehouse, product=self.product, movement_type='in' if quantity > 0 else 'out', quantity=quantity, **kwargs)
+
+    def test_fifo_layers_and_transfer_cost(self):
+        self.move(self.source, 10)
+        self.product.cost = '3.00'
+        self.product.save()
+        self.move(self.source, 10)
+        self.move(self.source, -15)
+
+        transfer = WarehouseTransfer.objects.create(from_warehouse=self.source, to_warehouse=self.destination, product=self.product, quantity=5)
+        self.move(self.source, -5, transfer=transfer)
+        self.move(self.destination, 5, transfer=transfer)
+
+        service = InventoryValuationService(method='fifo')
+        cogs = service.cost_of_goods_sold(warehouse_id=self.source.id)
+        # 10 @ 2.00 + 10 @ 3.00 issued from the source warehouse
+        self.assertEqual(cogs[0]['issued_quantity'], 20)
+        self.assertEqual(cogs[0]['cost'], 50)
+        layer = CostLayer.objects.get(warehouse=self.destination, quantity_remaining__gt=0)
+        self.assertEqual(layer.unit_cost, 3)
+
+        before = list(CostLayer.objects.values_list('warehouse_id', 'unit_cost', 'quantity_remaining').order_by('id'))
+        service.recompute()
+        after = list(CostLayer.objects.values_list('warehouse_id', 'unit_cost', 'quantity_remaining').order_by('id'))
+        self.assertEqual(before, after)
+
+    def test_weighted_average(self):
+        self.move(self.source, 10)
+        self.product.cost = '4.00'
+        self.product.save()
+        self.move(self.source, 10)
+        service = InventoryValuationService(method='weighted_average')
+        service.recompute()
+        rows = service.valuation(group_by='warehouse')
+        self.assertEqual(rows[0]['quantity'], 20)
+        self.assertEqual(rows[0]['value'], 60)
+
+    def test_view_rejects_invalid_dates(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='val', password='val'))
+        self.move(self.source, 10)
+        response = client.get('/api/warehouse/valuation/', {'start_date': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/warehouse/valuation/', {'start_date': '2026-02-30'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/warehouse/valuation/', {'start_date': '2026-02-01', 'end_date': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+        today = timezone.localdate().isoformat()
+        response = client.get('/api/warehouse/valuation/', {'start_date': today, 'end_date': today})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cost_of_goods_sold'], [])
+
+
+class TransferServiceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='wm', password='wm')
+        self.source = Warehouse.objects.create(name='Accra', code='ACC', address='Accra')
+        self.destination = Warehouse.objects.create(name='Kumasi', code='KSI', address='Kumasi')
+        category = Category.objects.create(name='Condoms')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', category=category, sku=f'SKU-{i}', quantity=100, cost='1.50')
+            for i in range(3)
+        ]
+        self.service = TransferService()
+
+    def test_multi_line_partial_then_full_receipt(self):
+        transfer = self.service.create(
+            self.source, self.destination,
+            [{'product': product.id, 'quantity': 10} for product in self.products],
+            user=self.user,
+        )
+        self.assertEqual(transfer.lines.count(), 3)
+        self.assertEqual(self.service.approve_many([transfer.id], self.user), 1)
+
+        first = transfer.lines.first()
+        transfer = self.service.receive(transfer.id, self.user, quantities={first.id: 4})
+        self.assertEqual(transfer.status, 'partially_received')
+        self.assertEqual(transfer.actual_quantity_sent, 30)
+        self.assertEqual(StockMovement.objects.filter(transfer=transfer, quantity__lt=0).count(), 3)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].quantity, 94)
+
+        with self.assertRaises(ValueError):
+            self.service.receive(transfer.id, self.user, quantities={first.id: 7})
+
+        transfer = self.service.receive(transfer.id, self.user)
+        self.assertEqual(transfer.status, 'completed')
+        self.assertEqual(transfer.actual_quantity_received, 30)
+        self.assertEqual(CostLayer.objects.filter(warehouse=self.destination).count(), 4)
+
+    def test_costing_queries_do_not_grow_with_lines(self):
+        category = Category.objects.create(name='Lubricants')
+        products = self.products + [
+            Product.objects.create(name=f'Extra {i}', category=category, sku=f'EXT-{i}', quantity=100, cost='1.50')
+            for i in range(6)
+        ]
+        for index, product in enumerate(products):
+            StockMovement.objects.create(warehouse=self.source, product=product, movement_type='in', quantity=50, unit_cost=2 + index)
+
+        queries = []
+        for lines in (products[:2], products):
+            transfer = self.service.create(
+                self.source, self.destination, [{'product': product.id, 'quantity': 5} for product in lines], user=self.user,
+            )
+            self.service.approve_many([transfer.id], self.user)
+            with CaptureQueriesContext(connection) as captured:
+                self.service.receive(transfer.id, self.user)
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+
+        # Receipts carry the cost issued at the source
+        for index, product in enumerate(products):
+            costs = set(CostLayer.objects.filter(warehouse=self.destination, product=product).values_list('unit_cost', flat=True))
+            self.assertEqual(costs, {2 + index})
+        self.assertEqual(CostLayer.objects.get(warehouse=self.source, product=products[0]).quantity_remaining, 40)
+
+
+class StockMovementArchiveServiceTest(TestCase):
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name='Accra', code='ACC', address='Accra')
+        category = Category.objects.create(name='Condoms')
+        self.product = Product.objects.create(name='Fiesta', category=category, sku='FCS-001', cost='2.00')
+
+    def move(self, quantity, months_ago):
+        movement = StockMovement.objects.create(warehouse=self.warehouse, product=self.product, movement_type='in' if quantity > 0 else 'out', quantity=quantity)
+        StockMovement.objects.filter(id=movement.id).update(created_at=timezone.now() - timedelta(days=31 * months_ago))
+
+    def test_archive_keeps_stock_and_open_layers(self):
+        self.move(30, months_ago=15)
+        self.move(-10, months_ago=14)
+        self.move(5, months_ago=1)
+
+        stats = StockMovementArchiveService().archive(keep_months=12)
+        self.assertEqual(stats['movements'], 2)
+        self.assertEqual(StockMovement.objects.filter(movement_type='balance').get().quantity, 20)
+        self.assertEqual(StockMovement.objects.aggregate(total=Sum('quantity'))['total'], 25)
+        self.assertEqual(StockMovementSummary.objects.get(movement_type='out').cost, 20)
+
+        rows = InventoryValuationService(method='fifo').valuation()
+        self.assertEqual(rows[0]['value'], 50)
+        self.assertFalse(CostLayer.objects.filter(quantity_remaining__gt=0, movement__isnull=True).exists())
+
+
+class WarehouseStatsServiceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.accra = Warehouse.objects.create(name='Accra', code='ACC', address='Accra')
+        self.kumasi = Warehouse.objects.create(name='Kumasi', code='KSI', address='Kumasi')
+        Warehouse.objects.create(name='Tamale', code='TML', address='Tamale', is_active=False)
+        WarehouseLocation.objects.create(warehouse=self.accra, name='A1', code='A1')
+        WarehouseLocation.objects.create(warehouse=self.accra, name='A2', code='A2', is_active=False)
+        category = Category.objects.create(name='Condoms')
+        self.product = Product.objects.create(name='Fiesta', category=category, sku='FCS-001', cost='2.00')
+        self.move(self.accra, 30)
+        self.move(self.accra, -10)
+        old = self.move(self.kumasi, 5)
+        StockMovement.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=30))
+        WarehouseTransfer.objects.create(transfer_number='TRF-1', from_warehouse=self.accra, to_warehouse=self.kumasi)
+        WarehouseTransfer.objects.create(transfer_number='TRF-2', from_warehouse=self.accra, to_warehouse=self.kumasi, status='completed')
+
+    def move(self, warehouse, quantity):
+        return StockMovement.objects.create(warehouse=warehouse, product=self.product, movement_type='in' if quantity > 0 else 'out', quantity=quantity)
+
+    def test_grouped_payload_and_cache(self):
+        service = WarehouseStatsService()
+        with self.assertNumQueries(6):
+            stats = service.build()
+        self.assertEqual((stats['total_warehouses'], stats['total_locations'], stats['total_movements']), (2, 1, 3))
+        self.assertEqual(stats['total_stock_value'], 50)
+        self.assertEqual((stats['pending_transfers'], stats['completed_transfers'], stats['in_transit_transfers']), (1, 1, 0))
+        self.assertEqual(stats['movement_stats'][0], {'movement_type': 'in', 'count': 2})
+        accra, kumasi, tamale = stats['warehouses']
+        self.assertEqual(
+            (accra['location_count'], accra['on_hand'], accra['inbound_last_7_days'], accra['outbound_last_7_days']),
+            (1, 20, 30, 10),
+        )
+        self.assertEqual((kumasi['on_hand'], kumasi['inbound_last_7_days'], kumasi['stock_value']), (5, 0, 10))
+        self.assertEqual((tamale['movement_count'], tamale['on_hand'], tamale['stock_value']), (0, 0, 0))
+        self.assertEqual(len(stats['recent_activity']), 3)
+
+        service.get()
+        with self.assertNumQueries(0):
+            service.get()
+
+    def test_committed_writes_invalidate_the_payload(self):
+        service = WarehouseStatsService()
+        self.assertEqual(service.get()['total_movements'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.move(self.kumasi, 4)
+        self.assertEqual(service.get()['total_movements'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WarehouseTransfer.objects.filter(transfer_number='TRF-1').get().delete()
+        self.assertEqual(service.get()['pending_transfers'], 0)
+
+        with self.captureOnCommitCallbacks(execute=False):
+            WarehouseLocation.objects.create(warehouse=self.kumasi, name='K1', code='K1')
+        self.assertEqual(service.get()['total_locations'], 1)
+
+
+class StockMovementListTest(TestCase):
+    def setUp(self):
+        warehouse = Warehouse.objects.create(name='Accra', code='ACC', address='Accra')
+        product = Product.objects.create(name='Fiesta', category=Category.objects.create(name='Condoms'), sku='FCS-001')
+        self.old, self.new = (
+            StockMovement.objects.create(warehouse=warehouse, product=product, movement_type='in', quantity=quantity)
+            for quantity in (1, 2)
+        )
+        StockMovement.objects.filter(id=self.old.id).update(created_at=timezone.now() - timedelta(days=200))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='clerk', password='clerk'))
+
+    def ids(self, **params):
+        response = self.client.get('/api/warehouse/movements/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()]
+
+    def test_date_window_is_opt_in(self):
+        self.assertEqual(self.ids(), [self.new.id, self.old.id])
+        self.assertEqual(self.ids(recent=1), [self.new.id])
+        start = (timezone.localdate() - timedelta(days=201)).isoformat()
+        end = (timezone.localdate() - timedelta(days=199)).isoformat()
+        self.assertEqual(self.ids(start_date=start, end_date=end), [self.old.id])
+        self.assertEqual(self.ids(end_date=end), [self.old.id])
+
+    def test_invalid_dates_are_rejected(self):
+        for value in ('2024-02-30', 'yesterday'):
+            response = self.client.get('/api/warehouse/movements/', {'start_date': value})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'start_date must be a date (YYYY-MM-DD)'})
+
+
+class PickListServiceTest(TestCase):
+    def test_serpentine_route_and_merged_picks(self):
+        user = User.objects.create_user(username='wm', password='wm')
+        source = Warehouse.objects.create(name='Accra', code='ACC', address='Accra')
+        destination = Warehouse.objects.create(name='Kumasi', code='KSI', address='Kumasi')
+        category = Category.objects.create(name='Condoms')
+        slots = [('A1', '1'), ('A1', '3'), ('A2', '1'), ('A2', '2'), ('A10', '1')]
+        products = []
+        for index, (aisle, shelf) in enumerate(slots):
+            product = Product.objects.create(name=f'Product {index}', category=category, sku=f'SKU-{index}', quantity=50)
+            location = WarehouseLocation.objects.create(warehouse=source, name=f'{aisle}-{shelf}', code=f'{aisle}-{shelf}', aisle=aisle, shelf=shelf)
+            StockMovement.objects.create(warehouse=source, location=location, product=product, movement_type='in', quantity=50)
+            products.append(product)
+
+        service = TransferService()
+        first = service.create(source, destination, [{'product': p.id, 'quantity': 1} for p in products[::-1]], user=user)
+        second = service.create(source, destination, [{'product': products[0].id, 'quantity': 2}], user=user)
+
+        result = PickListService().build(transfer_ids=[first.id, second.id])
+        stops = result['waves'][0]['stops']
+        # A1 up, A2 down, A10 up
+        self.assertEqual([stop['location']['code'] for stop in stops], ['A1-1', 'A1-3', 'A2-2', 'A2-1', 'A10-1'])
+        self.assertEqual(stops[0]['quantity'], 3)
+        self.assertEqual(len(stops[0]['allocations']), 2)
+
+    def test_view_validates_parameters(self):
+        user = User.objects.create_user(username='picker', password='picker')
+        client = APIClient()
+        client.force_authenticate(user)
+        source = Warehouse.objects.create(name='Accra', code='ACC', address='Accra')
+        destination = Warehouse.objects.create(name='Kumasi', code='KSI', address='Kumasi')
+        product = Product.objects.create(name='Fiesta', category=Category.objects.create(name='Condoms'), sku='FCS-001', quantity=5)
+        transfer = TransferService().create(source, destination, [{'product': product.id, 'quantity': 1}], user=user)
+
+        url = '/api/warehouse/pick-lists/'
+        self.assertEqual(client.post(url, {'transfers': ['x']}, format='json').status_code, 400)
+        self.assertEqual(client.post(url, {'sales_orders': [1], 'warehouse': 'main'}, format='json').status_code, 400)
+        self.assertEqual(client.post(url, {'sales_orders': [1], 'warehouse': 999}, format='json').status_code, 404)
+        response = client.post(url, {'transfers': [transfer.id], 'format': 'pdf'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+
+class ReplenishmentPlannerTest(TestCase):
+    def test_plan_moves_surplus_to_warehouses_below_reorder_point(self):
+        warehouses = [Warehouse.objects.create(name=name, code=name[:3].upper(), address=name) for name in ('Accra', 'Kumasi', 'Tamale')]
+        category = Category.objects.create(name='Condoms')
+        product = Product.objects.create(name='Fiesta', category=category, sku='FCS-001', min_stock=20, max_stock=40, quantity=500)
+        for warehouse, quantity in zip(warehouses, (100, 5, 0)):
+            StockMovement.objects.create(warehouse=warehouse, product=product, movement_type='in', quantity=quantity)
+        StockMovement.objects.create(warehouse=warehouses[2], product=product, movement_type='out', quantity=0)
+
+        plan = ReplenishmentPlanner(lead_days=0, cover_days=0).plan()
+        moves = {(t['from_warehouse'], t['to_warehouse']): t['lines'][0]['quantity'] for t in plan['transfers']}
+        # No demand history, so every target is min_stock; Accra has 80 to spare
+        self.assertEqual(moves, {(warehouses[0].id, warehouses[1].id): 15, (warehouses[0].id, warehouses[2].id): 20})
+        self.assertEqual(plan['unmet_quantity'], 0)
+
+    def test_open_transfers_are_netted_out_of_the_next_plan(self):
+        warehouses = [Warehouse.objects.create(name=name, code=name[:3].upper(), address=name) for name in ('Accra', 'Kumasi', 'Tamale')]
+        category = Category.objects.create(name='Condoms')
+        product = Product.objects.create(name='Fiesta', category=category, sku='FCS-001', min_stock=20, max_stock=40, quantity=500)
+        for warehouse, quantity in zip(warehouses, (100, 5, 0)):
+            StockMovement.objects.create(warehouse=warehouse, product=product, movement_type='in', quantity=quantity)
+        StockMovement.objects.create(warehouse=warehouses[2], product=product, movement_type='out', quantity=0)
+        user = User.objects.create_user(username='planner', password='planner', email='planner@example.com', role='manager')
+        planner = ReplenishmentPlanner(lead_days=0, cover_days=0)
+
+        created, errors = planner.create_transfers(planner.plan(), user=user)
+        self.assertEqual((len(created), errors), (2, []))
+        # Pending: Accra's stock is committed and the destinations expect it
+        self.assertEqual(planner.plan()['transfer_count'], 0)
+
+        kumasi = next(transfer for transfer in created if transfer.to_warehouse_id == warehouses[1].id)
+        kumasi.status = 'approved'
+        kumasi.save(update_fields=['status'])
+        TransferService().dispatch(kumasi.id, user)
+        # In transit: the stock has left Accra but not yet reached Kumasi
+        self.assertEqual(planner.plan()['transfer_count'], 0)
@@ -2,8 +2,10 @@ from django.urls import path
 from .views import (
     WarehouseListCreateView, WarehouseDetailView, WarehouseLocationListCreateView,
     WarehouseTransferListCreateView, WarehouseTransferDetailView,
-    StockMovementListCreateView, warehouse_stats, create_warehouse, add_location,
-    create_transfer_request, approve_transfer, reject_transfer, complete_transfer, generate_waybill
+    StockMovementListCreateView, StockMovementSummaryListView, LowStockAlertListView, warehouse_stats, inventory_valuation, create_warehouse, add_location,
+    create_transfer_request, approve_transfer, reject_transfer, complete_transfer, generate_waybill,
+    dispatch_transfer, bulk_approve_transfers, bulk_complete_transfers, generate_pick_list,
+    replenishment_plan
 )
 
 urlpatterns = [
@@ -16,9 +18,17 @@ urlpatterns = [
     path('transfers/create/', create_transfer_request, name='create-transfer-request'),
     path('transfers/<int:transfer_id>/approve/', approve_transfer, name='approve-transfer'),
     path('transfers/<int:transfer_id>/reject/', reject_transfer, name='reject-transfer'),
+    path('transfers/<int:transfer_id>/dispatch/', dispatch_transfer, name='dispatch-transfer'),
     path('transfers/<int:transfer_id>/complete/', complete_transfer, name='complete-transfer'),
+    path('transfers/bulk-approve/', bulk_approve_transfers, name='bulk-approve-transfers'),
+    path('transfers/bulk-complete/', bulk_complete_transfers, name='bulk-complete-transfers'),
     path('transfers/<int:transfer_id>/waybill/', generate_waybill, name='generate-waybill'),
     path('movements/', StockMovementListCreateView.as_view(), name='stock-movement-list-create'),
+    path('movements/summary/', StockMovementSummaryListView.as_view(), name='stock-movement-summary-list'),
+    path('pick-lists/', generate_pick_list, name='generate-pick-list'),
+    path('replenishment/plan/', replenishment_plan, name='replenishment-plan'),
+    path('low-stock/', LowStockAlertListView.as_view(), name='low-stock-alert-list'),
+    path('valuation/', inventory_valuation, name='inventory-valuation'),
     path('stats/', warehouse_stats, name='warehouse-stats'),
     path('create/', create_warehouse, name='create-warehouse'),
 ]
@@ -1,12 +1,28 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Count, Sum, Q
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from .models import Warehouse, WarehouseLocation, StockMovement, WarehouseTransfer
-from .serializers import WarehouseSerializer, WarehouseLocationSerializer, StockMovementSerializer, WarehouseTransferSerializer
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+import io
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from django.http import HttpResponse
+from .models import (
+    Warehouse, WarehouseLocation, StockMovement, StockMovementSummary, WarehouseTransfer, WarehouseTransferLine,
+    LowStockAlert
+)
+from .serializers import (
+    WarehouseSerializer, WarehouseLocationSerializer, StockMovementSerializer, WarehouseTransferSerializer,
+    LowStockAlertSerializer, StockMovementSummarySerializer
+)
 from utils.email_service import email_service
+from .services import (
+    InventoryValuationService, ReplenishmentPlanner, pick_list_service, transfer_service, warehouse_stats_service
+)
 from inventory.models import Product
 
 User = get_user_model()
@@ -40,7 +56,9 @@ class WarehouseTransferListCreateView(generics.ListCreateAPIView):
         warehouse_id = self.request.query_params.get('warehouse')
         status_filter = self.request.query_params.get('status')
         
-        queryset = WarehouseTransfer.objects.all()
+        queryset = WarehouseTransfer.objects.select_related(
+            'from_warehouse', 'to_warehouse', 'product', 'requested_by', 'approved_by', 'completed_by'
+        ).prefetch_related('lines__product')
         
         # Filter by warehouse if specified
         if warehouse_id:
@@ -61,72 +79,121 @@ class WarehouseTransferDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 class StockMovementListCreateView(generics.ListCreateAPIView):
+    """
+    Stock movements, optionally within a date range (``start_date``/
+    ``end_date``, or ``recent=1`` for the last DEFAULT_DAYS days). The
+    bounds on created_at let PostgreSQL prune to the matching monthly
+    partitions.
+    """
     serializer_class = StockMovementSerializer
     permission_classes = [permissions.IsAuthenticated]
-    
+    DEFAULT_DAYS = 90
+
+    def get_queryset(self):
+        warehouse_id = self.request.query_params.get('warehouse')
+        dates = {}
+        for name in ('start_date', 'end_date'):
+            value = self.request.query_params.get(name)
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                dates[name] = None
+            if value and dates[name] is None:
+                raise ValidationError({'error': f'{name} must be a date (YYYY-MM-DD)'})
+        start_date, end_date = dates['start_date'], dates['end_date']
+
+        queryset = StockMovement.objects.select_related('warehouse', 'location', 'created_by')
+        # Compare the raw column (not created_at__date) so partitions and indexes can be used
+        if start_date:
+            queryset = queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(start_date, time.min)))
+        elif not end_date and self.request.query_params.get('recent') in ('1', 'true'):
+            queryset = queryset.filter(created_at__gte=timezone.now() - timedelta(days=self.DEFAULT_DAYS))
+        if end_date:
+            queryset = queryset.filter(
+                created_at__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+            )
+        if warehouse_id:
+            queryset = queryset.filter(warehouse_id=warehouse_id)
+        return queryset.order_by('-created_at', '-id')
+
+class StockMovementSummaryListView(generics.ListAPIView):
+    """Monthly roll-ups of archived stock movements"""
+    serializer_class = StockMovementSummarySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = StockMovementSummary.objects.select_related('warehouse', 'product')
+        warehouse_id = self.request.query_params.get('warehouse')
+        product_id = self.request.query_params.get('product')
+        if warehouse_id:
+            queryset = queryset.filter(warehouse_id=warehouse_id)
+        if product_id:
+            queryset = queryset.filter(product_id=product_id)
+        return queryset
+
+class LowStockAlertListView(generics.ListAPIView):
+    serializer_class = LowStockAlertSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
     def get_queryset(self):
         warehouse_id = self.request.query_params.get('warehouse')
+        status_filter = self.request.query_params.get('status', 'open')
+
+        queryset = LowStockAlert.objects.select_related('warehouse', 'product')
         if warehouse_id:
-            return StockMovement.objects.filter(warehouse_id=warehouse_id)
-        return StockMovement.objects.all().order_by('-created_at')
+            queryset = queryset.filter(warehouse_id=warehouse_id)
+        if status_filter != 'all':
+            queryset = queryset.filter(status=status_filter)
+        return queryset.order_by('warehouse__name', 'product__name')
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def create_transfer_request(request):
-    """Create a new warehouse transfer request"""
+    """
+    Create a new warehouse transfer request. Send ``lines`` as a list of
+    {product, quantity, notes} for a multi-product transfer, or a single
+    ``product``/``quantity`` pair.
+    """
     try:
         data = request.data
         
         # Validate required fields
-        required_fields = ['from_warehouse', 'to_warehouse', 'product', 'quantity']
+        required_fields = ['from_warehouse', 'to_warehouse']
+        if not data.get('lines'):
+            required_fields += ['product', 'quantity']
         for field in required_fields:
             if not data.get(field):
                 return Response({
                     'error': f'{field} is required'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Check if source warehouse has sufficient stock
-        product = Product.objects.get(id=data['product'])
-        if product.quantity < int(data['quantity']):
-            return Response({
-                'error': f'Insufficient stock. Available: {product.quantity}, Requested: {data["quantity"]}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Create transfer request
-        transfer_data = {
-            'from_warehouse': data['from_warehouse'],
-            'to_warehouse': data['to_warehouse'],
-            'product': data['product'],
-            'quantity': data['quantity'],
-            'priority': data.get('priority', 'medium'),
-            'request_notes': data.get('request_notes', ''),
-            'expected_delivery_date': data.get('expected_delivery_date'),
-        }
+        lines = data.get('lines') or [{'product': data['product'], 'quantity': data['quantity']}]
+        from_warehouse = Warehouse.objects.get(id=data['from_warehouse'])
+        to_warehouse = Warehouse.objects.get(id=data['to_warehouse'])
         
-        serializer = WarehouseTransferSerializer(data=transfer_data, context={'request': request})
-        if serializer.is_valid():
-            transfer = serializer.save()
-            
-            # Send notification to destination warehouse manager
-            try:
-                to_warehouse = Warehouse.objects.get(id=data['to_warehouse'])
-                if to_warehouse.manager and to_warehouse.manager.email:
-                    # Send email notification (implement email service)
-                    pass
-            except Warehouse.DoesNotExist:
-                pass
-            
-            return Response({
-                'message': 'Transfer request created successfully',
-                'transfer': WarehouseTransferSerializer(transfer).data
-            }, status=status.HTTP_201_CREATED)
+        transfer = transfer_service.create(
+            from_warehouse,
+            to_warehouse,
+            lines,
+            user=request.user,
+            priority=data.get('priority', 'medium'),
+            request_notes=data.get('request_notes', ''),
+            expected_delivery_date=data.get('expected_delivery_date') or None,
+        )
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'message': 'Transfer request created successfully',
+            'transfer': WarehouseTransferSerializer(transfer).data
+        }, status=status.HTTP_201_CREATED)
         
-    except Product.DoesNotExist:
+    except Warehouse.DoesNotExist:
         return Response({
-            'error': 'Product not found'
+            'error': 'Warehouse not found'
         }, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'error': f'Failed to create transfer request: {str(e)}'
@@ -193,71 +260,73 @@ def reject_transfer(request, transfer_id):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
-def complete_transfer(request, transfer_id):
-    """Complete a warehouse transfer and update stock levels"""
+def bulk_approve_transfers(request):
+    """Approve several pending transfers at once"""
+    transfer_ids = request.data.get('transfer_ids') or []
+    if not isinstance(transfer_ids, list) or not transfer_ids:
+        return Response({
+            'error': 'transfer_ids must be a non-empty list'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    approved = transfer_service.approve_many(transfer_ids, request.user, notes=request.data.get('approval_notes', ''))
+    return Response({
+        'message': f'{approved} transfers approved',
+        'approved': approved
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def dispatch_transfer(request, transfer_id):
+    """Ship every unsent line of an approved transfer"""
     try:
-        transfer = WarehouseTransfer.objects.get(id=transfer_id)
-        
-        if transfer.status != 'approved':
-            return Response({
-                'error': f'Transfer must be approved first. Current status: {transfer.status}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        actual_quantity = int(request.data.get('actual_quantity_received', transfer.quantity))
-        
-        # Update product stock levels
-        product = transfer.product
+        transfer = transfer_service.dispatch(transfer_id, request.user)
+        return Response({
+            'message': 'Transfer dispatched',
+            'transfer': WarehouseTransferSerializer(transfer).data
+        }, status=status.HTTP_200_OK)
         
-        # Deduct from source warehouse (if not already done)
-        if transfer.actual_quantity_sent is None:
-            if product.quantity < transfer.quantity:
+    except WarehouseTransfer.DoesNotExist:
+        return Response({
+            'error': 'Transfer not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def complete_transfer(request, transfer_id):
+    """
+    Receive a transfer and update stock levels. ``lines`` lists
+    {line, quantity_received} for a partial receipt; without it everything
+    outstanding is received. ``close`` completes the transfer even if short.
+    """
+    try:
+        quantities = None
+        if request.data.get('lines'):
+            quantities = {
+                int(line['line']): int(line['quantity_received']) for line in request.data['lines']
+            }
+        elif request.data.get('actual_quantity_received') not in (None, ''):
+            # Single-product form: applies to the transfer's only line
+            line_ids = list(WarehouseTransferLine.objects.filter(transfer_id=transfer_id).values_list('id', flat=True))
+            if len(line_ids) != 1:
                 return Response({
-                    'error': f'Insufficient stock to complete transfer. Available: {product.quantity}'
+                    'error': 'actual_quantity_received only applies to single-line transfers; send lines instead'
                 }, status=status.HTTP_400_BAD_REQUEST)
-            
-            product.quantity -= transfer.quantity
-            product.save()
-            
-            # Create outgoing stock movement
-            StockMovement.objects.create(
-                warehouse=transfer.from_warehouse,
-                product=product,
-                transfer=transfer,
-                movement_type='out',
-                quantity=-transfer.quantity,
-                reference=f'Transfer out to {transfer.to_warehouse.name}',
-                notes=f'Transfer {transfer.transfer_number}',
-                created_by=request.user
-            )
-            
-            transfer.actual_quantity_sent = transfer.quantity
+            quantities = {line_ids[0]: int(request.data['actual_quantity_received'])}
         
-        # Add to destination warehouse
-        product.quantity += actual_quantity
-        product.save()
-        
-        # Create incoming stock movement
-        StockMovement.objects.create(
-            warehouse=transfer.to_warehouse,
-            product=product,
-            transfer=transfer,
-            movement_type='in',
-            quantity=actual_quantity,
-            reference=f'Transfer in from {transfer.from_warehouse.name}',
-            notes=f'Transfer {transfer.transfer_number}',
-            created_by=request.user
+        transfer = transfer_service.receive(
+            transfer_id,
+            request.user,
+            quantities=quantities,
+            close=str(request.data.get('close', '')).lower() in ('1', 'true', 'yes'),
+            tracking_notes=request.data.get('tracking_notes', ''),
         )
         
-        # Update transfer completion details
-        transfer.status = 'completed'
-        transfer.completed_by = request.user
-        transfer.completion_date = timezone.now()
-        transfer.actual_quantity_received = actual_quantity
-        transfer.tracking_notes = request.data.get('tracking_notes', '')
-        transfer.save()
-        
         return Response({
-            'message': 'Transfer completed successfully',
+            'message': 'Transfer completed successfully' if transfer.status == 'completed' else 'Transfer partially received',
             'transfer': WarehouseTransferSerializer(transfer).data
         }, status=status.HTTP_200_OK)
         
@@ -265,11 +334,41 @@ def complete_transfer(request, transfer_id):
         return Response({
             'error': 'Transfer not found'
         }, status=status.HTTP_404_NOT_FOUND)
+    except (KeyError, TypeError, ValueError) as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'error': f'Failed to complete transfer: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_complete_transfers(request):
+    """Dispatch and fully receive several approved transfers in one transaction"""
+    transfer_ids = request.data.get('transfer_ids') or []
+    if not isinstance(transfer_ids, list) or not transfer_ids:
+        return Response({
+            'error': 'transfer_ids must be a non-empty list'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        transfers = transfer_service.complete_many(transfer_ids, request.user)
+    except WarehouseTransfer.DoesNotExist:
+        return Response({
+            'error': 'Transfer not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': f'{len(transfers)} transfers completed',
+        'transfers': [transfer.transfer_number for transfer in transfers]
+    }, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def generate_waybill(request, transfer_id):
@@ -294,7 +393,17 @@ def generate_waybill(request, transfer_id):
                 'name': transfer.product.name,
                 'sku': transfer.product.sku,
                 'quantity': transfer.quantity
-            },
+            } if transfer.product else None,
+            'lines': [
+                {
+                    'name': line.product.name,
+                    'sku': line.product.sku,
+                    'quantity': line.quantity,
+                    'quantity_sent': line.quantity_sent,
+                    'quantity_received': line.quantity_received,
+                }
+                for line in transfer.lines.select_related('product')
+            ],
             'dates': {
                 'request_date': transfer.request_date,
                 'approval_date': transfer.approval_date,
@@ -312,36 +421,164 @@ def generate_waybill(request, transfer_id):
             'error': 'Transfer not found'
         }, status=status.HTTP_404_NOT_FOUND)
 
-@api_view(['GET'])
+@api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
-def warehouse_stats(request):
-    """Get warehouse statistics for dashboard"""
-    total_warehouses = Warehouse.objects.filter(is_active=True).count()
-    total_locations = WarehouseLocation.objects.filter(is_active=True).count()
-    total_movements = StockMovement.objects.count()
+def generate_pick_list(request):
+    """
+    Build wave pick lists for ``sales_orders`` and/or ``transfers`` (lists of
+    ids). Optional: ``warehouse`` to pick all sales orders from, ``max_orders``
+    and ``max_lines`` per wave, ``format=pdf`` for a printable list.
+    """
+    order_ids = request.data.get('sales_orders') or []
+    transfer_ids = request.data.get('transfers') or []
+    if not isinstance(order_ids, list) or not isinstance(transfer_ids, list) or not (order_ids or transfer_ids):
+        return Response({
+            'error': 'sales_orders or transfers must be a non-empty list of ids'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Transfer statistics
-    pending_transfers = WarehouseTransfer.objects.filter(status='pending').count()
-    approved_transfers = WarehouseTransfer.objects.filter(status='approved').count()
-    completed_transfers = WarehouseTransfer.objects.filter(status='completed').count()
+    try:
+        order_ids = [int(order_id) for order_id in order_ids]
+        transfer_ids = [int(transfer_id) for transfer_id in transfer_ids]
+    except (TypeError, ValueError):
+        return Response({
+            'error': 'sales_orders and transfers must contain numeric ids'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Recent movements by type
-    movement_stats = StockMovement.objects.values('movement_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    try:
+        max_orders = int(request.data.get('max_orders', 10))
+        max_lines = int(request.data.get('max_lines', 500))
+    except (TypeError, ValueError):
+        return Response({
+            'error': 'max_orders and max_lines must be numbers'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    return Response({
-        'total_warehouses': total_warehouses,
-        'total_locations': total_locations,
-        'total_movements': total_movements,
-        'pending_transfers': pending_transfers,
-        'approved_transfers': approved_transfers,
-        'completed_transfers': completed_transfers,
-        'movement_stats': list(movement_stats),
-        'recent_activity': StockMovement.objects.select_related('warehouse', 'created_by').order_by('-created_at')[:10].values(
-            'id', 'warehouse__name', 'movement_type', 'quantity', 'reference', 'created_at', 'created_by__username'
+    warehouse_id = request.data.get('warehouse') or None
+    if warehouse_id is not None:
+        try:
+            warehouse_id = int(warehouse_id)
+        except (TypeError, ValueError):
+            return Response({'error': 'warehouse must be a numeric id'}, status=status.HTTP_400_BAD_REQUEST)
+        if not Warehouse.objects.filter(id=warehouse_id).exists():
+            return Response({'error': 'Warehouse not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    pick_list = pick_list_service.build(
+        order_ids=order_ids,
+        transfer_ids=transfer_ids,
+        warehouse_id=warehouse_id,
+        max_orders=max(max_orders, 1),
+        max_lines=max(max_lines, 1),
+    )
+    
+    if request.data.get('format') != 'pdf':
+        return Response(pick_list, status=status.HTTP_200_OK)
+    
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    for wave in pick_list['waves']:
+        y = 750
+        p.setFont('Helvetica-Bold', 16)
+        p.drawString(30, y, f"PICK LIST - WAVE {wave['wave']} - {wave['warehouse']['name']}")
+        y -= 20
+        p.setFont('Helvetica', 9)
+        p.drawString(30, y, f"Documents: {', '.join(wave['documents'])}"[:150])
+        y -= 25
+        for stop in wave['stops']:
+            if y < 50:
+                p.showPage()
+                p.setFont('Helvetica', 9)
+                y = 750
+            location = stop['location']['code'] if stop['location'] else 'UNLOCATED'
+            allocations = ', '.join(f"{a['document']} x{a['quantity']}" for a in stop['allocations'])
+            p.drawString(30, y, f"{stop['sequence']:>3}. [ ] {location:<14} {(stop['sku'] or ''):<16} {(stop['name'] or '')[:30]:<30} {stop['quantity']:>6}")
+            y -= 12
+            p.drawString(70, y, allocations[:110])
+            y -= 14
+        p.showPage()
+    p.save()
+    buffer.seek(0)
+    response = HttpResponse(buffer, content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="pick_list.pdf"'
+    return response
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def replenishment_plan(request):
+    """
+    Propose transfers that rebalance stock between warehouses. GET returns
+    the plan; POST also creates the suggested transfers as pending requests.
+    Optional: ``velocity_days``, ``lead_days``, ``cover_days``, ``warehouse``.
+    """
+    params = request.query_params if request.method == 'GET' else request.data
+    try:
+        planner = ReplenishmentPlanner(
+            velocity_days=max(int(params.get('velocity_days', 30)), 1),
+            lead_days=max(int(params.get('lead_days', 7)), 0),
+            cover_days=max(int(params.get('cover_days', 30)), 0),
+        )
+    except (TypeError, ValueError):
+        return Response({
+            'error': 'velocity_days, lead_days and cover_days must be numbers'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    warehouse_ids = params.getlist('warehouse') if hasattr(params, 'getlist') else params.get('warehouse')
+    if warehouse_ids and not isinstance(warehouse_ids, list):
+        warehouse_ids = [warehouse_ids]
+    plan = planner.plan(warehouse_ids=warehouse_ids or None)
+    
+    if request.method == 'POST':
+        created, errors = planner.create_transfers(plan, user=request.user)
+        plan['created_transfers'] = [transfer.transfer_number for transfer in created]
+        plan['errors'] = errors
+        return Response(plan, status=status.HTTP_201_CREATED)
+    return Response(plan, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def warehouse_stats(request):
+    """Get warehouse statistics for dashboard"""
+    return Response(warehouse_stats_service.get())
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def inventory_valuation(request):
+    """Inventory value from cost layers, plus COGS when a date range is given"""
+    group_by = request.query_params.get('group_by', 'warehouse')
+    warehouse_id = request.query_params.get('warehouse')
+    category_id = request.query_params.get('category')
+    dates = {}
+    for name in ('start_date', 'end_date'):
+        value = request.query_params.get(name)
+        try:
+            dates[name] = parse_date(value) if value else None
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            return Response({'error': f'{name} must be a date (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+    start_date, end_date = dates['start_date'], dates['end_date']
+    if start_date and end_date and start_date > end_date:
+        return Response({'error': 'start_date must not be after end_date'}, status=status.HTTP_400_BAD_REQUEST)
+
+    service = InventoryValuationService()
+    try:
+        rows = service.valuation(group_by=group_by, warehouse_id=warehouse_id, category_id=category_id)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = {
+        'costing_method': service.method,
+        'group_by': group_by,
+        'total_quantity': sum(row['quantity'] for row in rows),
+        'total_value': sum(row['value'] for row in rows),
+        'valuation': rows,
+    }
+    if start_date or end_date:
+        # Whole days: from the start of start_date up to the end of end_date
+        data['cost_of_goods_sold'] = service.cost_of_goods_sold(
+            start=timezone.make_aware(datetime.combine(start_date, time.min)) if start_date else None,
+            end=timezone.make_aware(datetime.combine(end_date, time.max)) if end_date else None,
+            warehouse_id=warehouse_id,
         )
-    })
+    return Response(data)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
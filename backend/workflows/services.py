@@ -10,6 +10,7 @@ from .models import (
     WorkflowApproval, WorkflowNotification, WorkflowAuditLog
 )
 from .notification_service import workflow_notification_service
+from transactions.audit import audit_log
 
 User = get_user_model()
 
@@ -62,12 +63,12 @@ class WorkflowService:
                 self._assign_step_approvers(instance, first_step)
             
             # Log workflow initiation
-            WorkflowAuditLog.objects.create(
+            audit_log.add(WorkflowAuditLog(
                 workflow_instance=instance,
                 user=requester,
                 action='initiated',
                 details={'template': template.name, 'instance_id': instance_id}
-            )
+            ))
             
             # Send workflow initiated notifications
             workflow_notification_service.send_stage_notifications(
@@ -143,7 +144,7 @@ class WorkflowService:
             approval.save()
             
             # Log the action
-            WorkflowAuditLog.objects.create(
+            audit_log.add(WorkflowAuditLog(
                 workflow_instance=instance,
                 user=approver,
                 action=action,
@@ -153,7 +154,7 @@ class WorkflowService:
                     'delegated_to': delegated_to_id if action == 'delegated' else None
                 },
                 ip_address=ip_address
-            )
+            ))
             
             # Process workflow based on action
             if action == 'rejected':
@@ -375,50 +376,52 @@ class WorkflowService:
             due_date__lt=timezone.now()
         )
         
-        for approval in overdue_approvals:
-            escalation_target = self._find_escalation_target(approval.approver)
-            if escalation_target:
-                # Create new approval for escalation target
-                WorkflowApproval.objects.create(
-                    workflow_instance=approval.workflow_instance,
-                    step=approval.step,
-                    approver=escalation_target,
-                    action='pending',
-                    due_date=timezone.now() + timedelta(hours=24),
-                    escalated_from=approval
-                )
+        # One audit write for the whole run
+        with audit_log.batch():
+            for approval in overdue_approvals:
+                escalation_target = self._find_escalation_target(approval.approver)
+                if escalation_target:
+                    # Create new approval for escalation target
+                    WorkflowApproval.objects.create(
+                        workflow_instance=approval.workflow_instance,
+                        step=approval.step,
+                        approver=escalation_target,
+                        action='pending',
+                        due_date=timezone.now() + timedelta(hours=24),
+                        escalated_from=approval
+                    )
                 
-                # Mark as escalated
-                approval.action = 'escalated'
-                approval.action_taken_at = timezone.now()
-                approval.save()
+                    # Mark as escalated
+                    approval.action = 'escalated'
+                    approval.action_taken_at = timezone.now()
+                    approval.save()
                 
-                # Send escalation notifications
-                workflow_notification_service.send_stage_notifications(
-                    workflow_instance=approval.workflow_instance,
-                    stage='workflow_escalated',
-                    escalated_to_id=escalation_target.id,
-                    original_approver_id=approval.approver.id,
-                    additional_data={
-                        'escalated_from': approval.approver.get_full_name() or approval.approver.username,
-                        'escalated_to': escalation_target.get_full_name() or escalation_target.username,
-                        'step_name': approval.step.name,
-                        'overdue_hours': int((timezone.now() - approval.due_date).total_seconds() / 3600)
-                    }
-                )
+                    # Send escalation notifications
+                    workflow_notification_service.send_stage_notifications(
+                        workflow_instance=approval.workflow_instance,
+                        stage='workflow_escalated',
+                        escalated_to_id=escalation_target.id,
+                        original_approver_id=approval.approver.id,
+                        additional_data={
+                            'escalated_from': approval.approver.get_full_name() or approval.approver.username,
+                            'escalated_to': escalation_target.get_full_name() or escalation_target.username,
+                            'step_name': approval.step.name,
+                            'overdue_hours': int((timezone.now() - approval.due_date).total_seconds() / 3600)
+                        }
+                    )
                 
-                # Log escalation
-                WorkflowAuditLog.objects.create(
-                    workflow_instance=approval.workflow_instance,
-                    user=None,
-                    action='escalated',
-                    details={
-                        'step': approval.step.name,
-                        'original_approver': approval.approver.username,
-                        'escalated_to': escalation_target.username,
-                        'overdue_hours': int((timezone.now() - approval.due_date).total_seconds() / 3600)
-                    }
-                )
+                    # Log escalation
+                    audit_log.add(WorkflowAuditLog(
+                        workflow_instance=approval.workflow_instance,
+                        user=None,
+                        action='escalated',
+                        details={
+                            'step': approval.step.name,
+                            'original_approver': approval.approver.username,
+                            'escalated_to': escalation_target.username,
+                            'overdue_hours': int((timezone.now() - approval.due_date).total_seconds() / 3600)
+                        }
+                    ))
     
     def _get_step_approvers(self, instance, step):
         """Get list of approvers for a step based on approver type"""